@@ -0,0 +1,234 @@
+"""
+Batch Scheduler Module
+Micro-batches concurrent encode requests into single CLIP forward passes
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from inference_executor import InferenceExecutor, ServerBusyError
+
+
+class MicroBatcher:
+    """
+    Collects queued items for up to `max_batch_size` items or `max_wait_ms`
+    milliseconds, then runs one batched call and hands each result back to
+    its awaiting caller through a future.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Awaitable[np.ndarray]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_queue: int = 1024, name: str = "batcher"):
+        """
+        Initialize micro-batcher.
+
+        Args:
+            batch_fn: Coroutine function mapping a list of items to an array
+                      with one row per item. It must not block the event loop.
+            max_batch_size: Maximum number of items per batched call
+            max_wait_ms: How long to wait for more items after the first one
+            max_queue: Maximum number of waiting items before rejecting new ones
+            name: Name used in stats and log messages
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Counters
+        self.items_processed = 0
+        self.batches_run = 0
+
+    def start(self):
+        """Start the background worker on the running event loop."""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background worker and fail any still-queued requests."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} stopped"))
+
+    async def submit(self, item: Any) -> np.ndarray:
+        """
+        Queue one item and wait for its result row.
+
+        Args:
+            item: Single input accepted by batch_fn
+
+        Returns:
+            Result row for this item
+
+        Raises:
+            ServerBusyError: If too many items are already waiting
+        """
+        if self._worker is None:
+            raise RuntimeError(f"{self.name} is not running. Call start() first.")
+        if self._queue.qsize() >= self.max_queue:
+            raise ServerBusyError(f"{self.name} queue is full, try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> list:
+        """Wait for one item, then gather more until the batch is full or time runs out."""
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Worker loop: collect a batch, run it, resolve futures."""
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (e.g. client disconnected) don't need a slot
+            batch = [(item, future) for item, future in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await self.batch_fn(items)
+            except asyncio.CancelledError:
+                self._fail(batch, RuntimeError(f"{self.name} stopped"))
+                raise
+            except ServerBusyError as e:
+                self._fail(batch, e)  # Retrying item by item would only add load
+                continue
+            except Exception as e:
+                if len(batch) == 1:
+                    self._fail(batch, e)
+                else:
+                    # One bad item must not fail the whole batch
+                    await self._run_individually(batch)
+                continue
+
+            self._resolve(batch, results)
+
+    async def _run_individually(self, batch: list):
+        """Retry a failed batch one item at a time, so only the bad items fail."""
+        for i, (item, future) in enumerate(batch):
+            if future.done():
+                continue
+            try:
+                results = await self.batch_fn([item])
+            except asyncio.CancelledError:
+                self._fail(batch[i:], RuntimeError(f"{self.name} stopped"))
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            self._resolve([(item, future)], results)
+
+    def _resolve(self, batch: list, results: np.ndarray):
+        """Hand each caller its result row; fail callers batch_fn returned no row for."""
+        for row, (_, future) in zip(results, batch):
+            if not future.done():
+                future.set_result(row)
+        if len(results) < len(batch):
+            self._fail(batch[len(results):], RuntimeError(
+                f"{self.name}: got {len(results)} results for {len(batch)} items"))
+
+        self.items_processed += len(batch)
+        self.batches_run += 1
+
+    @staticmethod
+    def _fail(batch: list, error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def get_stats(self) -> dict:
+        """Return batching statistics."""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queued': self._queue.qsize() if self._queue else 0,
+            'items_processed': self.items_processed,
+            'batches_run': self.batches_run,
+            'avg_batch_size': self.items_processed / self.batches_run if self.batches_run else 0.0
+        }
+
+
+class EncoderBatchScheduler:
+    """
+    Routes text and image encode requests through separate micro-batchers
+    whose batched forward passes run on an InferenceExecutor.
+    """
+
+    def __init__(self, executor: InferenceExecutor, max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0, max_queue: int = 1024):
+        """
+        Initialize scheduler.
+
+        Args:
+            executor: InferenceExecutor that runs the forward passes
+            max_batch_size: Maximum number of items per forward pass
+            max_wait_ms: How long a request may wait for others to join its batch
+            max_queue: Maximum number of waiting items per modality
+        """
+        self.executor = executor
+        self.text_batcher = MicroBatcher(
+            executor.encode_texts, max_batch_size, max_wait_ms, max_queue, name="text"
+        )
+        self.image_batcher = MicroBatcher(
+            executor.encode_images, max_batch_size, max_wait_ms, max_queue, name="image"
+        )
+
+    def start(self):
+        """Start both batching workers."""
+        self.text_batcher.start()
+        self.image_batcher.start()
+
+    async def stop(self):
+        """Stop both batching workers."""
+        await self.text_batcher.stop()
+        await self.image_batcher.stop()
+
+    async def encode_text(self, text: str) -> np.ndarray:
+        """Encode one text query as part of the next text batch."""
+        return await self.text_batcher.submit(text)
+
+    async def encode_image(self, image: Image.Image) -> np.ndarray:
+        """Encode one PIL image as part of the next image batch."""
+        return await self.image_batcher.submit(image)
+
+    def get_stats(self) -> dict:
+        """Return batching statistics for both modalities."""
+        return {
+            'text': self.text_batcher.get_stats(),
+            'image': self.image_batcher.get_stats()
+        }
@@ -9,8 +9,19 @@ from datetime import datetime
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from clip_encoder import CLIPEncoder
+from clip_encoder import CLIPEncoder, EMBEDDING_DIMS
 from faiss_index import FAISSIndex
+from catalog_store import CatalogBuilder, product_text
+from catalog_ingest import find_catalog, iter_products
+from index_manager import generation_path, new_version, prune_generations, publish_version
+from image_store import LocalImageStore, encode_product_images, fuse_embedding_chunks
+from embedding_shards import EmbeddingShards, DEFAULT_SHARD_SIZE, generate_shards
+from embedding_store import EmbeddingStore
+from parallel_encode import encode_shards_parallel
+from sharded_index import SHARD_KEYS, build_shards
+
+# Number of products encoded per CLIP forward pass
+DEFAULT_BATCH_SIZE = 64
 
 # EXPANDED PRODUCT DATABASE - 200+ PRODUCTS
 PRODUCTS_DATABASE = [
@@ -181,8 +192,85 @@ PRODUCTS_DATABASE = [
 ]
 
 
-def build_index_with_products(use_real_data=False):
-    """Build enhanced FAISS index with more products"""
+def encode_products(encoder, products, batch_size=DEFAULT_BATCH_SIZE, store=None, out=None,
+                    show_progress=True):
+    """
+    Encode product descriptions in batches.
+    
+    Each chunk of `batch_size` products goes through a single tokenize +
+    forward pass, and the result is written straight into a preallocated
+    float32 matrix instead of being stacked from a list at the end.
+    
+    Args:
+        encoder: CLIPEncoder instance
+        products: List of product dictionaries
+        batch_size: Number of products per forward pass
+        store: Optional EmbeddingStore; only texts missing from it are encoded
+        out: Optional preallocated (num_products x embedding_dim) array to fill
+        show_progress: Show a progress bar
+        
+    Returns:
+        Array of normalized embeddings (num_products x embedding_dim)
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    
+    num_products = len(products)
+    embeddings = (out if out is not None
+                  else np.empty((num_products, encoder.get_embedding_dim()), dtype='float32'))
+    
+    with tqdm(total=num_products, desc="Encoding products", disable=not show_progress) as progress:
+        for start in range(0, num_products, batch_size):
+            batch = products[start:start + batch_size]
+            texts = [product_text(product) for product in batch]
+            if store is not None:
+                embeddings[start:start + len(batch)] = store.encode(texts, encoder.encode_texts_batch)
+            else:
+                embeddings[start:start + len(batch)] = encoder.encode_texts_batch(texts)
+            progress.update(len(batch))
+    
+    return embeddings
+
+
+def build_index_with_products(use_real_data=False, batch_size=DEFAULT_BATCH_SIZE,
+                              index_type="HNSW", rerank_factor=4, pq_m=64, metric="ip",
+                              tuned=False, image_source=None, image_weight=0.5,
+                              shard_size=DEFAULT_SHARD_SIZE, shard_range=None,
+                              use_embedding_store=True, workers=1, index_shards=1, shard_by="id",
+                              category_indexes=False):
+    """
+    Build enhanced FAISS index with more products.
+    
+    With `use_real_data`, products are streamed from data/products.csv,
+    .jsonl, .parquet or .json (see catalog_ingest), and encoding starts
+    while the file is still being read. Only the shard being encoded and
+    the compact columnar catalog are held in memory.
+    
+    Text embeddings are written to resumable shards under
+    data/index/embeddings, so an interrupted build picks up at the first
+    unfinished shard. With `shard_range` (start, stop) only those shards
+    are encoded and no index is built, which lets several workers split
+    the encoding; a final run without it assembles the index.
+    
+    With `image_source` (a local directory or tarball of product images),
+    image vectors are encoded alongside the text vectors and the index is
+    built from their weighted fusion (see image_store.fuse_embeddings).
+    
+    With `use_embedding_store`, product texts already encoded by an earlier
+    build (same text, same model) are read from data/index/embeddings.sqlite
+    instead of going through CLIP again.
+    
+    With `workers` > 1, shards are encoded by that many encoder processes,
+    each pinned to its own share of the CPU cores (see parallel_encode).
+    
+    With `index_shards` > 1, the catalog is split by `shard_by` ('id' or
+    'category') into that many separate indexes under data/index/shards,
+    to be served by shard servers (see sharded_index).
+    
+    With `category_indexes`, per-category sub-indexes are built as well,
+    so category-filtered searches only visit the selected categories (see
+    FAISSIndex.build_category_indexes).
+    """
     
     print("\n" + "="*70)
     print("Building Enhanced Product Search Index")
@@ -194,67 +282,148 @@ def build_index_with_products(use_real_data=False):
     index_dir.mkdir(parents=True, exist_ok=True)
     index_path = index_dir / "products"
     
-    # Load dataset
+    # Open dataset (streamed: rows are read while earlier shards encode)
     print(f"\n📦 Loading product database...")
     
-    if use_real_data:
-        # Try to load from CSV/JSON
-        csv_path = data_dir / "products.csv"
-        json_path = data_dir / "products.json"
-        
-        if csv_path.exists():
-            import pandas as pd
-            df = pd.read_csv(csv_path)
-            products = df.to_dict('records')
-            print(f"✓ Loaded {len(products)} products from CSV")
-        elif json_path.exists():
-            with open(json_path) as f:
-                products = json.load(f)
-            print(f"✓ Loaded {len(products)} products from JSON")
-        else:
-            print(f"⚠ No CSV/JSON found, using built-in database")
-            products = PRODUCTS_DATABASE
+    catalog_file = find_catalog(data_dir) if use_real_data else None
+    if catalog_file:
+        products = iter_products(catalog_file)
+        print(f"✓ Streaming products from {catalog_file}")
     else:
-        products = PRODUCTS_DATABASE
-    
+        if use_real_data:
+            print(f"⚠ No CSV/JSONL/Parquet/JSON found, using built-in database")
+        products = iter(PRODUCTS_DATABASE)
+    
+    # Columnar catalog built row by row as the stream is encoded
+    builder = CatalogBuilder()
+    
+    def catalogued(records):
+        for record in records:
+            builder.append(record)
+            yield record
+    
+    # Initialize encoder (worker processes load their own; the parent only
+    # needs one for images, or to learn the size of an unknown model)
+    model_name = "ViT-B/32"
+    encoder = None
+    if workers <= 1 or model_name not in EMBEDDING_DIMS:
+        print("\n🤖 Loading CLIP model...")
+        encoder = CLIPEncoder(model_name=model_name, cache_size=0)  # Catalog texts are unique
+    embedding_dim = encoder.get_embedding_dim() if encoder else EMBEDDING_DIMS[model_name]
+    
+    # Generate embeddings into resumable shards
+    shards = EmbeddingShards(index_dir / "embeddings", embedding_dim, model_name, shard_size=shard_size)
+    shard_indices = range(*shard_range) if shard_range else None
+    print(f"\n🔄 Generating embeddings ({shard_size} products per shard, batch size {batch_size})...")
+    store_path = index_dir / "embeddings.sqlite"
+    if workers > 1:
+        encoded = encode_shards_parallel(
+            shards, workers, model_name, batch_size, catalogued(products),
+            store_path=str(store_path) if use_embedding_store else None, shard_indices=shard_indices
+        )
+        print(f"✓ Encoded {encoded} shard(s) with {workers} workers")
+    else:
+        store = (EmbeddingStore(store_path, model_name, embedding_dim)
+                 if use_embedding_store else None)
+        try:
+            encoded = generate_shards(
+                shards, lambda batch: encode_products(encoder, batch, batch_size=batch_size, store=store),
+                catalogued(products), shard_indices
+            )
+            print(f"✓ Encoded {encoded} shard(s)")
+            if store is not None and encoded:
+                stats = store.get_stats()
+                print(f"✓ Embedding store: {stats['hits']} reused, {stats['misses']} newly encoded")
+        finally:
+            if store is not None:
+                store.close()
+    
+    if shard_range:
+        remaining = len(shards.pending())
+        print(f"\n✓ Shards {shard_range[0]}-{shard_range[1] - 1} done, {remaining} shard(s) still pending")
+        print("  Build the index with a run without --shards once every shard is encoded")
+        return
+    embeddings = shards.chunks()  # Memory-mapped, added to the index one shard at a time
+    products = builder.build()
     print(f"✓ Total products: {len(products)}")
     
-    # Initialize encoder
-    print("\n🤖 Loading CLIP model...")
-    encoder = CLIPEncoder(model_name="ViT-B/32")
-    
-    # Generate embeddings
-    print(f"\n🔄 Generating embeddings for {len(products)} products...")
-    embeddings = []
-    
-    for product in tqdm(products, desc="Encoding products"):
-        # Create rich text description for better embeddings
-        text = f"{product['name']} {product.get('category', '')} {product.get('color', '')} {product.get('description', '')}"
-        embedding = encoder.encode_text(text)
-        embeddings.append(embedding)
-    
-    embeddings = np.array(embeddings)
-    print(f"✓ Generated {len(embeddings)} embeddings")
-    
-    # Build FAISS index
-    print("\n🔍 Building FAISS index...")
-    faiss_index = FAISSIndex(embedding_dim=encoder.get_embedding_dim())
-    faiss_index.build_index(
-        embeddings=embeddings,
-        metadata=products,
-        index_type="HNSW",
-        M=64,  # More connections for better accuracy
-        ef_construction=400  # Higher quality search
+    # Image vectors from the local image store, fused with the text vectors
+    if image_source:
+        if encoder is None:
+            print("\n🤖 Loading CLIP model...")
+            encoder = CLIPEncoder(model_name=model_name, cache_size=0)
+        print(f"\n🖼  Encoding product images from {image_source}...")
+        store = LocalImageStore(image_source)
+        print(f"✓ Found {len(store)} images")
+        try:
+            image_embeddings, has_image = encode_product_images(
+                encoder, products, store, index_dir / "image_embeddings", batch_size=batch_size
+            )
+        finally:
+            store.close()
+        embeddings = fuse_embedding_chunks(embeddings, image_embeddings, has_image,
+                                           index_dir / "fused_embeddings", image_weight)
+        print(f"✓ Fused text and image vectors (image weight {image_weight})")
+    
+    # Settings picked by tune_index.py, if requested
+    build_params = {'M': 64}  # More connections for better accuracy
+    tuning_path = Path(str(index_path) + FAISSIndex.TUNING_SUFFIX)
+    if tuned and tuning_path.exists():
+        with open(tuning_path) as f:
+            chosen = json.load(f)['chosen']
+        index_type = chosen['index_type']
+        build_params = {key: chosen[key] for key in ('M', 'nlist') if key in chosen}
+        build_params.setdefault('M', 64)
+        print(f"✓ Using tuned config: {index_type} {build_params}")
+    elif tuned:
+        print(f"⚠ No tuning found at {tuning_path}, using defaults (run tune_index.py first)")
+    
+    build_params.update(
+        index_type=index_type,
+        ef_construction=400,  # Higher quality search
+        pq_m=pq_m,  # Bytes per vector for IVFPQ/OPQ
+        rerank_factor=rerank_factor,  # Exact re-ranking for compressed types
+        metric=metric  # Inner product == cosine for normalized CLIP vectors
     )
     
-    # Save index
-    print(f"\n💾 Saving index...")
-    faiss_index.save(str(index_path))
+    if index_shards > 1:
+        # One index per shard, served by shard_server.py processes
+        print(f"\n🔍 Building {index_shards} index shards (by {shard_by})...")
+        shards_dir = index_dir / "shards"
+        build_shards(embeddings, products, index_shards, shard_by, shards_dir,
+                     category_indexes=category_indexes, **build_params)
+        index_files = list(shards_dir.glob("shard_*/products.index"))
+        print(f"✓ Saved shard layout to {shards_dir / 'layout.json'}")
+        print("  Serve with: SEARCH_SHARDS=local python main.py")
+    else:
+        # Build FAISS index
+        print("\n🔍 Building FAISS index...")
+        faiss_index = FAISSIndex(embedding_dim=embedding_dim)
+        faiss_index.build_index(embeddings=embeddings, metadata=products, **build_params)
+        if category_indexes:
+            faiss_index.build_category_indexes()
+        
+        # Save index as a new generation; a running server keeps its own
+        # files (and update log) until it swaps to this one
+        print(f"\n💾 Saving index...")
+        version = new_version()
+        saved_path = generation_path(str(index_path), version)
+        faiss_index.save(saved_path)
+        publish_version(str(index_path), version)
+        print(f"✓ Published index version {version}")
+        removed = prune_generations(str(index_path))
+        if removed:
+            print(f"✓ Removed {len(removed)} old index version(s)")
+        index_files = [Path(saved_path + ".index")]
     
     # Save product catalog
     catalog_path = index_dir / "catalog.json"
     with open(catalog_path, 'w') as f:
-        json.dump(products, f, indent=2)
+        # Written record by record rather than as one json.dump of a list
+        f.write("[\n")
+        for i, product in enumerate(products):
+            f.write((",\n" if i else "") + json.dumps(product))
+        f.write("\n]\n")
     print(f"✓ Saved product catalog")
     
     # Print statistics
@@ -263,10 +432,17 @@ def build_index_with_products(use_real_data=False):
     print("="*70)
     print(f"\n📊 Statistics:")
     print(f"   Total products: {len(products)}")
-    print(f"   Index size: {index_path.with_suffix('.index').stat().st_size / 1024 / 1024:.2f} MB")
-    print(f"   Embedding dimension: {encoder.get_embedding_dim()}")
-    print(f"\n📁 Categories: {', '.join(set(p['category'] for p in products))}")
-    print(f"💰 Price range: ${min(p['price'] for p in products):.2f} - ${max(p['price'] for p in products):.2f}")
+    print(f"   Index type: {index_type} ({metric})")
+    if image_source:
+        print(f"   Vectors: text + image (image weight {image_weight})")
+    if index_shards > 1:
+        print(f"   Index shards: {index_shards} (by {shard_by})")
+    if category_indexes:
+        print(f"   Category sub-indexes: yes")
+    print(f"   Index size: {sum(path.stat().st_size for path in index_files) / 1024 / 1024:.2f} MB")
+    print(f"   Embedding dimension: {embedding_dim}")
+    print(f"\n📁 Categories: {', '.join(products.values('category'))}")
+    print(f"💰 Price range: ${products.price.min():.2f} - ${products.price.max():.2f}")
     print("\n" + "="*70)
 
 
@@ -274,7 +450,46 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Build enhanced product search index")
-    parser.add_argument('--real-data', action='store_true', help='Load from CSV/JSON')
+    parser.add_argument('--real-data', action='store_true',
+                        help='Stream data/products.csv, .jsonl, .parquet or .json')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Products encoded per CLIP forward pass')
+    parser.add_argument('--index-type', default="HNSW", choices=FAISSIndex.INDEX_TYPES,
+                        help='FAISS index type (IVFPQ, OPQ, HNSWSQ8, HNSWFP16 are compressed)')
+    parser.add_argument('--pq-m', type=int, default=64,
+                        help='Sub-quantizers (bytes per vector) for IVFPQ/OPQ')
+    parser.add_argument('--rerank-factor', type=int, default=4,
+                        help='Compressed indexes re-score this many times k candidates exactly (0 = off)')
+    parser.add_argument('--metric', default="ip", choices=sorted(FAISSIndex.METRICS),
+                        help='Similarity metric: inner product (cosine) or L2')
+    parser.add_argument('--tuned', action='store_true',
+                        help='Use the index type, M and nlist chosen by tune_index.py')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help='Products per resumable embedding shard')
+    parser.add_argument('--shards', metavar='START:STOP',
+                        help='Only encode this shard range (for parallel workers), then exit')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Encoder processes, each pinned to its own share of the CPU cores')
+    parser.add_argument('--no-embedding-store', action='store_true',
+                        help='Re-encode every product instead of reusing stored embeddings')
+    parser.add_argument('--images',
+                        help='Local directory or tarball of product images to index alongside text')
+    parser.add_argument('--image-weight', type=float, default=0.5,
+                        help='Share of the image vector in the fused text+image vector (0-1)')
+    parser.add_argument('--index-shards', type=int, default=1,
+                        help='Split the index into this many shards for scatter-gather serving')
+    parser.add_argument('--shard-by', default="id", choices=SHARD_KEYS,
+                        help='Assign products to index shards by id hash or by category')
+    parser.add_argument('--category-indexes', action='store_true',
+                        help='Also build per-category sub-indexes for category-filtered searches')
     
     args = parser.parse_args()
-    build_index_with_products(use_real_data=args.real_data)
\ No newline at end of file
+    shard_range = tuple(int(bound) for bound in args.shards.split(':')) if args.shards else None
+    build_index_with_products(use_real_data=args.real_data, batch_size=args.batch_size,
+                              index_type=args.index_type, rerank_factor=args.rerank_factor,
+                              pq_m=args.pq_m, metric=args.metric, tuned=args.tuned,
+                              image_source=args.images, image_weight=args.image_weight,
+                              shard_size=args.shard_size, shard_range=shard_range,
+                              use_embedding_store=not args.no_embedding_store, workers=args.workers,
+                              index_shards=args.index_shards, shard_by=args.shard_by,
+                              category_indexes=args.category_indexes)
\ No newline at end of file
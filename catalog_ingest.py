@@ -0,0 +1,100 @@
+"""
+Catalog Ingest Module
+Streams product records from CSV, JSONL, Parquet or JSON files, so index
+builds never hold the raw catalog file in memory
+"""
+
+import json
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+
+# Catalog files looked for by find_catalog(), in order of preference
+CATALOG_NAMES = ("products.csv", "products.jsonl", "products.parquet", "products.json")
+
+# Rows parsed per chunk for CSV and Parquet
+DEFAULT_CHUNK_ROWS = 10000
+
+
+def find_catalog(data_dir: Union[str, Path]) -> Optional[Path]:
+    """First catalog file present in `data_dir`, or None."""
+    for name in CATALOG_NAMES:
+        path = Path(data_dir) / name
+        if path.exists():
+            return path
+    return None
+
+
+def iter_csv(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[dict]:
+    """Records from a CSV file, parsed `chunk_rows` rows at a time."""
+    import pandas as pd
+
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        yield from chunk.to_dict('records')
+
+
+def iter_jsonl(path: Path) -> Iterator[dict]:
+    """Records from a JSON Lines file (one object per line)."""
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+
+
+def iter_parquet(path: Path, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[dict]:
+    """Records from a Parquet file, read one row batch at a time."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet catalogs requires pyarrow (pip install pyarrow)") from e
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+        yield from batch.to_pylist()
+
+
+def iter_json(path: Path) -> Iterator[dict]:
+    """
+    Records from a JSON array file.
+
+    Streams with ijson when it is installed; otherwise the array is parsed
+    in one go, so prefer JSONL for large catalogs.
+    """
+    try:
+        import ijson
+    except ImportError:
+        print(f"⚠ ijson not installed, loading {path.name} in one go (use JSONL for large catalogs)")
+        with open(path) as f:
+            yield from json.load(f)
+        return
+
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, 'item', use_float=True)
+
+
+def iter_products(path: Union[str, Path], chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[dict]:
+    """
+    Stream product records from a catalog file.
+
+    Args:
+        path: .csv, .jsonl, .parquet or .json file
+        chunk_rows: Rows parsed per chunk (CSV / Parquet)
+
+    Returns:
+        Iterator over product dictionaries, in file order
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        return iter_csv(path, chunk_rows)
+    if suffix in (".jsonl", ".ndjson"):
+        return iter_jsonl(path)
+    if suffix == ".parquet":
+        return iter_parquet(path, chunk_rows)
+    if suffix == ".json":
+        return iter_json(path)
+    raise ValueError(f"Unsupported catalog format: {path.name}")
@@ -0,0 +1,706 @@
+"""
+Catalog Store Module
+Compact columnar product catalog, memory-mapped from disk and used to filter vector search
+"""
+
+import hashlib
+import json
+import math
+import shutil
+import numpy as np
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+
+# Column kinds
+NUMERIC_KINDS = ('int', 'float', 'bool')  # Fixed-width 'values' arrays
+STRING_KINDS = ('str', 'json')
+CATEGORY_KIND = 'category'
+
+# Array typecode and NumPy dtype of each fixed-width kind
+TYPECODES = {'int': 'q', 'float': 'd', 'bool': 'B'}
+DTYPES = {'int': 'int64', 'float': 'float64', 'bool': 'bool'}
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+FLOAT_EXACT_INT = 2 ** 53  # Larger integers don't survive a float64
+
+
+def product_text(product: dict) -> str:
+    """Create rich text description for better embeddings"""
+    return f"{product['name']} {product.get('category', '')} {product.get('color', '')} {product.get('description', '')}"
+
+
+def catalog_digest(products: Iterable[dict]) -> str:
+    """Fingerprint of the product ids, so build checkpoints are never reused across catalogs."""
+    digest = hashlib.sha1()
+    for product in products:
+        digest.update(str(product.get('id')).encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+
+def _is_null(value) -> bool:
+    """Missing values: absent keys, None and pandas' NaN placeholders."""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def to_number(value) -> Optional[float]:
+    """Coerce a numeric field (e.g. a price read from CSV as text); None if it isn't a number."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if _is_null(value) or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+class _ColumnBuilder:
+    """Accumulates one column while rows are appended."""
+
+    def __init__(self, name: str, kind: str, num_rows: int):
+        self.name = name
+        self.kind = kind
+        self.nulls = bytearray(b'\x01' * num_rows)  # Rows before this field was first seen
+        if kind in NUMERIC_KINDS:
+            self.values = array(TYPECODES[kind], [0]) * num_rows
+        elif kind == CATEGORY_KIND:
+            self.values = array('i', [-1] * num_rows)
+            self.vocab = {}
+        else:
+            self.offsets = array('q', [0] * (num_rows + 1))
+            self.data = bytearray()
+
+    def append(self, value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if _is_null(value):
+            self.nulls.append(1)
+            self._append_empty()
+            return
+        self.nulls.append(0)
+
+        if self.kind in NUMERIC_KINDS:
+            if not self._fits(value):
+                self._convert_to_json()
+                return self.append_string(value)
+            self.values.append(value)
+        elif self.kind == CATEGORY_KIND:
+            value = str(value)
+            code = self.vocab.setdefault(value, len(self.vocab))
+            self.values.append(code)
+        else:
+            self.append_string(value)
+
+    def append_string(self, value):
+        if self.kind == 'str' and not isinstance(value, str):
+            # Keep numbers, bools and structures typed
+            self._set_json()
+        encoded = (json.dumps(value) if self.kind == 'json' else value).encode('utf-8')
+        self.data += encoded
+        self.offsets.append(len(self.data))
+
+    def _append_empty(self):
+        if self.kind in NUMERIC_KINDS:
+            self.values.append(0)
+        elif self.kind == CATEGORY_KIND:
+            self.values.append(-1)
+        else:
+            self.offsets.append(len(self.data))
+
+    def _fits(self, value) -> bool:
+        """True if value can be stored in this fixed-width column unchanged."""
+        if self.kind == 'bool' or isinstance(value, bool):
+            return self.kind == 'bool' and isinstance(value, bool)
+        if isinstance(value, int):
+            if self.kind == 'int':
+                return INT64_MIN <= value <= INT64_MAX
+            return abs(value) <= FLOAT_EXACT_INT
+        if isinstance(value, float):
+            return self.kind == 'float' or self._convert_to_float()
+        return False
+
+    def _convert_to_float(self) -> bool:
+        """An int column met a float: widen it, unless a stored int would change."""
+        if any(abs(value) > FLOAT_EXACT_INT for value in self.values):
+            return False
+        self.kind = 'float'
+        self.values = array('d', self.values)
+        return True
+
+    def _convert_to_json(self):
+        """A fixed-width column met a value it can't hold: store every value as JSON."""
+        values, kind = self.values, self.kind
+        self.kind = 'json'
+        self.offsets = array('q', [0])
+        self.data = bytearray()
+        # The null flag for the value being appended is already recorded
+        for value, null in zip(values, self.nulls[:-1]):
+            if not null:
+                self.data += json.dumps(bool(value) if kind == 'bool' else value).encode('utf-8')
+            self.offsets.append(len(self.data))
+        del self.values
+
+    def _set_json(self):
+        """Re-encode already stored strings as JSON once a structured value shows up."""
+        offsets, data = self.offsets, bytes(self.data)
+        self.kind = 'json'
+        self.offsets = array('q', [0])
+        self.data = bytearray()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            self.data += json.dumps(data[start:end].decode('utf-8')).encode('utf-8')
+            self.offsets.append(len(self.data))
+
+    def arrays(self) -> dict:
+        """Return the finished column as NumPy arrays."""
+        arrays = {}
+        if self.kind in NUMERIC_KINDS:
+            arrays['values'] = np.frombuffer(self.values, dtype=TYPECODES[self.kind]).astype(DTYPES[self.kind])
+        elif self.kind == CATEGORY_KIND:
+            arrays['codes'] = np.frombuffer(self.values, dtype='int32').copy()
+        else:
+            arrays['offsets'] = np.frombuffer(self.offsets, dtype='int64').copy()
+            arrays['data'] = np.frombuffer(bytes(self.data), dtype='uint8')
+        if any(self.nulls):
+            arrays['null'] = np.frombuffer(bytes(self.nulls), dtype='uint8').astype(bool)
+        return arrays
+
+
+class CatalogBuilder:
+    """
+    Builds a ColumnarCatalog from product dictionaries appended one at a time.
+
+    Column kinds are inferred from the first non-missing value: ints, floats
+    and bools become fixed-width columns, everything else goes into an
+    offset-indexed UTF-8 blob. A column falls back to JSON text when a later
+    value can't be stored in it exactly, so every value reads back unchanged.
+    The filterable categorical fields are stored as int32 codes into a
+    vocabulary, and the numeric filter fields (price) are always floats:
+    values that aren't numbers are stored as missing.
+    """
+
+    def __init__(self, categorical_fields: Iterable[str] = None, numeric_fields: Iterable[str] = None):
+        self.categorical_fields = tuple(categorical_fields or ColumnarCatalog.CATEGORICAL_FIELDS)
+        self.numeric_fields = tuple(numeric_fields or ColumnarCatalog.NUMERIC_FIELDS)
+        self.num_rows = 0
+        self.columns = {}  # name -> _ColumnBuilder, in first-seen order
+
+    def append(self, record: dict):
+        """Add one product."""
+        for name, value in record.items():
+            if name in self.numeric_fields:
+                value = to_number(value)
+            if name not in self.columns:
+                if _is_null(value):
+                    continue  # The kind comes from the first real value
+                if isinstance(value, np.generic):
+                    value = value.item()
+                if name in self.categorical_fields:
+                    kind = CATEGORY_KIND
+                elif name in self.numeric_fields:
+                    kind = 'float'
+                elif isinstance(value, bool):
+                    kind = 'bool'
+                elif isinstance(value, (int, float)):
+                    kind = 'int' if isinstance(value, int) else 'float'
+                else:
+                    kind = 'str'
+                self.columns[name] = _ColumnBuilder(name, kind, self.num_rows)
+            self.columns[name].append(value)
+
+        # Fields this record doesn't have
+        for name, column in self.columns.items():
+            if name not in record:
+                column.append(None)
+        self.num_rows += 1
+
+    def extend(self, records: Iterable[dict]):
+        """Add many products."""
+        for record in records:
+            self.append(record)
+
+    def build(self) -> 'ColumnarCatalog':
+        """Return the finished in-memory catalog."""
+        fields, arrays, vocab = [], {}, {}
+        for i, column in enumerate(self.columns.values()):
+            fields.append({'name': column.name, 'kind': column.kind})
+            arrays[i] = column.arrays()
+            if column.kind == CATEGORY_KIND:
+                vocab[column.name] = list(column.vocab)
+        return ColumnarCatalog(self.num_rows, fields, arrays, vocab)
+
+
+class ColumnarCatalog:
+    """
+    Product catalog stored column by column.
+
+    Numeric fields are fixed-width arrays, text fields an offset array plus
+    a UTF-8 byte blob, and categorical fields int32 codes. On disk every
+    array is a separate .npy file opened with mmap, so loading is near
+    instant and the pages are shared between all processes serving the
+    same index. Rows are only materialized into dictionaries on access.
+
+    The columns themselves are immutable; rows added with append() are kept
+    as plain dictionaries after them until the catalog is saved again.
+    """
+
+    CATEGORICAL_FIELDS = ('category', 'color', 'material')
+
+    # Fields range filters apply to, always stored as floats
+    NUMERIC_FIELDS = ('price',)
+
+    # Filter key -> column it applies to
+    FILTER_KEYS = {'categories': 'category', 'colors': 'color', 'materials': 'material'}
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, num_rows: int, fields: List[dict], arrays: dict, vocab: dict):
+        """
+        Initialize catalog from column arrays (use from_records or open).
+
+        Args:
+            num_rows: Number of products
+            fields: Ordered list of {'name', 'kind'} column descriptions
+            arrays: Column position -> dict of NumPy arrays
+            vocab: Categorical field -> list of values indexed by code
+        """
+        self.base_rows = num_rows
+        self.fields = fields
+        self.field_names = [field['name'] for field in fields]
+        self._arrays = arrays
+        self._position = {field['name']: i for i, field in enumerate(fields)}
+        self.vocab = vocab
+        self.lookup = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in vocab.items()}
+
+        # Rows appended after the columns were built
+        self._appended = []
+        self._tail = None
+        self._parsed_prices = None
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> 'ColumnarCatalog':
+        """Build an in-memory catalog from product dictionaries."""
+        builder = CatalogBuilder()
+        builder.extend(records)
+        return builder.build()
+
+    @property
+    def num_rows(self) -> int:
+        return self.base_rows + len(self._appended)
+
+    def append(self, record: dict) -> int:
+        """
+        Add one product after the existing rows.
+
+        Args:
+            record: Product dictionary
+
+        Returns:
+            Row number of the new product
+        """
+        record = dict(record)
+        for name in self.NUMERIC_FIELDS:
+            if name in record:
+                record[name] = to_number(record[name])
+        self._appended.append(record)
+        self._tail = None
+        return self.num_rows - 1
+
+    def _tail_catalog(self) -> 'ColumnarCatalog':
+        """Columnar copy of the appended rows, used for filtering."""
+        if self._tail is None:
+            self._tail = ColumnarCatalog.from_records(self._appended)
+        return self._tail
+
+    def compacted(self) -> 'ColumnarCatalog':
+        """Return an in-memory catalog with appended rows folded into the columns."""
+        if not self._appended:
+            return self
+        return ColumnarCatalog.from_records(self)
+
+    # ------------------------------------------------------------------
+    # Row access
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __bool__(self) -> bool:
+        return self.num_rows > 0
+
+    def __iter__(self) -> Iterator[dict]:
+        for row in range(self.num_rows):
+            yield self.get(row)
+
+    def __getitem__(self, row) -> dict:
+        return self.get(int(row))
+
+    def _value(self, position: int, kind: str, row: int):
+        arrays = self._arrays[position]
+        null = arrays.get('null')
+        if null is not None and null[row]:
+            return None
+
+        if kind in NUMERIC_KINDS:
+            return arrays['values'][row].item()
+        if kind == CATEGORY_KIND:
+            code = int(arrays['codes'][row])
+            return None if code < 0 else self.vocab[self.fields[position]['name']][code]
+
+        offsets = arrays['offsets']
+        text = arrays['data'][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+        return json.loads(text) if kind == 'json' else text
+
+    def get(self, row: int, fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        Materialize one product.
+
+        Args:
+            row: Row number (index position)
+            fields: Optional subset of fields to return
+
+        Returns:
+            Product dictionary (missing fields are omitted)
+        """
+        if row < 0:
+            row += self.num_rows
+        if not 0 <= row < self.num_rows:
+            raise IndexError(f"Catalog row {row} out of range")
+
+        if row >= self.base_rows:
+            appended = self._appended[row - self.base_rows]
+            names = appended if fields is None else fields
+            return {name: appended[name] for name in names
+                    if name in appended and not _is_null(appended[name])}
+
+        names = self.field_names if fields is None else [f for f in fields if f in self._position]
+        record = {}
+        for name in names:
+            position = self._position[name]
+            value = self._value(position, self.fields[position]['kind'], row)
+            if value is not None:
+                record[name] = value
+        return record
+
+    def column(self, name: str) -> list:
+        """Return every value of one field (materialized)."""
+        appended = [record.get(name) for record in self._appended]
+        if name not in self._position:
+            return [None] * self.base_rows + appended
+        position = self._position[name]
+        kind = self.fields[position]['kind']
+        return [self._value(position, kind, row) for row in range(self.base_rows)] + appended
+
+    def _take_column(self, position: int, rows: np.ndarray) -> list:
+        """Gather one column for many (non-appended) rows; None marks missing values."""
+        field = self.fields[position]
+        arrays = self._arrays[position]
+        kind = field['kind']
+
+        null = arrays.get('null')
+        null = null[rows].tolist() if null is not None else [False] * len(rows)
+
+        if kind in NUMERIC_KINDS:
+            values = arrays['values'][rows].tolist()
+        elif kind == CATEGORY_KIND:
+            # Code -1 (missing) picks the trailing None
+            labels = np.array(self.vocab[field['name']] + [None], dtype=object)
+            values = labels[arrays['codes'][rows]].tolist()
+        else:
+            offsets, data = arrays['offsets'], arrays['data']
+            starts, ends = offsets[rows].tolist(), offsets[rows + 1].tolist()
+            decode = json.loads if kind == 'json' else (lambda text: text)
+            return [None if missing else decode(data[start:end].tobytes().decode('utf-8'))
+                    for start, end, missing in zip(starts, ends, null)]
+
+        return [None if missing else value for value, missing in zip(values, null)]
+
+    def take(self, rows: Iterable[int], fields: Optional[Iterable[str]] = None) -> dict:
+        """
+        Gather fields for many rows at once, column by column.
+
+        Args:
+            rows: Row numbers
+            fields: Fields to gather (default: every field)
+
+        Returns:
+            Field name -> list of values aligned with rows (None where missing)
+        """
+        rows = np.asarray(rows, dtype='int64')
+        in_base = rows < self.base_rows
+        if fields is None:
+            names = list(self.field_names)
+            for row in rows[~in_base].tolist():
+                names += [name for name in self._appended[row - self.base_rows] if name not in names]
+        else:
+            names = list(fields)
+
+        columns = {}
+        for name in names:
+            if in_base.all():
+                values = (self._take_column(self._position[name], rows)
+                          if name in self._position else [None] * len(rows))
+            else:
+                # Mix of columnar and appended rows
+                values = [None] * len(rows)
+                base_positions = np.flatnonzero(in_base).tolist()
+                if name in self._position and base_positions:
+                    base_values = self._take_column(self._position[name], rows[in_base])
+                    for i, value in zip(base_positions, base_values):
+                        values[i] = value
+                for i in np.flatnonzero(~in_base).tolist():
+                    value = self._appended[int(rows[i]) - self.base_rows].get(name)
+                    values[i] = None if _is_null(value) else value
+            columns[name] = values
+        return columns
+
+    def select(self, rows: Iterable[int], chunk_size: int = 65536) -> 'ColumnarCatalog':
+        """
+        New in-memory catalog of the given rows, in that order.
+
+        Rows are gathered column by column a chunk at a time, so only one
+        chunk is ever materialized as dictionaries.
+
+        Args:
+            rows: Row numbers to keep
+            chunk_size: Rows gathered at a time
+
+        Returns:
+            ColumnarCatalog with len(rows) rows
+        """
+        rows = np.asarray(rows, dtype='int64')
+        builder = CatalogBuilder(self.CATEGORICAL_FIELDS)
+        for start in range(0, len(rows), chunk_size):
+            columns = self.take(rows[start:start + chunk_size])
+            for i in range(min(chunk_size, len(rows) - start)):
+                builder.append({name: values[i] for name, values in columns.items() if values[i] is not None})
+        return builder.build()
+
+    # ------------------------------------------------------------------
+    # Filtering
+    # ------------------------------------------------------------------
+
+    def values(self, field: str, missing: Optional[str] = None) -> List[str]:
+        """
+        Return the sorted distinct values of a categorical field.
+
+        Args:
+            field: Field name
+            missing: Label listed for products without the field (omitted if None)
+        """
+        values = set(self.vocab.get(field, []))
+        if self._appended:
+            values.update(self._tail_catalog().vocab.get(field, []))
+        if missing is not None and self.has_missing(field):
+            values.add(missing)
+        return sorted(values)
+
+    def has_missing(self, field: str) -> bool:
+        """True if some product has no value for `field`."""
+        if self.base_rows:
+            position = self._position.get(field)
+            if position is None or self._arrays[position].get('null', np.zeros(0, dtype=bool)).any():
+                return True
+        return any(_is_null(record.get(field)) for record in self._appended)
+
+    @property
+    def price(self) -> np.ndarray:
+        """Prices as float64 (missing prices count as 0)."""
+        prices = self._base_prices()
+        if self._appended:
+            prices = np.concatenate([prices, self._tail_catalog().price])
+        return prices
+
+    def _price_arrays(self) -> Optional[dict]:
+        """Arrays of the numeric price column (None if there is no price field)."""
+        if 'price' not in self._position:
+            return None
+        position = self._position['price']
+        arrays = self._arrays[position]
+        if 'values' not in arrays:
+            # Catalogs saved before prices were coerced: parse the stored text once
+            if self._parsed_prices is None:
+                prices = [to_number(value)
+                          for value in self._take_column(position, np.arange(self.base_rows))]
+                self._parsed_prices = {
+                    'values': np.array([price or 0.0 for price in prices], dtype='float64'),
+                    'null': np.array([price is None for price in prices], dtype=bool)
+                }
+            return self._parsed_prices
+        return arrays
+
+    def _base_prices(self) -> np.ndarray:
+        """Prices of the columnar (non-appended) rows."""
+        arrays = self._price_arrays()
+        if arrays is None:
+            return np.zeros(self.base_rows, dtype='float64')
+        prices = np.asarray(arrays['values'], dtype='float64')
+        if 'null' in arrays:
+            prices = np.where(arrays['null'], 0.0, prices)
+        return prices
+
+    def _prices_at(self, rows: np.ndarray) -> np.ndarray:
+        """Prices of some rows as float64, read without building the whole column."""
+        prices = np.zeros(len(rows), dtype='float64')
+        in_base = rows < self.base_rows
+        arrays = self._price_arrays()
+        if arrays is not None:
+            base_rows = rows[in_base]
+            base_prices = np.asarray(arrays['values'][base_rows], dtype='float64')
+            if 'null' in arrays:
+                base_prices[arrays['null'][base_rows]] = 0.0
+            prices[in_base] = base_prices
+        for i in np.flatnonzero(~in_base).tolist():
+            price = self._appended[int(rows[i]) - self.base_rows].get('price')
+            prices[i] = 0.0 if _is_null(price) else price
+        return prices
+
+    def mask(self, filters: Optional[dict]) -> np.ndarray:
+        """
+        Evaluate structured filters.
+
+        Args:
+            filters: Dict with any of min_price, max_price, categories,
+                     colors, materials (lists of accepted values)
+
+        Returns:
+            Boolean array with True for rows matching every filter
+        """
+        if not filters:
+            return np.ones(self.num_rows, dtype=bool)
+        if self._appended:
+            return np.concatenate([self._base_mask(filters), self._tail_catalog().mask(filters)])
+        return self._base_mask(filters)
+
+    def mask_rows(self, rows: Iterable[int], filters: Optional[dict]) -> np.ndarray:
+        """
+        Evaluate structured filters on some rows only.
+
+        Unlike mask(), the cost grows with len(rows), not with the catalog.
+
+        Args:
+            rows: Row numbers to test
+            filters: Same keys as mask()
+
+        Returns:
+            Boolean array aligned with rows
+        """
+        rows = np.asarray(rows, dtype='int64')
+        mask = np.ones(len(rows), dtype=bool)
+        if not filters:
+            return mask
+
+        if filters.get('min_price') is not None or filters.get('max_price') is not None:
+            prices = self._prices_at(rows)
+            if filters.get('min_price') is not None:
+                mask &= prices >= filters['min_price']
+            if filters.get('max_price') is not None:
+                mask &= prices <= filters['max_price']
+
+        for key, field in self.FILTER_KEYS.items():
+            wanted = filters.get(key)
+            if wanted:
+                wanted = set(wanted)
+                values = self.take(rows, [field])[field]
+                mask &= np.fromiter((value in wanted for value in values), dtype=bool, count=len(rows))
+
+        return mask
+
+    def _base_mask(self, filters: dict) -> np.ndarray:
+        """Evaluate filters over the columnar (non-appended) rows."""
+        mask = np.ones(self.base_rows, dtype=bool)
+
+        if filters.get('min_price') is not None or filters.get('max_price') is not None:
+            prices = self._base_prices()
+            if filters.get('min_price') is not None:
+                mask &= prices >= filters['min_price']
+            if filters.get('max_price') is not None:
+                mask &= prices <= filters['max_price']
+
+        for key, field in self.FILTER_KEYS.items():
+            wanted = filters.get(key)
+            if not wanted:
+                continue
+            if field not in self._position:
+                mask[:] = False
+                continue
+            lookup = self.lookup.get(field, {})
+            codes = [lookup[value] for value in set(wanted) if value in lookup]
+            mask &= np.isin(self._arrays[self._position[field]]['codes'], codes)
+
+        return mask
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, dirpath: str):
+        """
+        Write the catalog as one .npy file per array plus a JSON schema.
+
+        Args:
+            dirpath: Catalog directory (created if missing)
+        """
+        if self._appended:
+            return self.compacted().save(dirpath)
+
+        dirpath = Path(dirpath)
+        # Write next to the target and swap directories, so processes that
+        # have the old files memory-mapped never see them truncated
+        tmp_path = dirpath.with_name(dirpath.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        for position, arrays in self._arrays.items():
+            for part, values in arrays.items():
+                np.save(tmp_path / f"col{position}.{part}.npy", np.asarray(values))
+
+        with open(tmp_path / "schema.json", 'w') as f:
+            json.dump({
+                'format_version': self.FORMAT_VERSION,
+                'num_rows': self.num_rows,
+                'fields': self.fields,
+                'parts': {str(p): sorted(a.keys()) for p, a in self._arrays.items()},
+                'vocab': self.vocab
+            }, f)
+
+        if dirpath.exists():
+            old_path = dirpath.with_name(dirpath.name + ".old")
+            if old_path.exists():
+                shutil.rmtree(old_path)
+            dirpath.rename(old_path)
+            tmp_path.rename(dirpath)
+            shutil.rmtree(old_path)
+        else:
+            tmp_path.rename(dirpath)
+
+    @classmethod
+    def open(cls, dirpath: str, mmap: bool = True) -> 'ColumnarCatalog':
+        """
+        Open a saved catalog.
+
+        Args:
+            dirpath: Catalog directory written by save()
+            mmap: Memory-map the arrays instead of reading them into RAM
+
+        Returns:
+            ColumnarCatalog backed by the files
+        """
+        dirpath = Path(dirpath)
+        with open(dirpath / "schema.json") as f:
+            schema = json.load(f)
+        if schema.get('format_version') != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog format: {schema.get('format_version')}")
+
+        mmap_mode = 'r' if mmap else None
+        arrays = {}
+        for position, parts in schema['parts'].items():
+            arrays[int(position)] = {
+                part: np.load(dirpath / f"col{position}.{part}.npy", mmap_mode=mmap_mode)
+                for part in parts
+            }
+        return cls(schema['num_rows'], schema['fields'], arrays, schema['vocab'])
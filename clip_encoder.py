@@ -3,34 +3,156 @@ CLIP Encoder Module
 Handles image and text encoding using OpenAI's CLIP model
 """
 
+import io
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
 import torch
-import clip
 from PIL import Image
-from typing import Union, List
+from typing import Union, List, Optional, Iterable, Tuple
 import numpy as np
 
+from cache import TTLCache
+
+
+# Settings stored inside exported TorchScript encoders
+TRACED_META_FILE = "clip_encoder.json"
+
+# Output dimension of each CLIP variant, for sizing arrays without loading the model
+EMBEDDING_DIMS = {
+    'RN50': 1024, 'RN101': 512, 'RN50x4': 640, 'RN50x16': 768, 'RN50x64': 1024,
+    'ViT-B/32': 512, 'ViT-B/16': 512, 'ViT-L/14': 768, 'ViT-L/14@336px': 768
+}
+
+# CLIP's image normalization constants
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def clip_preprocess(resolution: int):
+    """CLIP's image transform (resize, center crop, normalize), built without a checkpoint."""
+    from torchvision.transforms import CenterCrop, Compose, InterpolationMode, Normalize, Resize, ToTensor
+    
+    return Compose([
+        Resize(resolution, interpolation=InterpolationMode.BICUBIC),
+        CenterCrop(resolution),
+        lambda image: image.convert('RGB'),
+        ToTensor(),
+        Normalize(CLIP_MEAN, CLIP_STD)
+    ])
+
 
 class CLIPEncoder:
     """
     Wrapper class for CLIP model to generate embeddings for images and text.
     """
     
-    def __init__(self, model_name: str = "ViT-B/32", device: str = None):
+    def __init__(self, model_name: str = "ViT-B/32", device: str = None,
+                 cache_size: int = 10000, cache_ttl: Optional[float] = 3600,
+                 preprocess_workers: Optional[int] = None, traced_path: Optional[str] = None):
         """
         Initialize CLIP encoder.
         
         Args:
             model_name: CLIP model variant (ViT-B/32, ViT-B/16, ViT-L/14)
             device: Device to run model on (cuda/cpu). Auto-detects if None.
+            cache_size: Max cached text query embeddings (0 disables the cache)
+            cache_ttl: Seconds a cached text embedding stays valid (None = forever)
+            preprocess_workers: Threads decoding/preprocessing images for
+                                encode_images_batch (0 = inline, None = auto)
+            traced_path: Encoder written by export_traced(); loaded instead of
+                         the CLIP checkpoint when present and matching
         """
+        self.model_name = model_name
         self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Loading CLIP model '{model_name}' on {self.device}...")
+        self.text_cache = TTLCache(max_size=cache_size, ttl=cache_ttl)
+        self.preprocess_workers = (min(8, os.cpu_count() or 1)
+                                   if preprocess_workers is None else preprocess_workers)
+        # Threads start on the first image batch; created here so concurrent
+        # first batches can't each build a pool
+        self._preprocess_pool = (ThreadPoolExecutor(max_workers=self.preprocess_workers,
+                                                    thread_name_prefix="clip-preprocess")
+                                 if self.preprocess_workers > 0 else None)
         
-        self.model, self.preprocess = clip.load(model_name, device=self.device)
-        self.model.eval()  # Set to evaluation mode
+        self.traced = bool(traced_path) and os.path.exists(traced_path) and self._load_traced(traced_path)
+        if not self.traced:
+            import clip  # Only the checkpoint and tokenizer need the clip package
+            
+            print(f"Loading CLIP model '{model_name}' on {self.device}...")
+            self.model, self.preprocess = clip.load(model_name, device=self.device)
+            self.model.eval()  # Set to evaluation mode
+            self.embedding_dim = self.model.visual.output_dim
         
-        print(f"✓ CLIP model loaded successfully")
-        print(f"  - Embedding dimension: {self.model.visual.output_dim}")
+        print(f"✓ CLIP model loaded successfully" + (" (traced)" if self.traced else ""))
+        print(f"  - Embedding dimension: {self.embedding_dim}")
+    
+    def _load_traced(self, traced_path: str) -> bool:
+        """
+        Load a TorchScript encoder written by export_traced().
+        
+        Returns:
+            False if it was exported for another model or device type
+        """
+        print(f"Loading traced CLIP encoder from {traced_path} on {self.device}...")
+        extra_files = {TRACED_META_FILE: ""}
+        model = torch.jit.load(traced_path, map_location=self.device, _extra_files=extra_files)
+        meta = json.loads(extra_files[TRACED_META_FILE] or "{}")
+        if meta.get('model_name') != self.model_name or meta.get('device') != torch.device(self.device).type:
+            print(f"⚠ {traced_path} was exported for {meta.get('model_name')} on {meta.get('device')}, "
+                  f"loading the checkpoint instead")
+            return False
+        
+        self.model = model
+        self.preprocess = clip_preprocess(meta['input_resolution'])
+        self.embedding_dim = meta['embedding_dim']
+        return True
+    
+    @torch.no_grad()
+    def export_traced(self, path: str):
+        """
+        Save this encoder as a TorchScript module for fast startup.
+        
+        CLIPEncoder(traced_path=path) loads it without clip.load(), which
+        checksums the full checkpoint and rebuilds the model on every boot.
+        The artifact only fits the model variant and device type it was
+        traced on.
+        
+        Args:
+            path: Output file (e.g. data/models/clip_vit_b32.pt)
+        """
+        if self.traced:
+            raise ValueError("Encoder was loaded from a traced artifact; export from the checkpoint")
+        import clip
+        
+        resolution = self.model.visual.input_resolution
+        images = torch.stack([self.preprocess(Image.new('RGB', (resolution, resolution), color))
+                              for color in ('white', 'gray')]).to(self.device)
+        texts = clip.tokenize(["a photo of a product", "red cotton t-shirt"]).to(self.device)
+        traced = torch.jit.trace_module(self.model, {'encode_image': images, 'encode_text': texts})
+        
+        # The trace must hold for other batch sizes than the examples
+        check_images = torch.cat([images, images[:1]])
+        check_texts = clip.tokenize(["blue jeans", "leather bag", "running shoes"]).to(self.device)
+        for method, inputs in (('encode_image', check_images), ('encode_text', check_texts)):
+            expected = getattr(self.model, method)(inputs).float()
+            if not torch.allclose(getattr(traced, method)(inputs).float(), expected, atol=1e-3):
+                raise RuntimeError(f"Traced {method} doesn't match the model")
+        
+        meta = {
+            'model_name': self.model_name,
+            'device': torch.device(self.device).type,
+            'embedding_dim': self.embedding_dim,
+            'input_resolution': resolution,
+            'exported_at': datetime.now().isoformat()
+        }
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        torch.jit.save(traced, str(path), _extra_files={TRACED_META_FILE: json.dumps(meta)})
+        print(f"✓ Exported traced encoder to {path}")
     
     @torch.no_grad()
     def encode_image(self, image: Union[str, Image.Image, np.ndarray]) -> np.ndarray:
@@ -57,39 +179,151 @@ class CLIPEncoder:
         
         return embedding.cpu().numpy().astype('float32')[0]
     
+    def _load_and_preprocess(self, image: Union[str, bytes, Image.Image, np.ndarray]) -> torch.Tensor:
+        """Decode (if needed), convert and preprocess one image; runs on a pool worker."""
+        if isinstance(image, (str, bytes)):
+            with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as img:
+                image = img.convert('RGB')
+        elif isinstance(image, np.ndarray):
+            image = Image.fromarray(image).convert('RGB')
+        return self.preprocess(image)
+    
+    def _submit_preprocess(self, image) -> Future:
+        if self.preprocess_workers <= 0:
+            future = Future()
+            try:
+                future.set_result(self._load_and_preprocess(image))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        
+        return self._preprocess_pool.submit(self._load_and_preprocess, image)
+    
+    def _preprocessed_batches(self, images: List, batch_size: int, prefetch_batches: int):
+        """
+        Yield (indices, tensors, failures) per batch of images.
+        
+        Decode + preprocess runs on the worker pool up to `prefetch_batches`
+        batches ahead of the consumer, so preparing batch i+1 overlaps with
+        inference on batch i. Failures are (index, exception) pairs.
+        """
+        starts = iter(range(0, len(images), batch_size))
+        pending = deque()  # Bounded prefetch queue of submitted batches
+        
+        def submit_next() -> bool:
+            start = next(starts, None)
+            if start is None:
+                return False
+            pending.append([(i, self._submit_preprocess(images[i]))
+                            for i in range(start, min(start + batch_size, len(images)))])
+            return True
+        
+        try:
+            while len(pending) <= prefetch_batches and submit_next():
+                pass
+            
+            while pending:
+                indices, tensors, failures = [], [], []
+                for i, future in pending.popleft():
+                    try:
+                        tensors.append(future.result())
+                        indices.append(i)
+                    except Exception as e:
+                        failures.append((i, e))
+                
+                # Keep the pool busy while the caller runs inference on this batch
+                submit_next()
+                yield indices, tensors, failures
+        finally:
+            for batch in pending:
+                for _, future in batch:
+                    future.cancel()
+    
     @torch.no_grad()
-    def encode_images_batch(self, images: List[Union[str, Image.Image]], batch_size: int = 32) -> np.ndarray:
+    def _encode_images(self, images: List, batch_size: int, prefetch_batches: int,
+                       skip_errors: bool) -> Tuple[np.ndarray, List[int], List[dict]]:
+        all_embeddings, encoded, failures = [], [], []
+        
+        for indices, tensors, batch_failures in self._preprocessed_batches(images, batch_size, prefetch_batches):
+            for i, error in batch_failures:
+                if not skip_errors:
+                    raise error
+                image = images[i]
+                failures.append({
+                    'index': i,
+                    'image': image if isinstance(image, str) else f"<{type(image).__name__}>",
+                    'error': f"{type(error).__name__}: {error}"
+                })
+            if not tensors:
+                continue
+            
+            batch_input = torch.stack(tensors).to(self.device)
+            
+            # Generate embeddings
+            embeddings = self.model.encode_image(batch_input)
+            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+            
+            all_embeddings.append(embeddings.cpu().numpy())
+            encoded.extend(indices)
+        
+        if failures:
+            print(f"⚠ Skipped {len(failures)} unreadable image(s):")
+            for failure in failures[:10]:
+                print(f"  - {failure['image']}: {failure['error']}")
+            if len(failures) > 10:
+                print(f"  ... and {len(failures) - 10} more")
+        
+        if not all_embeddings:
+            return np.empty((0, self.get_embedding_dim()), dtype='float32'), encoded, failures
+        return np.vstack(all_embeddings).astype('float32'), encoded, failures
+    
+    def encode_images_batch(self, images: List[Union[str, Image.Image]], batch_size: int = 32,
+                            prefetch_batches: int = 2, skip_errors: bool = False) -> np.ndarray:
         """
         Generate embeddings for multiple images in batches.
         
+        Images are decoded and preprocessed on a worker pool while the model
+        runs on the previous batch.
+        
         Args:
             images: List of image paths or PIL Images
             batch_size: Number of images to process at once
+            prefetch_batches: Batches decoded ahead of the model
+            skip_errors: Drop unreadable images (with a printed report) instead
+                         of raising; see encode_images_with_report for which
+                         images were kept
             
         Returns:
             Array of normalized embeddings (num_images x embedding_dim)
         """
-        all_embeddings = []
+        return self._encode_images(images, batch_size, prefetch_batches, skip_errors)[0]
+    
+    def encode_images_with_report(self, images: List[Union[str, bytes, Image.Image, np.ndarray]],
+                                  batch_size: int = 32, prefetch_batches: int = 2
+                                  ) -> Tuple[np.ndarray, List[int], List[dict]]:
+        """
+        Encode images, skipping ones that cannot be read or decoded.
         
-        for i in range(0, len(images), batch_size):
-            batch = images[i:i + batch_size]
-            
-            # Preprocess batch
-            batch_tensors = []
-            for img in batch:
-                if isinstance(img, str):
-                    img = Image.open(img).convert('RGB')
-                batch_tensors.append(self.preprocess(img))
-            
-            batch_input = torch.stack(batch_tensors).to(self.device)
-            
-            # Generate embeddings
-            embeddings = self.model.encode_image(batch_input)
-            embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        Args:
+            images: List of image paths, encoded image bytes, PIL Images or numpy arrays
+            batch_size: Number of images per forward pass
+            prefetch_batches: Batches decoded ahead of the model
             
-            all_embeddings.append(embeddings.cpu().numpy())
+        Returns:
+            (embeddings, indices, failures): embeddings of the readable images,
+            their positions in `images`, and one {'index', 'image', 'error'}
+            entry per skipped image
+        """
+        return self._encode_images(images, batch_size, prefetch_batches, skip_errors=True)
+    
+    def text_cache_key(self, text: str) -> tuple:
+        """
+        Cache key for a text query.
         
-        return np.vstack(all_embeddings).astype('float32')
+        CLIP's tokenizer lowercases and collapses whitespace itself, so
+        queries differing only in case/spacing share one embedding.
+        """
+        return (self.model_name, " ".join(text.lower().split()))
     
     @torch.no_grad()
     def encode_text(self, text: str) -> np.ndarray:
@@ -102,39 +336,99 @@ class CLIPEncoder:
         Returns:
             Normalized embedding vector (numpy array)
         """
-        text_input = clip.tokenize([text]).to(self.device)
+        return self.encode_texts_batch([text])[0]
+    
+    @torch.no_grad()
+    def _encode_texts_uncached(self, texts: List[str]) -> np.ndarray:
+        import clip
         
-        embedding = self.model.encode_text(text_input)
-        embedding = embedding / embedding.norm(dim=-1, keepdim=True)
+        # Queries over CLIP's 77-token context are cut off rather than rejected
+        text_inputs = clip.tokenize(texts, truncate=True).to(self.device)
         
-        return embedding.cpu().numpy().astype('float32')[0]
+        embeddings = self.model.encode_text(text_inputs)
+        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        
+        return embeddings.cpu().numpy().astype('float32')
     
-    @torch.no_grad()
-    def encode_texts_batch(self, texts: List[str]) -> np.ndarray:
+    def encode_texts_batch(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
         """
         Generate embeddings for multiple text queries.
         
+        Texts already in the embedding cache skip inference; only the
+        misses go through the model, in a single forward pass.
+        
         Args:
             texts: List of text descriptions
+            use_cache: Read/populate the query embedding cache. Disable for
+                       one-off texts such as product descriptions.
             
         Returns:
             Array of normalized embeddings
         """
-        text_inputs = clip.tokenize(texts).to(self.device)
+        if not use_cache or self.text_cache.max_size <= 0:
+            return self._encode_texts_uncached(texts)
         
-        embeddings = self.model.encode_text(text_inputs)
-        embeddings = embeddings / embeddings.norm(dim=-1, keepdim=True)
+        keys = [self.text_cache_key(text) for text in texts]
+        cached = [self.text_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
         
-        return embeddings.cpu().numpy().astype('float32')
+        if missing:
+            # Encode each distinct missing query once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            new_embeddings = self._encode_texts_uncached(list(unique.values()))
+            
+            encoded = {}
+            for key, embedding in zip(unique, new_embeddings):
+                embedding.flags.writeable = False  # Shared between callers
+                self.text_cache.put(key, embedding)
+                encoded[key] = embedding
+            for i in missing:
+                cached[i] = encoded[keys[i]]
+        
+        return np.stack(cached).astype('float32', copy=False)
+    
+    def warm_text_cache(self, queries: Iterable[str], batch_size: int = 64) -> int:
+        """
+        Pre-compute embeddings for known popular queries.
+        
+        Args:
+            queries: Query strings to cache
+            batch_size: Number of queries per forward pass
+            
+        Returns:
+            Number of cached queries
+        """
+        queries = [q for q in queries if q and q.strip()]
+        for start in range(0, len(queries), batch_size):
+            self.encode_texts_batch(queries[start:start + batch_size])
+        return len(queries)
+    
+    def get_cache_stats(self) -> dict:
+        """Return text embedding cache statistics."""
+        return self.text_cache.get_stats()
     
     def get_embedding_dim(self) -> int:
         """Return the dimensionality of embeddings."""
-        return self.model.visual.output_dim
+        return self.embedding_dim
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Test the CLIP encoder or export it for fast startup")
+    parser.add_argument('--export', metavar='PATH',
+                        help='Write a traced (TorchScript) encoder for main.py to load, then exit')
+    parser.add_argument('--device', help='Device to trace on (the API must run on the same device type)')
+    args = parser.parse_args()
+    
+    if args.export:
+        CLIPEncoder(device=args.device, cache_size=0, preprocess_workers=0).export_traced(args.export)
+        sys.exit(0)
+    
     # Test the encoder
-    encoder = CLIPEncoder()
+    encoder = CLIPEncoder(device=args.device)
     
     # Test text encoding
     text_embedding = encoder.encode_text("a red shirt")
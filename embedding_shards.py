@@ -0,0 +1,219 @@
+"""
+Embedding Shards Module
+Resumable embedding generation from a product stream into fixed-size,
+memory-mappable .npy shards, with a manifest of the shards that are done
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Container, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+# Products per shard file
+DEFAULT_SHARD_SIZE = 50000
+MANIFEST_NAME = "manifest.json"
+
+
+def _write_json(path: Path, data: dict):
+    """Write JSON atomically (per-process temp file + rename)."""
+    # Parallel workers may write the same file (e.g. the manifest) at once
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingShards:
+    """
+    Embeddings for a product catalog, stored as one .npy file per
+    `shard_size` products.
+
+    Products arrive as a stream (see split()), so the catalog never has to
+    be in memory. Every finished shard gets a small `shard_NNNNN.json`
+    marker with the digest of the product records it covers, written after
+    the shard itself, so a crash can only lose the shard in progress. A
+    rerun skips every shard whose records are unchanged. Each worker writes
+    only its own markers, which lets several processes fill disjoint shard
+    ranges at once. manifest.json holds the build settings (model,
+    dimension, shard size). When they change, the old shards are discarded.
+    """
+
+    def __init__(self, shard_dir: Union[str, Path], embedding_dim: int, model_name: str,
+                 shard_size: int = DEFAULT_SHARD_SIZE):
+        """
+        Open (or start) the shard set.
+
+        Args:
+            shard_dir: Directory holding the shards and manifest
+            embedding_dim: Embedding dimension
+            model_name: Encoder the embeddings come from
+            shard_size: Products per shard
+        """
+        if shard_size < 1:
+            raise ValueError("shard_size must be at least 1")
+
+        self.shard_dir = Path(shard_dir)
+        self.embedding_dim = embedding_dim
+        self.shard_size = shard_size
+        self.settings = {
+            'embedding_dim': embedding_dim,
+            'model': model_name,
+            'shard_size': shard_size
+        }
+        self.digests = {}  # Shard -> digest of the records seen by split()
+        self.num_products = None  # Known once split() has consumed the stream
+
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.shard_dir / MANIFEST_NAME
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if {key: manifest.get(key) for key in self.settings} == self.settings:
+                return
+            print("⚠ Encoder or shard size changed since the last run, discarding old embedding shards")
+            for path in self.shard_dir.glob("shard_*"):
+                path.unlink()
+        _write_json(manifest_path, {**self.settings, 'shards': {}})
+
+    @staticmethod
+    def content_digest(products: List[dict]) -> str:
+        """Fingerprint of full product records (edits re-encode their shard)."""
+        digest = hashlib.sha1()
+        for product in products:
+            digest.update(json.dumps(product, sort_keys=True, default=str).encode('utf-8') + b'\0')
+        return digest.hexdigest()
+
+    @property
+    def num_shards(self) -> int:
+        if self.num_products is None:
+            raise RuntimeError("Number of shards is known only after the product stream is consumed")
+        return (self.num_products + self.shard_size - 1) // self.shard_size
+
+    def split(self, products: Iterable[dict]) -> Iterator[Tuple[int, List[dict]]]:
+        """
+        Group a product stream into (shard, products) chunks.
+
+        Only one shard's records are held at a time. Each chunk's digest is
+        recorded, and the product count is known once the stream ends.
+        """
+        self.digests, self.num_products = {}, None
+        shard, batch, count = 0, [], 0
+        for product in products:
+            batch.append(product)
+            count += 1
+            if len(batch) == self.shard_size:
+                self.digests[shard] = self.content_digest(batch)
+                yield shard, batch
+                shard, batch = shard + 1, []
+        if batch:
+            self.digests[shard] = self.content_digest(batch)
+            yield shard, batch
+        self.num_products = count
+
+    def _paths(self, shard: int):
+        base = self.shard_dir / f"shard_{shard:05d}"
+        return base.with_suffix(".npy"), base.with_suffix(".json")
+
+    def is_done(self, shard: int) -> bool:
+        """Whether the shard's embeddings are on disk for the records split() saw."""
+        vectors_path, marker_path = self._paths(shard)
+        if shard not in self.digests or not (vectors_path.exists() and marker_path.exists()):
+            return False
+        with open(marker_path) as f:
+            return json.load(f).get('digest') == self.digests[shard]
+
+    def pending(self) -> List[int]:
+        """Shards that still need encoding."""
+        return [shard for shard in range(self.num_shards) if not self.is_done(shard)]
+
+    def write(self, shard: int, products: List[dict], embeddings: np.ndarray):
+        """Store a finished shard, then mark it done."""
+        if embeddings.shape != (len(products), self.embedding_dim):
+            raise ValueError(f"Shard {shard} expects {len(products)} embeddings, got {embeddings.shape}")
+
+        vectors_path, marker_path = self._paths(shard)
+        tmp_path = vectors_path.with_name(vectors_path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, embeddings.astype('float32', copy=False))
+        os.replace(tmp_path, vectors_path)
+        start = shard * self.shard_size
+        _write_json(marker_path, {
+            'shard': shard,
+            'start': start,
+            'stop': start + len(products),
+            'first_id': products[0].get('id'),
+            'last_id': products[-1].get('id'),
+            'digest': self.digests.get(shard) or self.content_digest(products),
+            'completed_at': datetime.now().isoformat()
+        })
+
+    def finalize(self) -> dict:
+        """
+        Drop shards past the end of the catalog and collect the shard
+        markers into manifest.json. Call after the stream is consumed.
+
+        Returns:
+            The manifest
+        """
+        for path in self.shard_dir.glob("shard_*"):
+            if int(path.name[len("shard_"):].split('.')[0]) >= self.num_shards:
+                path.unlink(missing_ok=True)  # Another worker's finalize() may get there first
+
+        shards = {}
+        for shard in range(self.num_shards):
+            _, marker_path = self._paths(shard)
+            if self.is_done(shard):
+                with open(marker_path) as f:
+                    shards[f"{shard:05d}"] = json.load(f)
+        manifest = {**self.settings, 'num_products': self.num_products, 'shards': shards}
+        _write_json(self.shard_dir / MANIFEST_NAME, manifest)
+        return manifest
+
+    def chunks(self) -> List[np.ndarray]:
+        """
+        Memory-mapped embeddings of every shard, in product order.
+
+        Raises:
+            RuntimeError: If any shard is still missing
+        """
+        missing = self.pending()
+        if missing:
+            raise RuntimeError(f"{len(missing)} embedding shard(s) not generated yet: {missing[:10]}")
+        return [np.load(self._paths(shard)[0], mmap_mode='r') for shard in range(self.num_shards)]
+
+
+def generate_shards(shards: EmbeddingShards, encode: Callable[[List[dict]], np.ndarray],
+                    products: Iterable[dict], shard_indices: Optional[Container[int]] = None) -> int:
+    """
+    Encode a product stream shard by shard, skipping shards already done.
+
+    Args:
+        shards: Shard set to fill
+        encode: Maps a list of products to their embeddings
+        products: Product records, in index row order
+        shard_indices: Shards this process is responsible for (default: all)
+
+    Returns:
+        Number of shards encoded by this call
+    """
+    encoded = skipped = 0
+    for shard, batch in shards.split(products):
+        if shard_indices is not None and shard not in shard_indices:
+            continue
+        if shards.is_done(shard):
+            skipped += 1
+            continue
+        start = shard * shards.shard_size
+        print(f"  Shard {shard + 1}: products {start}-{start + len(batch) - 1}")
+        shards.write(shard, batch, encode(batch))
+        encoded += 1
+
+    if skipped:
+        print(f"✓ Resumed: {skipped} shard(s) were already encoded")
+    shards.finalize()
+    return encoded
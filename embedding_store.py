@@ -0,0 +1,118 @@
+"""
+Embedding Store Module
+Persistent embedding cache keyed by a hash of the exact encoder input,
+so rebuilds only encode products whose text changed
+"""
+
+import hashlib
+import sqlite3
+from pathlib import Path
+from typing import Callable, List, Union
+
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    SQLite table of embeddings keyed by sha1(model name + text).
+
+    Keys cover the model as well as the text, so switching CLIP variants
+    never serves stale vectors. The database runs in WAL mode, so parallel
+    build workers can read and add entries at the same time.
+    """
+
+    def __init__(self, path: Union[str, Path], model_name: str, embedding_dim: int):
+        """
+        Open (or create) the store.
+
+        Args:
+            path: SQLite database file
+            model_name: Encoder the embeddings come from
+            embedding_dim: Embedding dimension
+        """
+        self.path = Path(path)
+        self.model_name = model_name
+        self.embedding_dim = embedding_dim
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=60)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+
+    def key(self, text: str) -> bytes:
+        """Store key for one encoder input."""
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode('utf-8')).digest()
+
+    def get_many(self, texts: List[str]) -> List[np.ndarray]:
+        """Stored embeddings for `texts` (None where missing)."""
+        keys = [self.key(text) for text in texts]
+        found = {}
+        for start in range(0, len(keys), 500):  # SQLite caps bound parameters
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, vector in rows:
+                vector = np.frombuffer(vector, dtype='float32')
+                if len(vector) == self.embedding_dim:
+                    found[key] = vector
+        return [found.get(key) for key in keys]
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        """Store embeddings for `texts` (replacing existing entries)."""
+        embeddings = np.asarray(embeddings, dtype='float32')
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(self.key(text), embedding.tobytes()) for text, embedding in zip(texts, embeddings)]
+        )
+        self._db.commit()
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Embeddings for `texts`, running `encode_fn` only on texts not in the store.
+
+        Args:
+            texts: Encoder inputs
+            encode_fn: Maps a list of texts to their embeddings
+
+        Returns:
+            Array of embeddings (len(texts) x embedding_dim)
+        """
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype='float32')
+        cached = self.get_many(texts)
+        missing = {}
+        for i, (text, embedding) in enumerate(zip(texts, cached)):
+            if embedding is None:
+                missing.setdefault(text, []).append(i)
+            else:
+                embeddings[i] = embedding
+
+        self.hits += len(texts) - sum(len(rows) for rows in missing.values())
+        self.misses += len(missing)
+        if missing:
+            # Each distinct missing text is encoded once
+            new_texts = list(missing)
+            new_embeddings = encode_fn(new_texts)
+            self.put_many(new_texts, new_embeddings)
+            for text, embedding in zip(new_texts, new_embeddings):
+                embeddings[missing[text]] = embedding
+        return embeddings
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_stats(self) -> dict:
+        """Return lookup statistics for this session."""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self._db.close()
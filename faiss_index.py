@@ -4,17 +4,216 @@ Handles vector similarity search using FAISS
 """
 
 import faiss
+import base64
+import itertools
+import json
+import os
+import shutil
+import threading
 import numpy as np
 import pickle
-from typing import List, Tuple, Optional
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Iterable, List, Tuple, Optional, Union
 from pathlib import Path
 
+from catalog_store import ColumnarCatalog, to_number
+
+
+# Process-wide counter so every build/load/modification of any FAISSIndex
+# gets a distinct generation number (used to invalidate result caches)
+_generation_counter = itertools.count(1)
+
+
+class _ReadWriteLock:
+    """
+    Lets many searches run concurrently while index updates get exclusive
+    access. Waiting writers block new readers so updates aren't starved.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class VectorStore:
+    """
+    Full-precision copy of the indexed vectors, kept beside compressed
+    indexes for exact re-ranking. Loaded stores are memory-mapped, so only
+    the rows that are actually scored get paged in.
+    """
+    
+    def __init__(self, vectors: np.ndarray):
+        self._base = vectors
+        self._tail = np.empty((0, vectors.shape[1]), dtype='float32')  # Rows added since load
+    
+    def __len__(self) -> int:
+        return len(self._base) + len(self._tail)
+    
+    def append(self, vectors: np.ndarray):
+        """Add vectors for newly appended index rows."""
+        self._tail = np.concatenate([self._tail, vectors.astype('float32')])
+    
+    def get(self, rows: np.ndarray) -> np.ndarray:
+        """Return the vectors of the given rows (num_rows x dim)."""
+        rows = np.asarray(rows, dtype='int64')
+        if not len(self._tail):
+            return np.asarray(self._base[rows], dtype='float32')
+        
+        vectors = np.empty((len(rows), self._base.shape[1]), dtype='float32')
+        in_base = rows < len(self._base)
+        vectors[in_base] = self._base[rows[in_base]]
+        vectors[~in_base] = self._tail[rows[~in_base] - len(self._base)]
+        return vectors
+    
+    def save(self, path: str, chunk_size: int = 65536):
+        """Write all vectors to a .npy file (atomically replaced)."""
+        tmp_path = str(path) + ".tmp"
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='float32',
+                                        shape=(len(self), self._base.shape[1]))
+        for start in range(0, len(self), chunk_size):
+            rows = np.arange(start, min(start + chunk_size, len(self)))
+            out[rows] = self.get(rows)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def open(cls, path: str, mmap: bool = True) -> "VectorStore":
+        """Open a saved store, memory-mapped unless mmap is False."""
+        return cls(np.load(path, mmap_mode='r' if mmap else None))
+
+
+class SearchResults(Sequence):
+    """
+    Ranked search hits: row numbers and cosine scores, with product fields
+    read from the catalog only when needed.
+    
+    Indexing with an int materializes one result dictionary; slicing,
+    select() and sort_by() return new views. to_dicts() builds every
+    result at once, column by column, and can project a subset of fields.
+    """
+    
+    def __init__(self, catalog: ColumnarCatalog, rows: np.ndarray, scores: np.ndarray):
+        self.catalog = catalog
+        self.rows = np.asarray(rows, dtype='int64')
+        self.scores = np.asarray(scores, dtype='float32')
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def __getitem__(self, item):
+        if isinstance(item, (slice, np.ndarray, list)):
+            return SearchResults(self.catalog, self.rows[item], self.scores[item])
+        result = self.catalog.get(int(self.rows[item]))
+        result['similarity_score'] = float(self.scores[item])
+        return result
+    
+    def __repr__(self) -> str:
+        return f"SearchResults({len(self)} hits)"
+    
+    @property
+    def ids(self) -> list:
+        """Product ids of the hits."""
+        return self.catalog.take(self.rows, ['id'])['id']
+    
+    def select(self, mask: np.ndarray) -> "SearchResults":
+        """Keep the hits where mask is True."""
+        return self[np.asarray(mask, dtype=bool)]
+    
+    def sort_by(self, field: str, reverse: bool = False) -> "SearchResults":
+        """Reorder by a numeric field (missing and non-numeric values sort as 0); ties keep rank order."""
+        values = np.array([to_number(value) or 0.0
+                           for value in self.catalog.take(self.rows, [field])[field]], dtype='float64')
+        order = np.argsort(-values if reverse else values, kind='stable')
+        return self[order]
+    
+    def to_dicts(self, fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Materialize the hits.
+        
+        Args:
+            fields: Product fields to include (default: all); 'id' and
+                    'similarity_score' are always included
+            
+        Returns:
+            List of result dictionaries (missing fields are omitted)
+        """
+        if fields is not None:
+            fields = ['id'] + [field for field in fields if field != 'id']
+        columns = self.catalog.take(self.rows, fields)
+        names = list(columns)
+        results = []
+        for values, score in zip(zip(*columns.values()), self.scores.tolist()):
+            result = {name: value for name, value in zip(names, values) if value is not None}
+            result['similarity_score'] = score
+            results.append(result)
+        return results
+
 
 class FAISSIndex:
     """
     Vector similarity search using FAISS with HNSW index.
     """
     
+    # Index types that store lossy codes instead of the raw vectors
+    COMPRESSED_TYPES = ("IVFPQ", "OPQ", "HNSWSQ8", "HNSWFP16")
+    INDEX_TYPES = ("HNSW", "IVF", "Flat") + COMPRESSED_TYPES
+    
+    # "ip" ranks by inner product (cosine, since vectors are normalized);
+    # "l2" by squared Euclidean distance
+    METRICS = {"l2": faiss.METRIC_L2, "ip": faiss.METRIC_INNER_PRODUCT}
+    
+    # Written by tune_index.py next to the index; applied on load
+    TUNING_SUFFIX = ".tuning.json"
+    
+    # Files of a save in progress carry this suffix until the save commits
+    SAVE_TMP_SUFFIX = ".saving"
+    
+    # Default search effort (tuning or set_search_params() can change it)
+    DEFAULT_EF_SEARCH = 64
+    DEFAULT_NPROBE = 16
+    
+    # Per-request effort profiles, as multipliers on the default
+    # efSearch / nprobe; "exact" scores every candidate vector
+    SEARCH_PROFILES = {"fast": 0.5, "balanced": 1.0, "exact": None}
+    
+    # Builds add vectors in chunks of this many rows; quantizers are
+    # trained on at most TRAIN_SAMPLE_SIZE rows
+    BUILD_CHUNK_SIZE = 65536
+    TRAIN_SAMPLE_SIZE = 200000
+    
     def __init__(self, embedding_dim: int = 512):
         """
         Initialize FAISS index.
@@ -24,165 +223,1188 @@ class FAISSIndex:
         """
         self.embedding_dim = embedding_dim
         self.index = None
-        self.metadata = []  # Store product metadata
+        self.metadata = ColumnarCatalog.from_records([])  # Product metadata, one row per vector
+        self.generation = 0  # Changes whenever index contents change
+        
+        # Build settings, reused when compacting
+        self.index_type = None
+        self.metric = "l2"
+        self.build_params = {}
+        
+        # Compressed indexes keep the raw vectors on the side and re-score
+        # rerank_factor * k approximate candidates exactly
+        self.vectors: Optional[VectorStore] = None
+        self.rerank_factor = 0
+        
+        # Product id -> row, built lazily on first lookup
+        self._id_to_row = None
+        self._id_lock = threading.Lock()
+        
+        # Incremental updates: replaced/deleted rows are tombstoned and
+        # skipped at search time until the index is compacted
+        self._deleted = np.zeros(0, dtype=bool)
+        self.num_deleted = 0
+        self.compact_threshold = 0.2  # Fraction of dead rows that warrants compaction
+        self.path = None  # Base path this index was last saved to / loaded from
+        self.wal_path = None  # Write-ahead log of updates since the last save
+        self._lock = _ReadWriteLock()
+        self._update_lock = threading.Lock()  # Serializes updates, compaction and saves
+        
+        # Filtered searches matching at most this many products are scored
+        # exactly against the stored vectors instead of walking the index
+        self.exact_filter_threshold = 20000
         
-    def build_index(self, embeddings: np.ndarray, metadata: List[dict], 
-                   index_type: str = "HNSW", M: int = 32, ef_construction: int = 200):
+        # Optional per-category sub-indexes (see build_category_indexes()):
+        # value -> {'rows': index rows, 'index': HNSW graph over them, or None}
+        self.partitions = None
+        self.partition_field = None
+        self.partition_min_size = None
+        
+        self.tuning = None  # Tuned config applied on load, if any
+        
+    def _bump_generation(self):
+        """Mark the index contents as changed."""
+        self.generation = next(_generation_counter)
+        
+    def _on_contents_changed(self):
+        """Refresh derived structures after the index or metadata changed."""
+        self._id_to_row = None
+        self.partitions = None
+        self._deleted = np.zeros(self.index.ntotal if self.index else 0, dtype=bool)
+        self.num_deleted = 0
+        ivf = faiss.try_extract_index_ivf(self.index) if self.index is not None else None
+        if ivf is not None and self.vectors is None:
+            # IVF needs a direct map before vectors can be reconstructed
+            ivf.make_direct_map()
+        self._bump_generation()
+        
+    def build_index(self, embeddings: Union[np.ndarray, Sequence[np.ndarray]],
+                   metadata: Union[List[dict], ColumnarCatalog],
+                   index_type: str = "HNSW", M: int = 32, ef_construction: int = 200,
+                   nlist: Optional[int] = None, pq_m: int = 64, nbits: int = 8,
+                   rerank_factor: int = 4, metric: str = "l2", vectors_path: Optional[str] = None):
         """
         Build FAISS index from embeddings.
         
         Args:
-            embeddings: Array of embeddings (num_items x embedding_dim)
-            metadata: List of metadata dictionaries for each item
-            index_type: Type of index (HNSW, IVF, Flat)
+            embeddings: Array of embeddings (num_items x embedding_dim), or a list
+                        of row chunks (e.g. memory-mapped shards) that are
+                        normalized and added one at a time
+            metadata: List of metadata dictionaries (or a ColumnarCatalog) for each item
+            index_type: Type of index (HNSW, IVF, Flat, or a compressed type:
+                        IVFPQ, OPQ, HNSWSQ8, HNSWFP16)
             M: HNSW parameter - number of connections per layer
             ef_construction: HNSW parameter - search quality during build
+            nlist: IVF parameter - number of clusters (default: 4 * sqrt(num_items))
+            pq_m: PQ parameter - sub-quantizers (bytes per vector at 8 bits)
+            nbits: PQ parameter - bits per sub-quantizer code
+            rerank_factor: Compressed indexes fetch rerank_factor * k candidates
+                           and re-score them exactly (0 or 1 disables re-ranking)
+            metric: "ip" (inner product) or "l2"; scores are cosine similarity either way
+            vectors_path: Write the full-precision vectors kept for compressed
+                          types to this .npy file and memory-map it, instead
+                          of holding them in RAM
         """
-        num_items = embeddings.shape[0]
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        faiss_metric = self.METRICS[metric]
+        if isinstance(embeddings, np.ndarray):
+            embeddings = self._normalize(embeddings)
+            chunks = [embeddings]
+        else:
+            chunks = [chunk for chunk in embeddings if len(chunk)]
+        num_items = sum(len(chunk) for chunk in chunks)
         print(f"\nBuilding FAISS index...")
         print(f"  - Index type: {index_type}")
+        print(f"  - Metric: {metric}")
         print(f"  - Number of items: {num_items}")
         print(f"  - Embedding dimension: {self.embedding_dim}")
         
+        if nlist is None:
+            # FAISS guideline: 4-16 * sqrt(n) lists, with >= 39 training points each
+            nlist = min(int(4 * np.sqrt(num_items)), num_items // 39)
+        nlist = max(1, min(nlist, num_items))
+        if index_type in ("IVFPQ", "OPQ"):
+            if self.embedding_dim % pq_m:
+                raise ValueError(f"pq_m={pq_m} must divide embedding dim {self.embedding_dim}")
+            # k-means needs at least 2**nbits training points per sub-quantizer
+            nbits = max(1, min(nbits, int(np.log2(max(num_items, 2)))))
+        
         if index_type == "HNSW":
             # HNSW index - best for < 1M items
-            self.index = faiss.IndexHNSWFlat(self.embedding_dim, M)
+            self.index = faiss.IndexHNSWFlat(self.embedding_dim, M, faiss_metric)
             self.index.hnsw.efConstruction = ef_construction
-            self.index.hnsw.efSearch = 64  # Search-time parameter
+            self.index.hnsw.efSearch = self.DEFAULT_EF_SEARCH  # Search-time parameter
             
         elif index_type == "IVF":
             # IVF index - good for > 1M items
-            nlist = min(int(np.sqrt(num_items)), 100)
-            quantizer = faiss.IndexFlatL2(self.embedding_dim)
-            self.index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, nlist)
-            self.index.train(embeddings)
+            quantizer = self._flat_index(metric)
+            self.index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, nlist, faiss_metric)
+            self.index.train(self._training_set(chunks, num_items))
+            
+        elif index_type == "IVFPQ":
+            # IVF with product-quantized codes: pq_m bytes per vector
+            quantizer = self._flat_index(metric)
+            self.index = faiss.IndexIVFPQ(quantizer, self.embedding_dim, nlist, pq_m, nbits,
+                                          faiss_metric)
+            self.index.train(self._training_set(chunks, num_items))
+            
+        elif index_type == "OPQ":
+            # Learned rotation before IVF-PQ: lower quantization error for the same size
+            self.index = faiss.index_factory(
+                self.embedding_dim, f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{nbits}", faiss_metric
+            )
+            self.index.train(self._training_set(chunks, num_items))
+            
+        elif index_type in ("HNSWSQ8", "HNSWFP16"):
+            # HNSW graph over scalar-quantized vectors (1 or 2 bytes per dimension)
+            qtype = (faiss.ScalarQuantizer.QT_8bit if index_type == "HNSWSQ8"
+                     else faiss.ScalarQuantizer.QT_fp16)
+            self.index = faiss.IndexHNSWSQ(self.embedding_dim, qtype, M, faiss_metric)
+            self.index.hnsw.efConstruction = ef_construction
+            self.index.hnsw.efSearch = self.DEFAULT_EF_SEARCH
+            self.index.train(self._training_set(chunks, num_items))
             
         else:  # Flat
             # Brute force - most accurate but slow
-            self.index = faiss.IndexFlatL2(self.embedding_dim)
+            self.index = self._flat_index(metric)
         
-        # Add embeddings to index
-        self.index.add(embeddings)
+        # Add embeddings to index, one chunk at a time
+        full_vectors = None
+        if index_type in self.COMPRESSED_TYPES:
+            full_vectors = (np.lib.format.open_memmap(vectors_path + ".tmp", mode='w+', dtype='float32',
+                                                      shape=(num_items, self.embedding_dim))
+                            if vectors_path else np.empty((num_items, self.embedding_dim), dtype='float32'))
+        added = 0
+        for chunk in chunks:
+            for start in range(0, len(chunk), self.BUILD_CHUNK_SIZE):
+                vectors = self._normalize(chunk[start:start + self.BUILD_CHUNK_SIZE])
+                self.index.add(vectors)
+                if full_vectors is not None:
+                    full_vectors[added:added + len(vectors)] = vectors
+                added += len(vectors)
+        self.set_search_params(nprobe=self.DEFAULT_NPROBE)  # FAISS defaults to 1 list
+        if not isinstance(metadata, ColumnarCatalog):
+            metadata = ColumnarCatalog.from_records(metadata)
         self.metadata = metadata
+        self.index_type = index_type
+        self.metric = metric
+        self.build_params = {'M': M, 'ef_construction': ef_construction, 'metric': metric}
+        if index_type == "IVF":
+            self.build_params['nlist'] = nlist
+        if index_type in self.COMPRESSED_TYPES:
+            if vectors_path:
+                full_vectors.flush()
+                del full_vectors
+                os.replace(vectors_path + ".tmp", vectors_path)
+                full_vectors = np.load(vectors_path, mmap_mode='r')
+            self.vectors = VectorStore(full_vectors)
+            self.rerank_factor = rerank_factor
+            self.build_params.update(nlist=nlist, pq_m=pq_m, nbits=nbits,
+                                     rerank_factor=rerank_factor)
+        else:
+            self.vectors = None
+            self.rerank_factor = 0
+        self._on_contents_changed()
         
         print(f"✓ Index built successfully")
         print(f"  - Total indexed items: {self.index.ntotal}")
+        print(f"  - Index memory: {self.index_bytes() / 1024 / 1024:.2f} MB")
+    
+    def _training_set(self, chunks: List[np.ndarray], num_items: int) -> np.ndarray:
+        """
+        Normalized vectors to train quantizers on: every row for small
+        builds, else an evenly spread sample of TRAIN_SAMPLE_SIZE rows.
+        """
+        if num_items <= self.TRAIN_SAMPLE_SIZE:
+            if len(chunks) == 1:
+                return self._normalize(chunks[0])
+            return self._normalize(np.concatenate([np.asarray(chunk) for chunk in chunks]))
+        
+        rows = np.linspace(0, num_items - 1, self.TRAIN_SAMPLE_SIZE).astype('int64')
+        offsets = np.cumsum([0] + [len(chunk) for chunk in chunks])
+        sample = [np.asarray(chunk[rows[(rows >= start) & (rows < stop)] - start])
+                  for chunk, start, stop in zip(chunks, offsets[:-1], offsets[1:])]
+        return self._normalize(np.concatenate(sample))
+    
+    def _flat_index(self, metric: str):
+        """Exact index (or IVF quantizer) for the given metric."""
+        if metric == "ip":
+            return faiss.IndexFlatIP(self.embedding_dim)
+        return faiss.IndexFlatL2(self.embedding_dim)
+    
+    def _normalize(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Validate vectors and scale them to unit length.
+        
+        Unit vectors make inner product equal to cosine similarity and keep
+        L2 distance in step with it (d = 2 - 2 * cos).
+        
+        Raises:
+            ValueError: On a wrong dimension, non-finite values or zero vectors
+        """
+        vectors = np.asarray(vectors, dtype='float32')
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if vectors.shape[1] != self.embedding_dim:
+            raise ValueError(f"Expected {self.embedding_dim}-dim vectors, got {vectors.shape[1]}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        if not np.all(np.isfinite(norms)) or np.any(norms == 0):
+            raise ValueError("Vectors must be finite and non-zero")
+        return np.ascontiguousarray(vectors / norms, dtype='float32')
+    
+    def _to_scores(self, distances: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """Convert raw FAISS output to cosine similarity (missing results get -inf)."""
+        if self.metric == "ip":
+            scores = distances.astype('float32')
+        else:
+            scores = 1 - distances / 2
+        return np.where(indices == -1, -np.inf, scores).astype('float32')
+    
+    def index_bytes(self) -> int:
+        """Approximate in-memory size of the FAISS index."""
+        if self.index is None:
+            return 0
+        return int(faiss.serialize_index(self.index).nbytes)
+    
+    def set_search_params(self, efSearch: Optional[int] = None, nprobe: Optional[int] = None):
+        """
+        Change the default search effort of the index.
+        
+        Meant for setup (build, load, tuning); per-request effort is passed
+        to search() instead so concurrent searches don't interfere.
+        
+        Args:
+            efSearch: HNSW candidate list size (ignored for other index types)
+            nprobe: IVF lists visited per query (ignored for other index types)
+        """
+        if efSearch is not None and isinstance(self.index, faiss.IndexHNSW):
+            self.index.hnsw.efSearch = int(efSearch)
+        if efSearch is not None and self.partitions:
+            for partition in self.partitions.values():
+                if partition['index'] is not None:
+                    partition['index'].hnsw.efSearch = int(efSearch)
+        ivf = faiss.try_extract_index_ivf(self.index) if self.index is not None else None
+        if nprobe is not None and ivf is not None:
+            ivf.nprobe = max(1, min(int(nprobe), ivf.nlist))
+    
+    def get_search_params(self) -> dict:
+        """Return the current default efSearch / nprobe."""
+        params = {}
+        if isinstance(self.index, faiss.IndexHNSW):
+            params['efSearch'] = self.index.hnsw.efSearch
+        ivf = faiss.try_extract_index_ivf(self.index) if self.index is not None else None
+        if ivf is not None:
+            params['nlist'] = ivf.nlist
+            params['nprobe'] = ivf.nprobe
+        return params
+    
+    def apply_tuning(self, tuning_path: str) -> bool:
+        """
+        Apply the search settings chosen by tune_index.py.
+        
+        Build-time settings (M, nlist) only take effect on the next build;
+        efSearch / nprobe are applied when the index was built with the
+        tuned index type, M and nlist.
+        
+        Returns:
+            True if settings were applied
+        """
+        try:
+            with open(tuning_path) as f:
+                tuning = json.load(f)
+        except (OSError, ValueError):
+            return False
+        
+        chosen = tuning.get('chosen') or {}
+        built = {'index_type': self.index_type, 'M': self.build_params.get('M'),
+                 'nlist': self.get_search_params().get('nlist')}
+        if any(chosen[key] != built[key] for key in built if key in chosen):
+            print(f"⚠ Tuned config {chosen.get('index_type')} doesn't match this build; "
+                  f"rebuild with build_index.py --tuned to use it")
+            return False
+        self.set_search_params(efSearch=chosen.get('efSearch'), nprobe=chosen.get('nprobe'))
+        self.tuning = chosen
+        return True
+    
+    def search_ids(self, query_embeddings: np.ndarray, k: int = 10):
+        """
+        Raw top-k search without metadata lookups (for benchmarking).
+        
+        Returns:
+            (scores, row ids) arrays of shape (num_queries, k); missing results are -1
+        """
+        query_embeddings = self._normalize(query_embeddings)
+        with self._lock.read():
+            return self._index_search(query_embeddings, k, self._alive_selector())
+    
+    def _alive_selector(self):
+        """ID selector skipping tombstoned rows (None when nothing is deleted)."""
+        if not self.num_deleted:
+            return None
+        return faiss.IDSelectorBitmap(np.packbits(~self._deleted, bitorder='little'))
+    
+    def get_row(self, product_id) -> Optional[int]:
+        """
+        Find the index row of a product in O(1).
+        
+        Args:
+            product_id: Product id (rows without an id use their row number)
+            
+        Returns:
+            Row number, or None if the product isn't indexed
+        """
+        return self._id_map().get(str(product_id))
+    
+    def _id_map(self) -> dict:
+        """Product id -> live row (later rows win, tombstoned rows are skipped)."""
+        id_to_row = self._id_to_row
+        if id_to_row is None:
+            with self._id_lock:
+                if self._id_to_row is None:
+                    ids = self.metadata.column('id')
+                    deleted = self._deleted
+                    self._id_to_row = {
+                        str(row if item_id is None else item_id): row
+                        for row, item_id in enumerate(ids)
+                        if not deleted[row]
+                    }
+                id_to_row = self._id_to_row
+        return id_to_row
+    
+    def get_vector(self, row: int) -> np.ndarray:
+        """Return the stored embedding of an index row."""
+        if self.vectors is not None:
+            return self.vectors.get([int(row)])[0]
+        return self.index.reconstruct(int(row))
+    
+    def _reconstruct_rows(self, rows: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Read back stored vectors for many rows."""
+        if self.vectors is not None:
+            # Exact copies rather than decoded (lossy) codes
+            return self.vectors.get(rows)
+        vectors = np.empty((len(rows), self.embedding_dim), dtype='float32')
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            vectors[start:start + len(chunk)] = self.index.reconstruct_batch(chunk)
+        return vectors
+    
+    @property
+    def num_live(self) -> int:
+        """Products that can be returned: indexed rows minus tombstones."""
+        return (self.index.ntotal if self.index else 0) - self.num_deleted
+    
+    def live_vectors(self) -> np.ndarray:
+        """Return the stored vectors of all non-deleted rows."""
+        with self._lock.read():
+            return self._reconstruct_rows(np.flatnonzero(~self._deleted))
+    
+    def search_similar(self, product_id, k: int = 5, min_score: Optional[float] = None,
+                       effort: Union[str, dict, None] = None) -> Optional[SearchResults]:
+        """
+        "More like this": search with a product's stored embedding.
+        
+        No model inference is needed, since the vector is read straight
+        from the index.
+        
+        Args:
+            product_id: Product to find neighbours for
+            k: Number of results to return (the product itself is excluded)
+            min_score: Drop results with a lower cosine similarity
+            effort: Search profile or explicit efSearch / nprobe (see search())
+            
+        Returns:
+            SearchResults view, or None if the product isn't indexed
+        """
+        with self._lock.read():
+            row = self.get_row(product_id)
+            if row is None:
+                return None
+            
+            # +1 to exclude self
+            results = self._search(self.get_vector(row), k + 1, None, min_score, effort)
+        return results.select(results.rows != row)[:k]
+    
+    def _format_results(self, scores: np.ndarray, indices: np.ndarray) -> SearchResults:
+        """Wrap one row of scored results in a lazy result view."""
+        valid = indices != -1
+        return SearchResults(self.metadata, indices[valid], scores[valid])
+    
+    def _resolve_effort(self, effort) -> Optional[dict]:
+        """
+        Turn a profile name or explicit settings into per-call parameters.
+        
+        Args:
+            effort: None, a SEARCH_PROFILES name, or a dict with efSearch
+                    and/or nprobe
+            
+        Returns:
+            None for the index defaults, {'exact': True}, or efSearch/nprobe values
+        """
+        if effort is None or effort == "balanced":
+            return None
+        if isinstance(effort, dict):
+            unknown = set(effort) - {'efSearch', 'nprobe'}
+            if unknown:
+                raise ValueError(f"Unknown search parameters: {', '.join(sorted(unknown))}")
+            values = {key: int(value) for key, value in effort.items() if value is not None}
+            if any(value < 1 for value in values.values()):
+                raise ValueError("efSearch and nprobe must be positive")
+            return values or None
+        if effort not in self.SEARCH_PROFILES:
+            raise ValueError(f"Unknown search profile: {effort} "
+                             f"(choose from {', '.join(self.SEARCH_PROFILES)})")
+        
+        scale = self.SEARCH_PROFILES[effort]
+        if scale is None:
+            return {'exact': True}
+        defaults = self.get_search_params()
+        return {key: max(1, int(defaults[key] * scale))
+                for key in ('efSearch', 'nprobe') if key in defaults}
+    
+    def _search_params(self, k: int, selector=None, effort: Optional[dict] = None, index=None):
+        """Build per-call FAISS search parameters for the current index type."""
+        index = self.index if index is None else index
+        effort = effort or {}
+        if isinstance(index, faiss.IndexPreTransform):
+            # Parameters (and the selector) apply to the wrapped index
+            inner = self._search_params(k, selector, effort, faiss.downcast_index(index.index))
+            params = faiss.SearchParametersPreTransform()
+            params.index_params = inner
+            params._inner = inner  # Keep the SWIG object alive
+            return params
+        
+        if isinstance(index, faiss.IndexHNSW):
+            params = faiss.SearchParametersHNSW()
+            params.efSearch = max(effort.get('efSearch', index.hnsw.efSearch), k)
+        elif isinstance(index, faiss.IndexIVF):
+            params = faiss.SearchParametersIVF()
+            params.nprobe = min(effort.get('nprobe', index.nprobe), index.nlist)
+        else:
+            params = faiss.SearchParameters()
+        if selector is not None:
+            params.sel = selector
+        return params
+    
+    def _candidate_k(self, k: int) -> int:
+        """Number of approximate candidates to fetch for k final results."""
+        if self.vectors is not None and self.rerank_factor > 1:
+            return k * self.rerank_factor
+        return k
+    
+    def _exact_search(self, query_embedding: np.ndarray, ids: np.ndarray, k: int,
+                      min_score: Optional[float] = None, chunk_size: int = 65536):
+        """
+        Score a subset of rows exactly against their stored vectors.
+        
+        Rows are scored in chunks, so memory stays bounded even when every
+        vector in the index is scored.
+        
+        Returns:
+            (scores, ids) of the best k rows, highest cosine similarity first
+        """
+        best_scores = np.empty(0, dtype='float32')
+        best_ids = np.empty(0, dtype='int64')
+        for start in range(0, len(ids), chunk_size):
+            chunk_ids = np.asarray(ids[start:start + chunk_size], dtype='int64')
+            scores = self._reconstruct_rows(chunk_ids) @ query_embedding[0]
+            if min_score is not None:
+                # Cut the low-similarity tail before ranking
+                keep = scores >= min_score
+                scores, chunk_ids = scores[keep], chunk_ids[keep]
+            
+            scores = np.concatenate([best_scores, scores])
+            chunk_ids = np.concatenate([best_ids, chunk_ids])
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                scores, chunk_ids = scores[top], chunk_ids[top]
+            best_scores, best_ids = scores, chunk_ids
+        
+        order = np.argsort(-best_scores, kind='stable')
+        return best_scores[order], best_ids[order]
+    
+    def _index_search(self, query_embeddings: np.ndarray, k: int, selector=None,
+                      effort: Optional[dict] = None, partition: Optional[dict] = None):
+        """
+        Top-k search through FAISS, re-ranked exactly for compressed indexes.
+        
+        With `partition`, its sub-index is searched instead (the selector
+        then addresses positions within the partition).
+        
+        Returns:
+            (scores, indices), one row per query, best first; missing results are -1
+        """
+        index = self.index if partition is None else partition['index']
+        fetch = self._candidate_k(k)
+        if selector is not None or effort:
+            distances, indices = index.search(
+                query_embeddings, fetch, params=self._search_params(fetch, selector, effort, index)
+            )
+        else:
+            distances, indices = index.search(query_embeddings, fetch)
+        if partition is not None:
+            # Partition positions -> index rows
+            indices = np.where(indices == -1, -1, partition['rows'][indices])
+        if fetch == k:
+            return self._to_scores(distances, indices), indices
+        
+        out_scores = np.full((len(query_embeddings), k), -np.inf, dtype='float32')
+        out_ids = np.full((len(query_embeddings), k), -1, dtype='int64')
+        for i, query in enumerate(query_embeddings):
+            candidates = indices[i][indices[i] != -1]
+            scores, ids = self._exact_search(query[None, :], candidates, k)
+            out_scores[i, :len(ids)] = scores
+            out_ids[i, :len(ids)] = ids
+        return out_scores, out_ids
+    
+    @staticmethod
+    def _apply_min_score(scores: np.ndarray, indices: np.ndarray, min_score: Optional[float]):
+        """Drop results below min_score (results are sorted best first)."""
+        if min_score is None:
+            return scores, indices
+        keep = scores >= min_score
+        return scores[keep], indices[keep]
+    
+    def _restricted_search(self, query_embedding: np.ndarray, k: int, mask: np.ndarray,
+                           min_score: Optional[float] = None, effort: Optional[dict] = None):
+        """
+        Top-k search restricted to rows where mask is True.
+        
+        Only matching vectors are scored: small candidate sets (or any set,
+        with the "exact" profile) are scored exactly, larger ones are
+        searched through FAISS with a bitmap ID selector so non-matching
+        rows never enter the result heap.
+        """
+        ids = np.flatnonzero(mask)
+        if len(ids) == 0:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+        
+        if len(ids) <= max(k, self.exact_filter_threshold) or (effort and effort.get('exact')):
+            return self._exact_search(query_embedding, ids, k, min_score)
+        
+        selector = faiss.IDSelectorBitmap(np.packbits(mask, bitorder='little'))
+        scores, indices = self._index_search(query_embedding, k, selector, effort)
+        
+        found = indices[0] != -1
+        if found.sum() < min(k, len(ids)):
+            # Approximate index ran out of candidates: fall back to exact scoring
+            return self._exact_search(query_embedding, ids, k, min_score)
+        return self._apply_min_score(scores[0][found], indices[0][found], min_score)
     
-    def search(self, query_embedding: np.ndarray, k: int = 10) -> List[dict]:
+    def _partition_search(self, query_embedding: np.ndarray, k: int, filters: dict,
+                          min_score: Optional[float] = None, effort: Optional[dict] = None):
+        """
+        Filtered search over the partitions named in the filter.
+        
+        Each partition is searched on its own (exactly when small, through
+        its HNSW graph otherwise) and the per-partition top k lists are
+        merged. Other filters and tombstones are checked on the partition's
+        rows only, so nothing here scales with the whole catalog.
+        """
+        filter_key = self._partition_filter_key()
+        other_filters = {key: value for key, value in filters.items() if key != filter_key}
+        all_scores, all_ids = [], []
+        for value in set(filters[filter_key]):
+            partition = self.partitions.get(value)
+            if partition is None:
+                continue
+            rows = partition['rows']
+            keep = ~self._deleted[rows]
+            if other_filters:
+                keep &= self.metadata.mask_rows(rows, other_filters)
+            num_matching = int(keep.sum())
+            if not num_matching:
+                continue
+            
+            scores = None
+            if (partition['index'] is not None and num_matching > max(k, self.exact_filter_threshold)
+                    and not (effort and effort.get('exact'))):
+                selector = None if keep.all() else faiss.IDSelectorBitmap(np.packbits(keep, bitorder='little'))
+                scores, ids = self._index_search(query_embedding, k, selector, effort, partition)
+                found = ids[0] != -1
+                if found.sum() < min(k, num_matching):
+                    scores = None  # Graph ran out of candidates: score exactly below
+                else:
+                    scores, ids = self._apply_min_score(scores[0][found], ids[0][found], min_score)
+            if scores is None:
+                scores, ids = self._exact_search(query_embedding, rows[keep], k, min_score)
+            all_scores.append(scores)
+            all_ids.append(ids)
+        
+        if not all_scores:
+            return np.empty(0, dtype='float32'), np.empty(0, dtype='int64')
+        scores, ids = np.concatenate(all_scores), np.concatenate(all_ids)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return scores[order], ids[order]
+    
+    def search(self, query_embedding: np.ndarray, k: int = 10,
+               filters: Optional[dict] = None, min_score: Optional[float] = None,
+               effort: Union[str, dict, None] = None) -> SearchResults:
         """
         Search for similar items.
         
         Args:
             query_embedding: Query embedding vector (1D array)
             k: Number of results to return
+            filters: Optional structured filters (min_price, max_price,
+                     categories, colors, materials). Only matching products
+                     are scored, so up to k matching results are returned.
+            min_score: Drop results with a lower cosine similarity
+            effort: Search profile ("fast", "balanced", "exact") or a dict
+                    with explicit efSearch / nprobe, applied to this call only
             
         Returns:
-            List of result dictionaries with metadata and scores
+            SearchResults view of the hits (materialize with to_dicts(fields))
         """
         if self.index is None:
             raise ValueError("Index not built. Call build_index() first.")
         
-        # Ensure query is 2D
-        if query_embedding.ndim == 1:
-            query_embedding = query_embedding.reshape(1, -1)
+        with self._lock.read():
+            return self._search(query_embedding, k, filters, min_score, effort)
+    
+    def _search(self, query_embedding: np.ndarray, k: int, filters: Optional[dict],
+                min_score: Optional[float] = None, effort=None) -> SearchResults:
+        """search() body; the caller holds the read lock."""
+        query_embedding = self._normalize(query_embedding)
+        effort = self._resolve_effort(effort)
+        
+        if filters and self.partitions is not None and filters.get(self._partition_filter_key()):
+            # Only the selected categories' sub-indexes are searched
+            return self._format_results(*self._partition_search(query_embedding, k, filters, min_score, effort))
+        
+        mask = self.metadata.mask(filters) if filters else None
+        if self.num_deleted:
+            alive = ~self._deleted
+            mask = alive if mask is None else mask & alive
+        if mask is None and effort and effort.get('exact'):
+            mask = np.ones(self.index.ntotal, dtype=bool)
+        
+        if mask is not None:
+            scores, indices = self._restricted_search(query_embedding, k, mask, min_score, effort)
+            return self._format_results(scores, indices)
         
         # Search
-        distances, indices = self.index.search(query_embedding, k)
+        scores, indices = self._index_search(query_embedding, k, effort=effort)
         
         # Format results
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx != -1:  # Valid result
-                result = self.metadata[idx].copy()
-                # Convert L2 distance to cosine similarity (embeddings are normalized)
-                similarity = 1 - (dist / 2)  # For normalized vectors
-                result['similarity_score'] = float(similarity)
-                results.append(result)
-        
-        return results
+        return self._format_results(*self._apply_min_score(scores[0], indices[0], min_score))
     
-    def search_batch(self, query_embeddings: np.ndarray, k: int = 10) -> List[List[dict]]:
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 10,
+                     min_score: Optional[float] = None,
+                     effort: Union[str, dict, None] = None) -> List[SearchResults]:
         """
         Search for multiple queries at once.
         
         Args:
             query_embeddings: Array of query embeddings (num_queries x embedding_dim)
             k: Number of results per query
+            min_score: Drop results with a lower cosine similarity
+            effort: Search profile or explicit efSearch / nprobe (see search())
             
         Returns:
-            List of result lists, one per query
+            One SearchResults view per query
+        """
+        query_embeddings = self._normalize(query_embeddings)
+        with self._lock.read():
+            effort = self._resolve_effort(effort)
+            if effort and effort.get('exact'):
+                live_rows = np.flatnonzero(~self._deleted)
+                return [
+                    self._format_results(*self._exact_search(query[None, :], live_rows, k, min_score))
+                    for query in query_embeddings
+                ]
+            
+            scores, indices = self._index_search(query_embeddings, k, self._alive_selector(), effort)
+            
+            return [
+                self._format_results(*self._apply_min_score(query_scores, query_indices, min_score))
+                for query_scores, query_indices in zip(scores, indices)
+            ]
+    
+    # ------------------------------------------------------------------
+    # Category sub-indexes
+    # ------------------------------------------------------------------
+    
+    def build_category_indexes(self, field: str = 'category', min_size: Optional[int] = None):
         """
-        distances, indices = self.index.search(query_embeddings, k)
+        Partition the index by a categorical field.
+        
+        Each value of `field` gets the list of its rows. Values with more
+        than `min_size` rows also get their own HNSW graph. Searches that
+        filter on the field only visit the selected partitions. A category
+        page then costs time in proportion to the category, not the catalog.
+        Upserts keep the partitions current, and compaction rebuilds them.
         
-        all_results = []
-        for query_dists, query_indices in zip(distances, indices):
-            results = []
-            for dist, idx in zip(query_dists, query_indices):
-                if idx != -1:
-                    result = self.metadata[idx].copy()
-                    similarity = 1 - (dist / 2)
-                    result['similarity_score'] = float(similarity)
-                    results.append(result)
-            all_results.append(results)
+        Args:
+            field: Field to partition by (category, color or material)
+            min_size: Smallest partition that gets its own graph (default:
+                      exact_filter_threshold); smaller ones are scored exactly
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+        if field not in ColumnarCatalog.FILTER_KEYS.values():
+            raise ValueError(f"Can't partition by '{field}' "
+                             f"(choose from {', '.join(ColumnarCatalog.FILTER_KEYS.values())})")
+        min_size = self.exact_filter_threshold if min_size is None else min_size
         
-        return all_results
+        with self._update_lock:
+            with self._lock.read():
+                partitions = self._build_partitions(field, min_size)
+            with self._lock.write():
+                self.partitions = partitions
+                self.partition_field = field
+                self.partition_min_size = min_size
+                self._bump_generation()
+        
+        graphs = sum(partition['index'] is not None for partition in partitions.values())
+        print(f"✓ Built {len(partitions)} {field} partitions ({graphs} with their own HNSW graph)")
+    
+    def _partition_filter_key(self) -> str:
+        """Filter key (e.g. 'categories') that routes to the partitions."""
+        return {field: key for key, field in ColumnarCatalog.FILTER_KEYS.items()}[self.partition_field]
+    
+    def _build_partitions(self, field: str, min_size: int) -> dict:
+        """Group live rows by `field` and build graphs for the large groups."""
+        live_rows = np.flatnonzero(~self._deleted)
+        groups = {}
+        for row, value in zip(live_rows.tolist(), self.metadata.take(live_rows, [field])[field]):
+            if value is not None:
+                groups.setdefault(value, []).append(row)
+        
+        partitions = {}
+        for value, rows in groups.items():
+            rows = np.array(rows, dtype='int64')
+            partitions[value] = {
+                'rows': rows,
+                'index': self._partition_graph(rows) if len(rows) > min_size else None
+            }
+        return partitions
+    
+    def _partition_graph(self, rows: np.ndarray):
+        """
+        HNSW graph over some rows' vectors. Compressed indexes get a
+        scalar-quantized graph (re-ranked against the stored vectors).
+        """
+        M = self.build_params.get('M', 32)
+        faiss_metric = self.METRICS[self.metric]
+        if self.index_type in self.COMPRESSED_TYPES:
+            qtype = (faiss.ScalarQuantizer.QT_fp16 if self.index_type == "HNSWFP16"
+                     else faiss.ScalarQuantizer.QT_8bit)
+            graph = faiss.IndexHNSWSQ(self.embedding_dim, qtype, M, faiss_metric)
+            sample = rows[np.unique(np.linspace(0, len(rows) - 1, self.TRAIN_SAMPLE_SIZE).astype('int64'))]
+            graph.train(self._reconstruct_rows(sample))
+        else:
+            graph = faiss.IndexHNSWFlat(self.embedding_dim, M, faiss_metric)
+        graph.hnsw.efConstruction = self.build_params.get('ef_construction', 200)
+        graph.hnsw.efSearch = self.get_search_params().get('efSearch', self.DEFAULT_EF_SEARCH)
+        
+        for start in range(0, len(rows), self.BUILD_CHUNK_SIZE):
+            graph.add(self._reconstruct_rows(rows[start:start + self.BUILD_CHUNK_SIZE]))
+        return graph
+    
+    def _extend_partitions(self, first_row: int, products: List[dict], embeddings: np.ndarray):
+        """Add newly appended rows to their partitions (caller holds the write lock)."""
+        groups = {}
+        for offset, product in enumerate(products):
+            value = product.get(self.partition_field)
+            if value is not None:
+                groups.setdefault(value, []).append(offset)
+        
+        for value, offsets in groups.items():
+            partition = self.partitions.setdefault(value, {'rows': np.empty(0, dtype='int64'), 'index': None})
+            partition['rows'] = np.concatenate([partition['rows'], first_row + np.array(offsets, dtype='int64')])
+            if partition['index'] is not None:
+                partition['index'].add(embeddings[offsets])
+    
+    # ------------------------------------------------------------------
+    # Incremental updates
+    # ------------------------------------------------------------------
+    
+    def upsert(self, products: List[dict], embeddings: np.ndarray, log: bool = True) -> int:
+        """
+        Add new products or replace existing ones (matched by 'id').
+        
+        New vectors are appended to the index; the rows they replace are
+        tombstoned. Cost is proportional to the number of products changed.
+        
+        Args:
+            products: Product dictionaries, each with an 'id'
+            embeddings: Their embeddings (num_products x embedding_dim)
+            log: Record the change in the write-ahead log
+            
+        Returns:
+            Number of products upserted
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+        embeddings = self._normalize(np.asarray(embeddings, dtype='float32').reshape(-1, self.embedding_dim))
+        if len(products) != len(embeddings):
+            raise ValueError("Need exactly one embedding per product")
+        if any('id' not in product for product in products):
+            raise ValueError("Every product needs an 'id' to be upserted")
+        
+        with self._update_lock:
+            if log:
+                self._log_update({
+                    'op': 'upsert',
+                    'products': products,
+                    'embeddings': base64.b64encode(embeddings.tobytes()).decode('ascii')
+                })
+            with self._lock.write():
+                id_to_row = self._id_map()
+                first_row = self.index.ntotal
+                self.index.add(embeddings)
+                if self.vectors is not None:
+                    self.vectors.append(embeddings)
+                self._deleted = np.concatenate([self._deleted, np.zeros(len(products), dtype=bool)])
+                for product in products:
+                    key = str(product['id'])
+                    if key in id_to_row:
+                        self._tombstone(id_to_row[key])
+                    id_to_row[key] = self.metadata.append(product)
+                if self.partitions is not None:
+                    self._extend_partitions(first_row, products, embeddings)
+                self._bump_generation()
+        
+        return len(products)
+    
+    def delete(self, product_ids: List, log: bool = True) -> int:
+        """
+        Delete products by id.
+        
+        Args:
+            product_ids: Ids of products to remove
+            log: Record the change in the write-ahead log
+            
+        Returns:
+            Number of products that were found and deleted
+        """
+        product_ids = [str(product_id) for product_id in product_ids]
+        
+        with self._update_lock:
+            if log:
+                self._log_update({'op': 'delete', 'ids': product_ids})
+            with self._lock.write():
+                id_to_row = self._id_map()
+                deleted = 0
+                for product_id in product_ids:
+                    row = id_to_row.pop(product_id, None)
+                    if row is not None:
+                        self._tombstone(row)
+                        deleted += 1
+                if deleted:
+                    self._bump_generation()
+        
+        return deleted
+    
+    def _tombstone(self, row: int):
+        if not self._deleted[row]:
+            self._deleted[row] = True
+            self.num_deleted += 1
+    
+    def needs_compaction(self) -> bool:
+        """True once the fraction of tombstoned rows passes compact_threshold."""
+        total = self.index.ntotal if self.index else 0
+        return total > 0 and self.num_deleted / total > self.compact_threshold
+    
+    def compact(self):
+        """
+        Rebuild the index from live rows only, dropping tombstones.
+        
+        Searches keep running against the current index while the new one
+        is built; they're only paused for the final swap. Once the index has
+        a path on disk, live vectors are streamed to files next to it instead
+        of being gathered in RAM, and the rebuilt vector store stays
+        memory-mapped.
+        """
+        with self._update_lock:
+            with self._lock.read():
+                live_rows = np.flatnonzero(~self._deleted)
+                catalog = self.metadata.select(live_rows)
+                
+                base_path = self.path
+                if base_path:
+                    vectors = [self._spill_rows(live_rows, base_path + ".compact.npy")]
+                else:
+                    vectors = self._reconstruct_rows(live_rows)
+                
+                rebuilt = FAISSIndex(self.embedding_dim)
+                rebuilt.build_index(vectors, catalog, self.index_type or "HNSW",
+                                    vectors_path=base_path and base_path + ".compacted.vectors.npy",
+                                    **self.build_params)
+                if self.partitions is not None:
+                    rebuilt.partitions = rebuilt._build_partitions(self.partition_field, self.partition_min_size)
+                del vectors
+                if base_path:
+                    os.remove(base_path + ".compact.npy")
+            
+            with self._lock.write():
+                search_params = self.get_search_params()  # Keep tuned efSearch / nprobe
+                self.index = rebuilt.index
+                self.metadata = rebuilt.metadata
+                self.vectors = rebuilt.vectors
+                self._on_contents_changed()
+                self.partitions = rebuilt.partitions
+                self.set_search_params(efSearch=search_params.get('efSearch'),
+                                       nprobe=search_params.get('nprobe'))
+        
+        print(f"✓ Compacted index to {self.index.ntotal} live items")
+    
+    def _spill_rows(self, rows: np.ndarray, path: str, chunk_size: int = 65536) -> np.ndarray:
+        """Write the stored vectors of rows to a .npy file chunk by chunk; returns it memory-mapped."""
+        out = np.lib.format.open_memmap(path, mode='w+', dtype='float32',
+                                        shape=(len(rows), self.embedding_dim))
+        for start in range(0, len(rows), chunk_size):
+            out[start:start + chunk_size] = self._reconstruct_rows(rows[start:start + chunk_size])
+        out.flush()
+        del out
+        return np.load(path, mmap_mode='r')
+    
+    def _log_update(self, entry: dict):
+        """Append one update to the write-ahead log (durably)."""
+        if self.wal_path is None:
+            return
+        with open(self.wal_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _replay_log(self) -> int:
+        """Re-apply updates logged since the index was last saved."""
+        if self.wal_path is None or not Path(self.wal_path).exists():
+            return 0
+        
+        replayed = 0
+        with open(self.wal_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # Torn final write from a crash
+                if entry['op'] == 'upsert':
+                    embeddings = np.frombuffer(base64.b64decode(entry['embeddings']), dtype='float32')
+                    self.upsert(entry['products'], embeddings, log=False)
+                elif entry['op'] == 'delete':
+                    self.delete(entry['ids'], log=False)
+                replayed += 1
+        return replayed
     
     def save(self, filepath: str):
         """
         Save index and metadata to disk.
         
+        Every file is first written under a temporary name. A commit journal
+        (<filepath>.commit) listing them is then written before any of them
+        replaces the current snapshot, and the write-ahead log is truncated
+        last. A save interrupted before the journal leaves the old snapshot
+        and its log untouched; one interrupted after it is completed by the
+        next load(), so a snapshot is never half old and half new.
+        
         Args:
             filepath: Base path for saving (without extension)
         """
         filepath = Path(filepath)
         filepath.parent.mkdir(parents=True, exist_ok=True)
+        base = str(filepath)
         
-        # Save FAISS index
-        index_path = str(filepath) + ".index"
-        faiss.write_index(self.index, index_path)
-        
-        # Save metadata
-        metadata_path = str(filepath) + ".pkl"
-        with open(metadata_path, 'wb') as f:
-            pickle.dump({
-                'metadata': self.metadata,
-                'embedding_dim': self.embedding_dim
-            }, f)
+        with self._update_lock, self._lock.read():
+            replaced, removed = [], []
+            
+            # FAISS index
+            faiss.write_index(self.index, base + ".index" + self.SAVE_TMP_SUFFIX)
+            replaced.append(".index")
+            
+            # Metadata as a columnar catalog
+            self.metadata.save(base + ".catalog" + self.SAVE_TMP_SUFFIX)
+            replaced.append(".catalog")
+            
+            # Full-precision vectors for re-ranking compressed indexes
+            if self.vectors is not None:
+                self.vectors.save(base + ".vectors.npy" + self.SAVE_TMP_SUFFIX)
+                replaced.append(".vectors.npy")
+            
+            # Category sub-indexes
+            if self.partitions is not None:
+                with open(base + ".partitions" + self.SAVE_TMP_SUFFIX, 'wb') as f:
+                    pickle.dump({
+                        value: {
+                            'rows': partition['rows'],
+                            'index': (faiss.serialize_index(partition['index'])
+                                      if partition['index'] is not None else None)
+                        }
+                        for value, partition in self.partitions.items()
+                    }, f)
+                replaced.append(".partitions")
+            else:
+                removed.append(".partitions")
+            
+            # Index settings
+            with open(base + ".pkl" + self.SAVE_TMP_SUFFIX, 'wb') as f:
+                pickle.dump({
+                    'metadata_format': 'columnar',
+                    'embedding_dim': self.embedding_dim,
+                    'index_type': self.index_type,
+                    'metric': self.metric,
+                    'search_params': self.get_search_params(),
+                    'build_params': self.build_params,
+                    'rerank_factor': self.rerank_factor,
+                    'full_vectors': self.vectors is not None,
+                    'partition_field': self.partition_field if self.partitions is not None else None,
+                    'partition_min_size': self.partition_min_size,
+                    'deleted_rows': np.flatnonzero(self._deleted)
+                }, f)
+                f.flush()
+                os.fsync(f.fileno())
+            replaced.append(".pkl")
+            
+            # Commit point: from here on the new snapshot wins
+            journal_path = base + ".commit"
+            with open(journal_path + self.SAVE_TMP_SUFFIX, 'w') as f:
+                json.dump({'replace': replaced, 'remove': removed}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(journal_path + self.SAVE_TMP_SUFFIX, journal_path)
+            self._finish_save(base)
+            
+            # Everything logged so far is now part of the snapshot
+            self.wal_path = base + ".wal"
+            self.path = base
         
         print(f"\n✓ Index saved to {filepath}")
-        print(f"  - Index file: {index_path}")
-        print(f"  - Metadata file: {metadata_path}")
+        print(f"  - Index file: {base}.index")
+        print(f"  - Catalog: {base}.catalog")
+        if self.vectors is not None:
+            print(f"  - Vectors file: {base}.vectors.npy")
+        if self.partitions is not None:
+            print(f"  - Category sub-indexes: {base}.partitions")
+        print(f"  - Settings file: {base}.pkl")
     
-    def load(self, filepath: str):
+    @classmethod
+    def _finish_save(cls, base: str) -> bool:
+        """
+        Move a committed snapshot's files into place and truncate the log.
+        
+        Safe to repeat: a crash part-way through is finished by the next call.
+        
+        Returns:
+            True if a committed save was pending
+        """
+        journal_path = base + ".commit"
+        if not os.path.exists(journal_path):
+            return False
+        with open(journal_path) as f:
+            journal = json.load(f)
+        
+        for suffix in journal['replace']:
+            target = base + suffix
+            tmp_path = target + cls.SAVE_TMP_SUFFIX
+            if not os.path.exists(tmp_path):
+                continue  # Already moved
+            if os.path.isdir(tmp_path):
+                # The catalog is a directory: park the old one, then swap
+                old_path = target + ".old"
+                if os.path.exists(target):
+                    if os.path.exists(old_path):
+                        shutil.rmtree(old_path)
+                    os.rename(target, old_path)
+                os.rename(tmp_path, target)
+                shutil.rmtree(old_path, ignore_errors=True)
+            else:
+                os.replace(tmp_path, target)
+        for suffix in journal['remove']:
+            if os.path.exists(base + suffix):
+                os.remove(base + suffix)
+        
+        open(base + ".wal", 'w').close()
+        os.remove(journal_path)
+        return True
+    
+    def load(self, filepath: str, mmap: bool = True):
         """
         Load index and metadata from disk.
         
         Args:
             filepath: Base path for loading (without extension)
+            mmap: Memory-map the catalog and stored vectors instead of reading them into RAM
         """
         filepath = Path(filepath)
         
+        # Complete a save that was interrupted after it committed
+        if self._finish_save(str(filepath)):
+            print(f"  - Completed an interrupted save of {filepath}")
+        
         # Load FAISS index
         index_path = str(filepath) + ".index"
         self.index = faiss.read_index(index_path)
         
-        # Load metadata
+        # Load settings
         metadata_path = str(filepath) + ".pkl"
         with open(metadata_path, 'rb') as f:
             data = pickle.load(f)
-            self.metadata = data['metadata']
             self.embedding_dim = data['embedding_dim']
         
+        # Memory-map the columnar catalog (older indexes pickled a list of dicts)
+        if data.get('metadata_format') == 'columnar':
+            self.metadata = ColumnarCatalog.open(str(filepath) + ".catalog", mmap=mmap)
+        else:
+            self.metadata = ColumnarCatalog.from_records(data['metadata'])
+        self.index_type = data.get('index_type')
+        self.build_params = data.get('build_params', {})
+        self.metric = data.get('metric', 'l2')
+        self.rerank_factor = data.get('rerank_factor', 0)
+        self.vectors = None
+        if data.get('full_vectors'):
+            self.vectors = VectorStore.open(str(filepath) + ".vectors.npy", mmap=mmap)
+        self._on_contents_changed()
+        if data.get('partition_field'):
+            with open(str(filepath) + ".partitions", 'rb') as f:
+                self.partitions = {
+                    value: {
+                        'rows': partition['rows'],
+                        'index': (faiss.deserialize_index(partition['index'])
+                                  if partition['index'] is not None else None)
+                    }
+                    for value, partition in pickle.load(f).items()
+                }
+            self.partition_field = data['partition_field']
+            self.partition_min_size = data.get('partition_min_size')
+        search_params = data.get('search_params', {})
+        self.set_search_params(efSearch=search_params.get('efSearch'), nprobe=search_params.get('nprobe'))
+        for row in data.get('deleted_rows', []):
+            self._tombstone(int(row))
+        
+        # Apply updates made since the snapshot was written
+        self.path = str(filepath)
+        self.wal_path = str(filepath) + ".wal"
+        replayed = self._replay_log()
+        
+        # Search settings from the last tuning run
+        tuned = self.apply_tuning(str(filepath) + self.TUNING_SUFFIX)
+        
         print(f"\n✓ Index loaded from {filepath}")
         print(f"  - Total items: {self.index.ntotal}")
         print(f"  - Embedding dim: {self.embedding_dim}")
+        if tuned:
+            print(f"  - Applied tuned search params: {self.get_search_params()}")
+        if replayed:
+            print(f"  - Replayed {replayed} logged updates")
     
     def get_stats(self) -> dict:
         """Return statistics about the index."""
         return {
             'total_items': self.index.ntotal if self.index else 0,
             'embedding_dim': self.embedding_dim,
-            'metadata_count': len(self.metadata)
+            'metadata_count': len(self.metadata),
+            'deleted_items': self.num_deleted,
+            'live_items': (self.index.ntotal if self.index else 0) - self.num_deleted,
+            'generation': self.generation,
+            'index_type': self.index_type,
+            'metric': self.metric,
+            'rerank_factor': self.rerank_factor if self.vectors is not None else 0,
+            'search_params': self.get_search_params(),
+            'partitions': len(self.partitions) if self.partitions is not None else 0
         }
 
 
@@ -0,0 +1,251 @@
+"""
+Image Store Module
+Reads product images from a local directory or tarball and encodes them
+with checkpointed progress, so image indexing never needs the network
+"""
+
+import json
+import os
+import shutil
+import tarfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlparse
+
+import numpy as np
+from tqdm import tqdm
+
+from catalog_store import catalog_digest
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+
+# Products encoded between checkpoints
+DEFAULT_CHECKPOINT_EVERY = 4096
+
+
+class LocalImageStore:
+    """
+    Product images from a directory tree or a tar archive.
+
+    An image is matched to a product by file name (without extension):
+    the product's `image_path` if set, else its id, else the last path
+    segment of its `image_url`. Directory images are handed to the encoder
+    as paths; tarball members are read as bytes. Either way the decoding
+    happens on the encoder's preprocessing pool. Use an uncompressed .tar
+    for very large archives, because compressed tarballs cannot seek to a
+    member cheaply.
+    """
+
+    def __init__(self, source: Union[str, Path]):
+        """
+        Index the images available in `source`.
+
+        Args:
+            source: Directory of images, or a .tar / .tar.gz archive
+        """
+        self.source = Path(source)
+        self._tar = None
+        self._files: Dict[str, Union[Path, tarfile.TarInfo]] = {}
+
+        if self.source.is_dir():
+            for path in self.source.rglob('*'):
+                if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file():
+                    self._files.setdefault(path.stem, path)
+        elif self.source.is_file() and tarfile.is_tarfile(self.source):
+            self._tar = tarfile.open(self.source)
+            for member in self._tar:
+                name = Path(member.name)
+                if member.isfile() and name.suffix.lower() in IMAGE_EXTENSIONS:
+                    self._files.setdefault(name.stem, member)
+        else:
+            raise FileNotFoundError(f"Image source must be a directory or tarball: {source}")
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def locate(self, product: dict) -> Optional[str]:
+        """Key of the product's image in the store, or None if it has none."""
+        candidates = []
+        if product.get('image_path'):
+            candidates.append(Path(str(product['image_path'])).stem)
+        if product.get('id') is not None:
+            candidates.append(str(product['id']))
+        if product.get('image_url'):
+            candidates.append(Path(urlparse(str(product['image_url'])).path).stem)
+
+        for key in candidates:
+            if key in self._files:
+                return key
+        return None
+
+    def load(self, key: str) -> Union[str, bytes]:
+        """Image path (directory store) or raw image bytes (tarball store)."""
+        entry = self._files[key]
+        if self._tar is None:
+            return str(entry)
+        return self._tar.extractfile(entry).read()
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+
+
+def encode_product_images(encoder, products: list, store: LocalImageStore, checkpoint_path: Union[str, Path],
+                          batch_size: int = 64,
+                          checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode every product image found in the store, resuming from a checkpoint.
+
+    Embeddings are written into a memory-mapped `<checkpoint_path>.npy`
+    and `<checkpoint_path>.found.npy` marks which rows have an image.
+    `<checkpoint_path>.progress.json` records how many products are done.
+    The progress file is replaced only after the arrays are flushed. An
+    interrupted build for the same catalog, model and source continues
+    from the last checkpoint.
+
+    Args:
+        encoder: CLIPEncoder instance
+        products: List of product dictionaries
+        store: Where the images are read from
+        checkpoint_path: Base path of the image embedding files
+        batch_size: Images per CLIP forward pass
+        checkpoint_every: Products encoded between checkpoints
+
+    Returns:
+        (embeddings, found): image embeddings (zero rows where an image is
+        missing or unreadable) and a boolean mask of rows that have one
+    """
+    checkpoint_path = Path(checkpoint_path)
+    vectors_path = checkpoint_path.with_suffix('.npy')
+    found_path = checkpoint_path.with_suffix('.found.npy')
+    progress_path = checkpoint_path.with_suffix('.progress.json')
+
+    num_products, dim = len(products), encoder.get_embedding_dim()
+    state = {
+        'num_products': num_products,
+        'embedding_dim': dim,
+        'model': encoder.model_name,
+        'source': str(store.source.resolve()),
+        'catalog': catalog_digest(products),
+        'completed': 0,
+        'missing': 0,
+        'failed_ids': []
+    }
+
+    done = 0
+    if progress_path.exists() and vectors_path.exists() and found_path.exists():
+        with open(progress_path) as f:
+            saved = json.load(f)
+        if all(saved.get(key) == state[key] for key in ('num_products', 'embedding_dim', 'model', 'source', 'catalog')):
+            state, done = saved, saved['completed']
+            print(f"✓ Resuming image encoding at {done}/{num_products}")
+
+    if done:
+        embeddings = np.load(vectors_path, mmap_mode='r+')
+        found = np.load(found_path, mmap_mode='r+')
+    else:
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        embeddings = np.lib.format.open_memmap(vectors_path, mode='w+', dtype='float32', shape=(num_products, dim))
+        found = np.lib.format.open_memmap(found_path, mode='w+', dtype=bool, shape=(num_products,))
+
+    with tqdm(total=num_products, initial=done, desc="Encoding images") as progress:
+        for start in range(done, num_products, checkpoint_every):
+            stop = min(start + checkpoint_every, num_products)
+            rows, images = [], []
+            for row in range(start, stop):
+                key = store.locate(products[row])
+                if key is not None:
+                    rows.append(row)
+                    images.append(store.load(key))
+
+            found[start:stop] = False
+            embeddings[start:stop] = 0
+            if images:
+                encoded, kept, failures = encoder.encode_images_with_report(images, batch_size=batch_size)
+                embeddings[np.asarray(rows)[kept]] = encoded
+                found[np.asarray(rows)[kept]] = True
+                state['failed_ids'] += [products[rows[failure['index']]].get('id') for failure in failures]
+            state['missing'] += (stop - start) - len(images)
+
+            embeddings.flush()
+            found.flush()
+            state['completed'] = stop
+            tmp_path = progress_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, progress_path)
+            progress.update(stop - start)
+
+    print(f"✓ Image embeddings for {int(found.sum())}/{num_products} products "
+          f"({state['missing']} without an image, {len(state['failed_ids'])} unreadable)")
+    return embeddings, found
+
+
+def fuse_embeddings(text_embeddings: np.ndarray, image_embeddings: np.ndarray, found: np.ndarray,
+                    image_weight: float = 0.5, chunk_size: int = 65536) -> np.ndarray:
+    """
+    Weighted sum of text and image vectors, re-normalized.
+
+    Products without an image keep their text vector. image_weight=0 gives
+    a text-only index and 1 gives an image-only one wherever an image exists.
+
+    Args:
+        text_embeddings: Normalized text vectors (num_products x dim)
+        image_embeddings: Normalized image vectors, same shape
+        found: Rows that have an image vector
+        image_weight: Share of the image vector in the fused vector
+        chunk_size: Rows fused at a time (bounds temporary memory)
+
+    Returns:
+        Fused, normalized vectors (num_products x dim)
+    """
+    if not 0.0 <= image_weight <= 1.0:
+        raise ValueError("image_weight must be between 0 and 1")
+
+    fused = np.array(text_embeddings, dtype='float32')
+    for start in range(0, len(fused), chunk_size):
+        stop = start + chunk_size
+        rows = start + np.flatnonzero(found[start:stop])
+        if len(rows) == 0:
+            continue
+        mixed = (1.0 - image_weight) * fused[rows] + image_weight * image_embeddings[rows]
+        norms = np.linalg.norm(mixed, axis=1, keepdims=True)
+        # Opposite text/image vectors cancel out; keep the text vector then
+        usable = norms[:, 0] > 1e-6
+        fused[rows[usable]] = mixed[usable] / norms[usable]
+    return fused
+
+
+def fuse_embedding_chunks(text_chunks: Sequence[np.ndarray], image_embeddings: np.ndarray, found: np.ndarray,
+                          out_dir: Union[str, Path], image_weight: float = 0.5) -> List[np.ndarray]:
+    """
+    fuse_embeddings() one chunk (e.g. embedding shard) at a time.
+
+    Each fused chunk is written to out_dir and memory-mapped back, so the
+    vectors of the whole catalog are never held in RAM together.
+
+    Args:
+        text_chunks: Normalized text vectors as row chunks, in product order
+        image_embeddings: Normalized image vectors for every product
+        found: Rows that have an image vector
+        out_dir: Directory for the fused chunks (replaced)
+        image_weight: Share of the image vector in the fused vector
+
+    Returns:
+        Memory-mapped fused chunks aligned with text_chunks
+    """
+    out_dir = Path(out_dir)
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    out_dir.mkdir(parents=True)
+
+    fused, start = [], 0
+    for i, chunk in enumerate(text_chunks):
+        stop = start + len(chunk)
+        path = out_dir / f"chunk_{i:05d}.npy"
+        np.save(path, fuse_embeddings(chunk, image_embeddings[start:stop], found[start:stop], image_weight))
+        fused.append(np.load(path, mmap_mode='r'))
+        start = stop
+    return fused
@@ -0,0 +1,246 @@
+"""
+Index Manager Module
+Loads new index versions in the background and hot-swaps them into the API
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from faiss_index import FAISSIndex
+
+
+# Generations kept on disk by prune_generations(): the active one and the
+# one before it, which a server may still be serving until it swaps
+GENERATIONS_KEPT = 2
+
+
+def new_version() -> str:
+    """Return a version string for an index about to be built."""
+    return datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+
+def generation_path(index_path: str, version: str) -> str:
+    """
+    Base path a version of the index is saved under.
+
+    Every build writes a new generation (e.g. products.v<version>.index,
+    with its own WAL) instead of overwriting the files a running server
+    has loaded and keeps appending updates to.
+    """
+    return f"{index_path}.v{version}"
+
+
+def publish_version(index_path: str, version: str) -> str:
+    """
+    Make a saved generation the active version of the index.
+
+    Call this after FAISSIndex.save(generation_path(index_path, version))
+    has finished writing every file. The version file is replaced
+    atomically, so watchers never see a half-written index.
+
+    Args:
+        index_path: Base path of the index (without extension)
+        version: Version of the saved generation, from new_version()
+
+    Returns:
+        The published version string
+    """
+    version_path = Path(str(index_path) + ".version")
+    tmp_path = version_path.with_name(version_path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'version': version,
+            'path': Path(generation_path(index_path, version)).name,
+            'published_at': time.time()
+        }, f)
+    os.replace(tmp_path, version_path)
+    return version
+
+
+def active_generation(index_path: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Return the published version of an index on disk and the base path to
+    load it from.
+
+    Indexes saved before versions had their own paths are loaded from
+    index_path itself. Both are None when there is no index.
+    """
+    index_path = Path(index_path)
+    try:
+        with open(str(index_path) + ".version") as f:
+            published = json.load(f)
+        version = published['version']
+    except (OSError, ValueError, KeyError):
+        published, version = {}, None
+
+    if 'path' in published:
+        return version, str(index_path.parent / published['path'])
+    if Path(str(index_path) + ".index").exists():
+        return version, str(index_path)
+    return None, None
+
+
+def read_version(index_path: str) -> Optional[str]:
+    """Return the published version of an index on disk, or None."""
+    return active_generation(index_path)[0]
+
+
+def prune_generations(index_path: str, keep: int = GENERATIONS_KEPT) -> List[str]:
+    """
+    Delete the files of all but the newest `keep` generations.
+
+    The active generation is never deleted.
+
+    Returns:
+        The versions that were removed
+    """
+    index_path = Path(index_path)
+    active = read_version(index_path)
+    prefix = index_path.name + ".v"
+    version_file = index_path.name + ".version"
+    # Versions sort by build time; they contain no dots
+    versions = sorted({path.name[len(prefix):].split('.')[0]
+                       for path in index_path.parent.glob(prefix + "*")
+                       if not path.name.startswith(version_file)})
+    stale = [version for version in versions[:-keep] if version != active]
+    for version in stale:
+        for path in index_path.parent.glob(f"{prefix}{version}.*"):
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+    return stale
+
+
+class IndexManager:
+    """
+    Holds the active FAISSIndex and replaces it when a new version is
+    published on disk.
+
+    Handlers grab `manager.current` once per request and use that object
+    throughout, so a swap never affects requests already in flight; the
+    old index is freed once the last of them finishes.
+    """
+
+    def __init__(self, index_path: str, embedding_dim: int = 512, poll_interval: float = 10.0):
+        """
+        Initialize manager.
+
+        Args:
+            index_path: Base path of the index (without extension)
+            embedding_dim: Dimension of embedding vectors
+            poll_interval: Seconds between checks for a new version (0 disables watching)
+        """
+        self.index_path = Path(index_path)
+        self.embedding_dim = embedding_dim
+        self.poll_interval = poll_interval
+
+        self._current = FAISSIndex(embedding_dim=embedding_dim)
+        self.version = None
+        self.loaded_at = None
+        self.swaps = 0
+        self.last_error = None
+
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def current(self) -> FAISSIndex:
+        """The index new requests should use."""
+        return self._current
+
+    def exists(self) -> bool:
+        """True if an index has been built at index_path."""
+        path = active_generation(self.index_path)[1]
+        return path is not None and Path(path + ".index").exists()
+
+    def _load(self) -> bool:
+        """Load the on-disk index into a fresh object and swap it in."""
+        with self._reload_lock:
+            version, path = active_generation(self.index_path)
+            start = time.perf_counter()
+
+            new_index = FAISSIndex(embedding_dim=self.embedding_dim)
+            new_index.load(path)
+            if path != str(self.index_path):
+                # tune_index.py writes its settings next to the base path
+                new_index.apply_tuning(str(self.index_path) + FAISSIndex.TUNING_SUFFIX)
+
+            # Single reference assignment: atomic for concurrent readers
+            self._current = new_index
+            self.version = version or "unversioned"
+            self.loaded_at = time.time()
+            self.swaps += 1
+            self.last_error = None
+
+            print(f"✓ Activated index version {self.version} "
+                  f"({new_index.index.ntotal} items, {time.perf_counter() - start:.2f}s)")
+            return True
+
+    def load(self) -> bool:
+        """
+        Load the index from disk (blocking).
+
+        Returns:
+            True if an index was loaded
+        """
+        if not self.exists():
+            return False
+        return self._load()
+
+    def reload_if_changed(self) -> bool:
+        """
+        Load the index again if a different version has been published.
+
+        Returns:
+            True if a new version was activated
+        """
+        version = read_version(self.index_path)
+        if version is None or version == self.version or not self.exists():
+            return False
+        try:
+            return self._load()
+        except Exception as e:
+            # Keep serving the current index
+            self.last_error = f"{version}: {e}"
+            print(f"⚠ Failed to load index version {version}: {e}")
+            return False
+
+    def start(self):
+        """Start watching for new versions on the running event loop."""
+        if self.poll_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        """Stop watching."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            # Loading reads files and rebuilds structures: keep it off the loop
+            await loop.run_in_executor(None, self.reload_if_changed)
+
+    def get_stats(self) -> dict:
+        """Return information about the active version."""
+        return {
+            'active_version': self.version,
+            'loaded_at': self.loaded_at,
+            'swaps': self.swaps,
+            'poll_interval': self.poll_interval,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,178 @@
+"""
+Inference Executor Module
+Runs blocking CLIP inference, image decoding and FAISS search off the asyncio event loop
+"""
+
+import asyncio
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when the executor's queue is full and a request must be rejected."""
+
+
+def decode_image(contents: bytes) -> Image.Image:
+    """Decode uploaded image bytes into an RGB PIL Image."""
+    return Image.open(io.BytesIO(contents)).convert('RGB')
+
+
+# Per-process encoder used when the executor runs in process mode
+_worker_encoder = None
+
+
+def _init_worker(model_name: str, num_threads: int, traced_path: Optional[str] = None,
+                 warmup_queries: Iterable[str] = ()):
+    """Load a private CLIP model copy in each worker process and warm its query cache."""
+    global _worker_encoder
+    import torch
+    from clip_encoder import CLIPEncoder
+
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    _worker_encoder = CLIPEncoder(model_name=model_name, device="cpu", traced_path=traced_path)
+    _worker_encoder.warm_text_cache(warmup_queries)
+
+
+def _worker_encode_texts(texts: List[str], use_cache: bool = True) -> np.ndarray:
+    return _worker_encoder.encode_texts_batch(texts, use_cache=use_cache)
+
+
+def _worker_encode_images(images: List[Image.Image]) -> np.ndarray:
+    return _worker_encoder.encode_images_batch(images, batch_size=len(images))
+
+
+class InferenceExecutor:
+    """
+    Bounded executor for heavy request work.
+
+    Image decoding and index search always run on a thread pool (PIL and
+    FAISS release the GIL). Model inference runs either on the same thread
+    pool against a shared encoder ("thread" mode) or on a process pool where
+    every worker holds its own model copy ("process" mode). Once
+    `max_workers + max_queue` tasks are in flight, new work is rejected with
+    ServerBusyError instead of piling up.
+    """
+
+    def __init__(self, encoder=None, mode: str = "thread", max_workers: int = 4,
+                 max_queue: int = 64, model_name: str = "ViT-B/32",
+                 threads_per_process: int = 1, traced_path: Optional[str] = None,
+                 warmup_queries: Iterable[str] = ()):
+        """
+        Initialize executor.
+
+        Args:
+            encoder: Shared CLIPEncoder (required in thread mode)
+            mode: "thread" or "process"
+            max_workers: Number of pool workers
+            max_queue: Number of tasks allowed to wait for a free worker
+            model_name: CLIP model loaded by each worker in process mode
+            threads_per_process: torch intra-op threads per worker process
+            traced_path: Traced encoder for worker processes to load (see
+                         CLIPEncoder.export_traced)
+            warmup_queries: Queries each worker process pre-encodes into its
+                            own cache (the shared encoder is warmed by the caller)
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        if mode == "thread" and encoder is None:
+            raise ValueError("Thread mode requires a shared encoder")
+
+        self.encoder = encoder
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+
+        self.thread_pool = ThreadPoolExecutor(max_workers=max_workers,
+                                              thread_name_prefix="search-worker")
+        if mode == "process":
+            # Spawn, not fork: the parent has already started torch's thread
+            # pools, and forking after that can deadlock the workers
+            self.model_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_name, threads_per_process, traced_path, list(warmup_queries))
+            )
+        else:
+            self.model_pool = self.thread_pool
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ServerBusyError("Server busy, try again later")
+            self._in_flight += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self.completed += 1
+
+    async def _submit(self, pool, fn: Callable, *args) -> Any:
+        self._acquire()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            self._release()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        Run a blocking function (decode, search, ...) on the thread pool.
+
+        Raises:
+            ServerBusyError: If the queue is full
+        """
+        return await self._submit(self.thread_pool, fn, *args)
+
+    async def decode_image(self, contents: bytes) -> Image.Image:
+        """Decode uploaded image bytes off the event loop."""
+        return await self.run(decode_image, contents)
+
+    async def decode_images(self, contents: List[bytes]) -> List[Image.Image]:
+        """Decode a batch of uploaded images as a single executor task."""
+        return await self.run(lambda batch: [decode_image(data) for data in batch], contents)
+
+    async def encode_texts(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """Encode a batch of texts on the model pool."""
+        if self.mode == "process":
+            return await self._submit(self.model_pool, _worker_encode_texts, texts, use_cache)
+        return await self._submit(self.model_pool, self.encoder.encode_texts_batch, texts, use_cache)
+
+    async def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        """Encode a batch of PIL images on the model pool."""
+        if self.mode == "process":
+            return await self._submit(self.model_pool, _worker_encode_images, images)
+        return await self._submit(
+            self.model_pool,
+            lambda batch: self.encoder.encode_images_batch(batch, batch_size=len(batch)),
+            images
+        )
+
+    def shutdown(self):
+        """Shut down the worker pools."""
+        self.thread_pool.shutdown(wait=False, cancel_futures=True)
+        if self.model_pool is not self.thread_pool:
+            self.model_pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        """Return executor statistics."""
+        return {
+            'mode': self.mode,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self._in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected
+        }
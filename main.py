@@ -1,19 +1,28 @@
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from PIL import Image
-import io
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import importlib
+import json
+import os
+import secrets
 import sys
+import time
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Union
 
 # Add project root to path
 project_root = Path(__file__).parent.parent.parent
 sys.path.insert(0, str(project_root))
 
-from clip_encoder import CLIPEncoder
 from faiss_index import FAISSIndex
+from index_manager import IndexManager
+from sharded_index import ShardedIndex
+from batch_scheduler import EncoderBatchScheduler
+from inference_executor import InferenceExecutor, ServerBusyError
+from cache import TTLCache
+from catalog_store import product_text
 
 
 # Initialize FastAPI app
@@ -34,35 +43,154 @@ app.add_middleware(
 
 # Global variables for models
 encoder = None
-index = None
+scheduler = None
+executor = None
+compaction_task = None
 INDEX_PATH = Path("data/index/products")
 
+# Hot swap: a newly published index version is loaded in the background
+# and replaces the active one without a restart
+index_manager = None
+INDEX_POLL_INTERVAL = float(os.environ.get("SEARCH_INDEX_POLL_INTERVAL", 10))
+
+# Sharded serving (build with build_index.py --index-shards N): "local"
+# starts one shard server process per shard, or give running shard servers
+# as "host:port,host:port,...". Queries are scattered to every shard.
+sharded_index = None
+INDEX_SHARDS = os.environ.get("SEARCH_SHARDS", "")
+SHARD_LAYOUT_PATH = Path("data/index/shards/layout.json")
+
+# Micro-batching: concurrent encode requests are grouped into one forward pass
+BATCH_MAX_SIZE = int(os.environ.get("SEARCH_BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("SEARCH_BATCH_MAX_WAIT_MS", 5.0))
+
+# Executor: inference, image decoding and FAISS search run off the event loop.
+# "process" mode gives every worker its own CLIP model copy.
+EXECUTOR_MODE = os.environ.get("SEARCH_EXECUTOR_MODE", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("SEARCH_EXECUTOR_WORKERS", 4))
+EXECUTOR_MAX_QUEUE = int(os.environ.get("SEARCH_EXECUTOR_MAX_QUEUE", 64))
+
+# Bulk search: queries are encoded and searched in chunks so NDJSON lines
+# stream back while later chunks are still being processed
+BATCH_SEARCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_SEARCH_MAX_QUERIES", 10000))
+BATCH_SEARCH_CHUNK_SIZE = int(os.environ.get("SEARCH_BATCH_SEARCH_CHUNK_SIZE", 256))
+
+# Text query embedding cache
+EMBEDDING_CACHE_SIZE = int(os.environ.get("SEARCH_EMBEDDING_CACHE_SIZE", 10000))
+EMBEDDING_CACHE_TTL = float(os.environ.get("SEARCH_EMBEDDING_CACHE_TTL", 3600))
+WARMUP_QUERIES_PATH = Path("data/warmup_queries.txt")  # One query per line
+
+# Final result lists for text searches. Keys include the index generation,
+# so entries from before a rebuild/reload/update are never served.
+RESULT_CACHE_SIZE = int(os.environ.get("SEARCH_RESULT_CACHE_SIZE", 5000))
+RESULT_CACHE_TTL = float(os.environ.get("SEARCH_RESULT_CACHE_TTL", 300))
+result_cache = TTLCache(max_size=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL or None)
+
+# Cold start: torch/CLIP are imported only when the encoder loads, which
+# runs in parallel with index loading. A traced encoder exported with
+# `python clip_encoder.py --export PATH` skips re-reading the CLIP checkpoint.
+ENCODER_ARTIFACT_PATH = Path(os.environ.get("SEARCH_ENCODER_ARTIFACT", "data/models/clip_vit_b32.pt"))
+startup_timings = {}  # Startup phase -> seconds
+startup_complete = False
+
+# /admin endpoints require this token in the X-Admin-Token header; they are
+# disabled while it is unset
+ADMIN_TOKEN = os.environ.get("SEARCH_ADMIN_TOKEN", "")
+
+POPULAR_TERMS = [
+    "blue shirt", "black shoes", "leather jacket", "running shoes", "denim jeans",
+    "white sneakers", "brown wallet", "black hoodie", "red dress", "gray sweatshirt",
+    "leather boots", "cotton t-shirt", "baseball cap", "crossbody bag", "wireless earbuds"
+]
+
+
+def _timed(phase: str, fn, *args):
+    """Run fn(*args), recording its duration in startup_timings."""
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        startup_timings[phase] = round(time.perf_counter() - start, 3)
+
+
+def load_encoder():
+    """Import torch/CLIP and load the encoder (traced artifact if present)."""
+    CLIPEncoder = _timed('encoder_imports', importlib.import_module, 'clip_encoder').CLIPEncoder
+    return CLIPEncoder(
+        model_name="ViT-B/32",
+        cache_size=EMBEDDING_CACHE_SIZE,
+        cache_ttl=EMBEDDING_CACHE_TTL or None,
+        traced_path=str(ENCODER_ARTIFACT_PATH)
+    )
+
+
+def load_index():
+    """Connect to the index shards, or load the local index (blocking)."""
+    global index_manager, sharded_index
+    
+    if INDEX_SHARDS:
+        if INDEX_SHARDS == "local":
+            sharded_index = ShardedIndex.launch_local(SHARD_LAYOUT_PATH)
+        else:
+            sharded_index = ShardedIndex.connect([address.strip() for address in INDEX_SHARDS.split(',')])
+        print(f"✓ Connected to {len(sharded_index.clients)} index shards "
+              f"with {len(sharded_index.metadata)} products")
+    else:
+        index_manager = IndexManager(INDEX_PATH, embedding_dim=512, poll_interval=INDEX_POLL_INTERVAL)
+        
+        if index_manager.load():
+            print(f"✓ Loaded index with {index_manager.current.index.ntotal} products")
+        else:
+            print("⚠ Warning: No index found!")
+            print(f"  Please run: python build_index.py")
+            print(f"  Expected location: {INDEX_PATH}")
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize models on startup"""
-    global encoder, index
+    global encoder, scheduler, executor, startup_complete
     
     print("\n" + "="*60)
     print("Starting Multimodal Product Search API")
     print("="*60)
+    started = time.perf_counter()
+    startup_timings.clear()
     
-    # Load CLIP encoder
-    print("\n1. Loading CLIP encoder...")
-    encoder = CLIPEncoder(model_name="ViT-B/32")
+    # Model and index load concurrently (both mostly run outside the GIL)
+    print("\n1. Loading CLIP encoder and product index in parallel...")
+    loop = asyncio.get_running_loop()
+    encoder, _ = await asyncio.gather(
+        loop.run_in_executor(None, _timed, 'encoder', load_encoder),
+        loop.run_in_executor(None, _timed, 'index', load_index)
+    )
+    if index_manager:
+        index_manager.start()
     
-    # Load FAISS index
-    print("\n2. Loading product index...")
-    index = FAISSIndex(embedding_dim=512)
-    
-    if INDEX_PATH.with_suffix('.index').exists():
-        index.load(str(INDEX_PATH))
-        print(f"✓ Loaded index with {index.index.ntotal} products")
-    else:
-        print("⚠ Warning: No index found!")
-        print(f"  Please run: python build_index.py")
-        print(f"  Expected location: {INDEX_PATH}")
+    # Warm the embedding cache with known popular queries
+    print("\n2. Warming up...")
+    warmup_queries = list(POPULAR_TERMS)
+    if WARMUP_QUERIES_PATH.exists():
+        warmup_queries += WARMUP_QUERIES_PATH.read_text().splitlines()
+    warmed = _timed('warmup', encoder.warm_text_cache, warmup_queries)
+    print(f"✓ Warmed embedding cache with {warmed} queries")
+    executor = InferenceExecutor(
+        encoder,
+        mode=EXECUTOR_MODE,
+        max_workers=EXECUTOR_WORKERS,
+        max_queue=EXECUTOR_MAX_QUEUE,
+        model_name="ViT-B/32",
+        traced_path=str(ENCODER_ARTIFACT_PATH),
+        warmup_queries=warmup_queries
+    )
+    scheduler = EncoderBatchScheduler(
+        executor, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS
+    )
+    scheduler.start()
+    startup_timings['total'] = round(time.perf_counter() - started, 3)
+    startup_complete = True
     
+    print(f"\n⏱  Startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items()))
     print("\n" + "="*60)
     print("✓ API Ready!")
     print("="*60)
@@ -70,10 +198,86 @@ async def startup_event():
     print("="*60 + "\n")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    global startup_complete
+    startup_complete = False  # Fail readiness while draining
+    if index_manager:
+        await index_manager.stop()
+    if sharded_index:
+        sharded_index.close()
+    if scheduler:
+        await scheduler.stop()
+    if executor:
+        executor.shutdown()
+
+
+def current_index() -> Optional[Union[FAISSIndex, ShardedIndex]]:
+    """
+    Index for the current request. Handlers fetch it once, so a hot swap
+    never changes the index underneath a request in flight.
+    """
+    if sharded_index:
+        return sharded_index
+    return index_manager.current if index_manager else None
+
+
+def search_effort(profile: str, ef_search: Optional[int], nprobe: Optional[int]):
+    """
+    Per-request search effort for FAISSIndex.search(): explicit efSearch /
+    nprobe values take precedence over the named profile.
+    
+    Returns:
+        A profile name or a dict of explicit values (hashable via cache_token)
+    """
+    if ef_search is not None or nprobe is not None:
+        if any(value is not None and value < 1 for value in (ef_search, nprobe)):
+            raise HTTPException(400, "ef_search and nprobe must be positive")
+        return {'efSearch': ef_search, 'nprobe': nprobe}
+    if profile not in FAISSIndex.SEARCH_PROFILES:
+        raise HTTPException(400, f"Unknown profile '{profile}', "
+                                 f"choose from {', '.join(FAISSIndex.SEARCH_PROFILES)}")
+    return profile
+
+
+def cache_token(effort) -> tuple:
+    """Hashable form of a search effort for result-cache keys."""
+    return tuple(effort.items()) if isinstance(effort, dict) else (effort,)
+
+
+def parse_fields(fields: str) -> Optional[List[str]]:
+    """Comma-separated field projection ("" = every field)."""
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    return names or None
+
+
+def search_dicts(index: FAISSIndex, query_embedding, k: int, filters=None, min_score=None,
+                 effort=None, fields=None) -> List[dict]:
+    """Search and materialize only the requested fields (runs on the executor)."""
+    return index.search(query_embedding, k, filters, min_score, effort).to_dicts(fields)
+
+
+def search_batch_dicts(index: FAISSIndex, query_embeddings, k: int, min_score=None,
+                       effort=None, fields=None) -> List[List[dict]]:
+    """One search_batch call for a chunk of queries (runs on the executor)."""
+    return [results.to_dicts(fields)
+            for results in index.search_batch(query_embeddings, k, min_score, effort)]
+
+
+async def index_stats(index) -> dict:
+    """index.get_stats() off the event loop: a sharded index asks every shard server."""
+    return await executor.run(index.get_stats)
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    stats = index.get_stats() if index else {'total_items': 0}
+    index = current_index()
+    try:
+        stats = await index_stats(index) if index and executor else {'total_items': 0}
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     return {
         "status": "online",
         "message": "Multimodal Product Search API",
@@ -82,10 +286,32 @@ async def root():
     }
 
 
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe: 200 only once the encoder and an index are both
+    loaded, so load balancers never route to a half-initialized worker.
+    """
+    # The manager always holds an (empty) index; version is set once one is activated
+    index_loaded = sharded_index is not None or (index_manager is not None and index_manager.version is not None)
+    status = {
+        "ready": startup_complete and index_loaded,
+        "encoder_loaded": encoder is not None,
+        "index_loaded": index_loaded,
+        "startup_timings": startup_timings
+    }
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
 @app.post("/search/image")
 async def search_by_image(
     file: UploadFile = File(...),
-    k: int = Form(10)
+    k: int = Form(10),
+    min_score: Optional[float] = Form(None),
+    profile: str = Form("balanced"),
+    ef_search: Optional[int] = Form(None),
+    nprobe: Optional[int] = Form(None),
+    fields: str = Form("")
 ):
     """
     Search products by image.
@@ -93,7 +319,15 @@ async def search_by_image(
     Args:
         file: Image file (PNG, JPG, JPEG)
         k: Number of results to return
+        min_score: Minimum cosine similarity of returned results
+        profile: Search effort - "fast", "balanced" or "exact"
+        ef_search: Explicit HNSW efSearch (overrides profile)
+        nprobe: Explicit IVF nprobe (overrides profile)
+        fields: Comma-separated product fields to return (default: all)
     """
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
     try:
         # Validate file type
         if not file.content_type.startswith('image/'):
@@ -101,13 +335,15 @@ async def search_by_image(
         
         # Read and process image
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
+        image = await executor.decode_image(contents)
         
         # Generate embedding
-        query_embedding = encoder.encode_image(image)
+        query_embedding = await scheduler.encode_image(image)
         
         # Search
-        results = index.search(query_embedding, k=k)
+        results = await executor.run(
+            search_dicts, index, query_embedding, k, None, min_score, effort, field_list
+        )
         
         return {
             "query_type": "image",
@@ -115,6 +351,8 @@ async def search_by_image(
             "results": results
         }
         
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
         raise HTTPException(500, f"Search failed: {str(e)}")
 
@@ -122,7 +360,12 @@ async def search_by_image(
 @app.post("/search/text")
 async def search_by_text(
     query: str = Form(...),
-    k: int = Form(10)
+    k: int = Form(10),
+    min_score: Optional[float] = Form(None),
+    profile: str = Form("balanced"),
+    ef_search: Optional[int] = Form(None),
+    nprobe: Optional[int] = Form(None),
+    fields: str = Form("")
 ):
     """
     Search products by text description.
@@ -130,16 +373,33 @@ async def search_by_text(
     Args:
         query: Text description of desired product
         k: Number of results to return
+        min_score: Minimum cosine similarity of returned results
+        profile: Search effort - "fast", "balanced" or "exact"
+        ef_search: Explicit HNSW efSearch (overrides profile)
+        nprobe: Explicit IVF nprobe (overrides profile)
+        fields: Comma-separated product fields to return (default: all)
     """
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
     try:
         if not query.strip():
             raise HTTPException(400, "Query cannot be empty")
         
-        # Generate embedding
-        query_embedding = encoder.encode_text(query)
+        # Repeat queries against the same index generation skip encode + search
+        cache_key = ("text", encoder.text_cache_key(query), k, min_score,
+                     cache_token(effort), tuple(field_list or ()), index.generation)
+        results = result_cache.get(cache_key)
         
-        # Search
-        results = index.search(query_embedding, k=k)
+        if results is None:
+            # Generate embedding
+            query_embedding = await scheduler.encode_text(query)
+            
+            # Search
+            results = await executor.run(
+                search_dicts, index, query_embedding, k, None, min_score, effort, field_list
+            )
+            result_cache.put(cache_key, results)
         
         return {
             "query_type": "text",
@@ -148,6 +408,8 @@ async def search_by_text(
             "results": results
         }
         
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
         raise HTTPException(500, f"Search failed: {str(e)}")
 
@@ -157,7 +419,12 @@ async def hybrid_search(
     file: UploadFile = File(...),
     query: str = Form(...),
     alpha: float = Form(0.5),
-    k: int = Form(10)
+    k: int = Form(10),
+    min_score: Optional[float] = Form(None),
+    profile: str = Form("balanced"),
+    ef_search: Optional[int] = Form(None),
+    nprobe: Optional[int] = Form(None),
+    fields: str = Form("")
 ):
     """
     Hybrid search combining image and text.
@@ -167,7 +434,15 @@ async def hybrid_search(
         query: Text description
         alpha: Weight for image (0-1). Text weight = 1-alpha
         k: Number of results to return
+        min_score: Minimum cosine similarity of returned results
+        profile: Search effort - "fast", "balanced" or "exact"
+        ef_search: Explicit HNSW efSearch (overrides profile)
+        nprobe: Explicit IVF nprobe (overrides profile)
+        fields: Comma-separated product fields to return (default: all)
     """
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
     try:
         # Validate inputs
         if not file.content_type.startswith('image/'):
@@ -179,11 +454,12 @@ async def hybrid_search(
         
         # Read and process image
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
+        image = await executor.decode_image(contents)
         
         # Generate embeddings
-        image_embedding = encoder.encode_image(image)
-        text_embedding = encoder.encode_text(query)
+        image_embedding, text_embedding = await asyncio.gather(
+            scheduler.encode_image(image), scheduler.encode_text(query)
+        )
         
         # Combine embeddings
         hybrid_embedding = alpha * image_embedding + (1 - alpha) * text_embedding
@@ -192,7 +468,9 @@ async def hybrid_search(
         hybrid_embedding = hybrid_embedding / (hybrid_embedding ** 2).sum() ** 0.5
         
         # Search
-        results = index.search(hybrid_embedding, k=k)
+        results = await executor.run(
+            search_dicts, index, hybrid_embedding, k, None, min_score, effort, field_list
+        )
         
         return {
             "query_type": "hybrid",
@@ -202,6 +480,8 @@ async def hybrid_search(
             "results": results
         }
         
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
         raise HTTPException(500, f"Search failed: {str(e)}")
 
@@ -219,7 +499,12 @@ async def filtered_search(
     max_price: float = Form(100000),
     categories: str = Form(""),  # Comma-separated: "Clothing,Footwear"
     sort_by: str = Form("relevance"),  # "relevance", "price_low", "price_high"
-    k: int = Form(50)  # Get more results before filtering
+    k: int = Form(50),  # Matching candidates to rank before sorting
+    min_score: Optional[float] = Form(None),  # Minimum cosine similarity
+    profile: str = Form("balanced"),  # Search effort: "fast", "balanced", "exact"
+    ef_search: Optional[int] = Form(None),  # Explicit HNSW efSearch
+    nprobe: Optional[int] = Form(None),  # Explicit IVF nprobe
+    fields: str = Form("")  # Comma-separated product fields to return
 ):
     """
     Advanced search with filters
@@ -228,60 +513,77 @@ async def filtered_search(
     - Price range (min_price, max_price)
     - Categories (comma-separated list)
     - Sort by (relevance, price_low, price_high)
+    - Minimum similarity (min_score)
+    - Search effort (profile, or explicit ef_search / nprobe)
+    - Returned fields (fields)
     """
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
     try:
-        # Step 1: Get search results based on type
-        if search_type == "image" and file:
-            if not file.content_type.startswith('image/'):
-                raise HTTPException(400, "File must be an image")
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents)).convert('RGB')
-            query_embedding = encoder.encode_image(image)
-            
-        elif search_type == "text" and query:
-            if not query.strip():
-                raise HTTPException(400, "Query cannot be empty")
-            query_embedding = encoder.encode_text(query)
-            
-        elif search_type == "hybrid" and file and query:
-            contents = await file.read()
-            image = Image.open(io.BytesIO(contents)).convert('RGB')
-            image_embedding = encoder.encode_image(image)
-            text_embedding = encoder.encode_text(query)
-            query_embedding = 0.5 * image_embedding + 0.5 * text_embedding
-            query_embedding = query_embedding / (query_embedding ** 2).sum() ** 0.5
-        else:
-            raise HTTPException(400, "Invalid search type or missing parameters")
-        
-        # Step 2: Search
-        results = index.search(query_embedding, k=k)
-        
-        # Step 3: Apply filters
-        filtered_results = []
-        
         # Parse categories
         category_list = [c.strip() for c in categories.split(",") if c.strip()]
         
-        for result in results:
-            # Price filter
-            if result.get('price', 0) < min_price or result.get('price', 0) > max_price:
-                continue
+        # Text searches are served from the result cache when possible
+        cache_key = None
+        cached = None
+        if search_type == "text" and query and query.strip():
+            cache_key = (
+                "filtered", encoder.text_cache_key(query), k, min_price, max_price,
+                tuple(sorted(category_list)), sort_by, min_score, cache_token(effort),
+                tuple(field_list or ()), index.generation
+            )
+            cached = result_cache.get(cache_key)
+        
+        if cached is not None:
+            total_before_filter, total_after_filter, final_results = cached
+        else:
+            # Step 1: Get search results based on type
+            if search_type == "image" and file:
+                if not file.content_type.startswith('image/'):
+                    raise HTTPException(400, "File must be an image")
+                contents = await file.read()
+                image = await executor.decode_image(contents)
+                query_embedding = await scheduler.encode_image(image)
+                
+            elif search_type == "text" and query:
+                if not query.strip():
+                    raise HTTPException(400, "Query cannot be empty")
+                query_embedding = await scheduler.encode_text(query)
+                
+            elif search_type == "hybrid" and file and query:
+                contents = await file.read()
+                image = await executor.decode_image(contents)
+                image_embedding, text_embedding = await asyncio.gather(
+                    scheduler.encode_image(image), scheduler.encode_text(query)
+                )
+                query_embedding = 0.5 * image_embedding + 0.5 * text_embedding
+                query_embedding = query_embedding / (query_embedding ** 2).sum() ** 0.5
+            else:
+                raise HTTPException(400, "Invalid search type or missing parameters")
             
-            # Category filter
-            if category_list and result.get('category', '') not in category_list:
-                continue
+            # Step 2: Search, scoring only products that pass the filters
+            filters = {
+                'min_price': min_price,
+                'max_price': max_price,
+                'categories': category_list
+            }
+            filtered_results = await executor.run(index.search, query_embedding, k, filters, min_score, effort)
+            total_before_filter = index.num_live  # Live products the filters were applied to
+            total_after_filter = len(filtered_results)
             
-            filtered_results.append(result)
-        
-        # Step 4: Sort results
-        if sort_by == "price_low":
-            filtered_results.sort(key=lambda x: x.get('price', 0))
-        elif sort_by == "price_high":
-            filtered_results.sort(key=lambda x: x.get('price', 0), reverse=True)
-        # else: keep relevance order (already sorted by similarity)
-        
-        # Return top 10
-        final_results = filtered_results[:10]
+            # Step 4: Sort results (on the price column, before materializing)
+            if sort_by == "price_low":
+                filtered_results = filtered_results.sort_by('price')
+            elif sort_by == "price_high":
+                filtered_results = filtered_results.sort_by('price', reverse=True)
+            # else: keep relevance order (already sorted by similarity)
+            
+            # Return top 10, with only the requested fields
+            final_results = filtered_results[:10].to_dicts(field_list)
+            
+            if cache_key is not None:
+                result_cache.put(cache_key, (total_before_filter, total_after_filter, final_results))
         
         return {
             "query_type": search_type,
@@ -289,111 +591,308 @@ async def filtered_search(
             "filters_applied": {
                 "price_range": [min_price, max_price],
                 "categories": category_list,
-                "sort_by": sort_by
+                "sort_by": sort_by,
+                "min_score": min_score,
+                "profile": profile
             },
-            "total_before_filter": len(results),
-            "total_after_filter": len(filtered_results),
+            "total_before_filter": total_before_filter,
+            "total_after_filter": total_after_filter,
             "num_results": len(final_results),
             "results": final_results
         }
         
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
         raise HTTPException(500, f"Filtered search failed: {str(e)}")
 
 
+@app.post("/search/batch")
+async def batch_search(
+    queries: List[str] = Form([]),
+    files: List[UploadFile] = File([]),
+    k: int = Form(10),
+    min_score: Optional[float] = Form(None),
+    profile: str = Form("balanced"),
+    ef_search: Optional[int] = Form(None),
+    nprobe: Optional[int] = Form(None),
+    fields: str = Form("")
+):
+    """
+    Search many text queries and/or images in one request.
+    
+    Queries are encoded with encode_texts_batch / encode_images_batch and
+    searched with one search_batch call per chunk, bypassing the query
+    embedding cache. Results stream back as NDJSON, one line per query:
+    text queries first (in order), then images.
+    
+    Args:
+        queries: Text queries (repeat the form field for each query)
+        files: Query images (repeat the form field for each image)
+        k: Number of results per query
+        min_score: Minimum cosine similarity of returned results
+        profile: Search effort - "fast", "balanced" or "exact"
+        ef_search: Explicit HNSW efSearch (overrides profile)
+        nprobe: Explicit IVF nprobe (overrides profile)
+        fields: Comma-separated product fields to return (default: all)
+    """
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
+    
+    if not index:
+        raise HTTPException(503, "No index loaded")
+    queries = [query for query in queries if query.strip()]
+    if not queries and not files:
+        raise HTTPException(400, "Provide at least one query or image")
+    if len(queries) + len(files) > BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(400, f"At most {BATCH_SEARCH_MAX_QUERIES} queries per batch")
+    if any(not file.content_type.startswith('image/') for file in files):
+        raise HTTPException(400, "All files must be images")
+    
+    # Uploads must be read before the response starts streaming
+    contents = [await file.read() for file in files]
+    filenames = [file.filename for file in files]
+    
+    async def search_chunk(embeddings):
+        return await executor.run(
+            search_batch_dicts, index, embeddings, k, min_score, effort, field_list
+        )
+    
+    async def stream():
+        position = 0
+        try:
+            for start in range(0, len(queries), BATCH_SEARCH_CHUNK_SIZE):
+                chunk = queries[start:start + BATCH_SEARCH_CHUNK_SIZE]
+                # One-off bulk queries would evict the popular entries from the embedding cache
+                embeddings = await executor.encode_texts(chunk, use_cache=False)
+                for query, results in zip(chunk, await search_chunk(embeddings)):
+                    yield json.dumps({"index": position, "query_type": "text", "query": query,
+                                      "num_results": len(results), "results": results}) + "\n"
+                    position += 1
+            
+            for start in range(0, len(contents), BATCH_SEARCH_CHUNK_SIZE):
+                images = await executor.decode_images(contents[start:start + BATCH_SEARCH_CHUNK_SIZE])
+                embeddings = await executor.encode_images(images)
+                names = filenames[start:start + BATCH_SEARCH_CHUNK_SIZE]
+                for filename, results in zip(names, await search_chunk(embeddings)):
+                    yield json.dumps({"index": position, "query_type": "image", "filename": filename,
+                                      "num_results": len(results), "results": results}) + "\n"
+                    position += 1
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield json.dumps({"index": position, "error": f"Search failed: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @app.get("/filters/categories")
 async def get_categories():
     """Get list of all available categories"""
+    index = current_index()
     if not index or not index.metadata:
         return {"categories": []}
     
-    categories = set(item.get('category', 'Unknown') for item in index.metadata)
-    return {"categories": sorted(list(categories))}
+    # Products without a category are listed as 'Unknown'
+    return {"categories": index.metadata.values('category', missing='Unknown')}
 
 
 @app.get("/filters/price-range")
 async def get_price_range():
     """Get min and max prices in catalog"""
+    index = current_index()
     if not index or not index.metadata:
         return {"min": 0, "max": 0}
     
-    prices = [item.get('price', 0) for item in index.metadata]
+    prices = index.metadata.price
     return {
-        "min": min(prices) if prices else 0,
-        "max": max(prices) if prices else 0
+        "min": float(prices.min()) if len(prices) else 0,
+        "max": float(prices.max()) if len(prices) else 0
     }
 
 
 @app.get("/stats")
 async def get_stats():
     """Get API and index statistics"""
-    stats = index.get_stats() if index else {}
+    index = current_index()
+    try:
+        stats = await index_stats(index) if index and executor else {}
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     return {
         "index_stats": stats,
+        "index_version": index_manager.get_stats() if index_manager else {},
         "model_info": {
             "clip_model": "ViT-B/32",
             "embedding_dim": encoder.get_embedding_dim() if encoder else None
-        }
+        },
+        "embedding_cache": encoder.get_cache_stats() if encoder else {},
+        "result_cache": result_cache.get_stats(),
+        "batching": scheduler.get_stats() if scheduler else {},
+        "executor": executor.get_stats() if executor else {}
     }
 
 
 @app.get("/search/suggestions")
 async def get_search_suggestions(q: str = ""):
     """Get search suggestions based on query"""
+    index = current_index()
     if not index or not index.metadata:
         return {"suggestions": []}
     
-    popular_terms = [
-        "blue shirt", "black shoes", "leather jacket", "running shoes", "denim jeans",
-        "white sneakers", "brown wallet", "black hoodie", "red dress", "gray sweatshirt",
-        "leather boots", "cotton t-shirt", "baseball cap", "crossbody bag", "wireless earbuds"
-    ]
-    
     suggestions = []
     query_lower = q.lower().strip()
     
     if len(query_lower) >= 2:
-        matching_popular = [term for term in popular_terms if query_lower in term.lower()]
+        matching_popular = [term for term in POPULAR_TERMS if query_lower in term.lower()]
         suggestions.extend(matching_popular[:8])
     else:
-        suggestions = popular_terms[:8]
+        suggestions = POPULAR_TERMS[:8]
     
     return {"suggestions": suggestions}
 
 
 @app.get("/similar/{product_id}")
-async def get_similar_products(product_id: str, k: int = 5):
+async def get_similar_products(product_id: str, k: int = 5, profile: str = "balanced",
+                               ef_search: Optional[int] = None, nprobe: Optional[int] = None,
+                               fields: str = ""):
     """Get similar products based on product ID"""
+    index = current_index()
+    effort = search_effort(profile, ef_search, nprobe)
+    field_list = parse_fields(fields)
     if not index or not index.metadata:
         return {"similar": []}
     
     try:
-        # Find the product
-        product = None
-        product_idx = None
-        for i, item in enumerate(index.metadata):
-            if str(item.get('id', i)) == str(product_id):
-                product = item
-                product_idx = i
-                break
-        
-        if not product:
+        # Id lookup + stored vector: a pure ANN query, no model inference
+        similar = await executor.run(index.search_similar, product_id, k, None, effort)
+        if similar is None:
             return {"similar": []}
         
-        # Re-encode the product description
-        text = f"{product['name']} {product.get('category', '')} {product.get('description', '')}"
-        product_embedding = encoder.encode_text(text)
-        
-        # Search for similar products
-        results = index.search(product_embedding, k=k+1)  # +1 to exclude self
+        return {"similar": similar.to_dicts(field_list)}
         
-        # Filter out the original product
-        similar = [r for r in results if str(r.get('id', '')) != str(product_id)][:k]
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
+    except Exception as e:
+        return {"similar": [], "error": str(e)}
+
+
+# ============================================================================
+# ADMIN: INCREMENTAL CATALOG UPDATES
+# ============================================================================
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject admin requests without the configured token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "Admin API disabled: set SEARCH_ADMIN_TOKEN")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(401, "Invalid or missing X-Admin-Token")
+
+
+def _compact_if_needed(index: FAISSIndex):
+    """Compact once enough rows are tombstoned (runs on the executor)."""
+    if index.needs_compaction():
+        index.compact()
+
+
+def _schedule_compaction(index: FAISSIndex):
+    """Compact the index in the background once enough rows are tombstoned."""
+    global compaction_task
+    if compaction_task is not None and not compaction_task.done():
+        return
+    # Even the check is off the event loop: a sharded index asks every shard
+    compaction_task = asyncio.get_running_loop().run_in_executor(
+        executor.thread_pool, _compact_if_needed, index
+    )
+
+
+@app.post("/admin/products", dependencies=[Depends(require_admin)])
+async def upsert_products(products: List[dict] = Body(...)):
+    """
+    Add or update products without rebuilding the index.
+    
+    Only the posted products are encoded. Changes are written to the
+    index's write-ahead log, so they survive a restart.
+    """
+    index = current_index()
+    if not index or index.index is None:
+        raise HTTPException(503, "Index not loaded")
+    if not products:
+        raise HTTPException(400, "No products given")
+    if any('id' not in product or 'name' not in product for product in products):
+        raise HTTPException(400, "Every product needs an 'id' and a 'name'")
+    
+    try:
+        texts = [product_text(product) for product in products]
+        embeddings = await executor.encode_texts(texts, use_cache=False)
+        upserted = await executor.run(index.upsert, products, embeddings)
+        _schedule_compaction(index)
         
-        return {"similar": similar}
+        return {"upserted": upserted, "index_stats": await index_stats(index)}
         
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
     except Exception as e:
-        return {"similar": [], "error": str(e)}
+        raise HTTPException(500, f"Update failed: {str(e)}")
+
+
+@app.delete("/admin/products/{product_id}", dependencies=[Depends(require_admin)])
+async def delete_product(product_id: str):
+    """Remove a product from search results"""
+    index = current_index()
+    if not index or index.index is None:
+        raise HTTPException(503, "Index not loaded")
+    
+    try:
+        deleted = await executor.run(index.delete, [product_id])
+        if not deleted:
+            raise HTTPException(404, f"Product {product_id} not found")
+        _schedule_compaction(index)
+        
+        return {"deleted": product_id, "index_stats": await index_stats(index)}
+        
+    except ServerBusyError as e:
+        raise HTTPException(503, str(e))
+
+
+@app.post("/admin/compact", dependencies=[Depends(require_admin)])
+async def compact_index():
+    """Rebuild the index without tombstoned rows"""
+    index = current_index()
+    if not index or index.index is None:
+        raise HTTPException(503, "Index not loaded")
+    
+    await asyncio.get_running_loop().run_in_executor(executor.thread_pool, index.compact)
+    return {"index_stats": await index_stats(index)}
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_index():
+    """Activate a newly published index version now instead of at the next poll"""
+    if sharded_index:
+        raise HTTPException(400, "Hot swap is not available for a sharded index")
+    if not index_manager:
+        raise HTTPException(503, "Server not ready")
+    
+    swapped = await asyncio.get_running_loop().run_in_executor(
+        executor.thread_pool, index_manager.reload_if_changed
+    )
+    return {"swapped": swapped, "index_version": index_manager.get_stats()}
+
+
+@app.post("/admin/save", dependencies=[Depends(require_admin)])
+async def save_index():
+    """Write a snapshot of the index to disk and truncate the update log"""
+    index = current_index()
+    if not index or index.index is None:
+        raise HTTPException(503, "Index not loaded")
+    
+    # The loaded generation's own files, never another build's
+    saved_path = SHARD_LAYOUT_PATH.parent if sharded_index else index.path
+    await asyncio.get_running_loop().run_in_executor(
+        executor.thread_pool, index.save, str(saved_path)
+    )
+    return {"saved": str(saved_path), "index_stats": await index_stats(index)}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,181 @@
+"""
+Parallel Encode Module
+Data-parallel embedding generation: N encoder processes, each pinned to
+its own CPU cores, hand shard embeddings back through shared memory
+"""
+
+import os
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Container, Iterable, List, Optional
+
+import numpy as np
+from tqdm import tqdm
+
+from embedding_shards import EmbeddingShards
+
+
+def available_cores() -> List[int]:
+    """CPU cores this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_groups(num_workers: int) -> List[List[int]]:
+    """Split the available cores into contiguous groups, one per worker."""
+    cores = available_cores()
+    groups = [group.tolist() for group in np.array_split(cores, num_workers)]
+    # More workers than cores: share cores round-robin
+    return [group or [cores[i % len(cores)]] for i, group in enumerate(groups)]
+
+
+def _encode_worker(worker_id: int, cores: List[int], model_name: str, batch_size: int,
+                   store_path: Optional[str], shm_name: str, slot_shape: tuple,
+                   tasks, results):
+    """
+    Encoder process: pin to `cores`, load a private CLIP model, then encode
+    each (shard, products) task into this worker's shared-memory slot.
+    """
+    shm = slot = store = None
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        import torch
+        torch.set_num_threads(len(cores))
+
+        from build_index import encode_products
+        from clip_encoder import CLIPEncoder
+        from embedding_store import EmbeddingStore
+
+        encoder = CLIPEncoder(model_name=model_name, device="cpu", cache_size=0, preprocess_workers=0)
+        store = EmbeddingStore(store_path, model_name, encoder.get_embedding_dim()) if store_path else None
+        shm = shared_memory.SharedMemory(name=shm_name)
+        slot_bytes = int(np.prod(slot_shape)) * 4
+        slot = np.ndarray(slot_shape, dtype='float32', buffer=shm.buf, offset=worker_id * slot_bytes)
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            shard, products = task
+            encode_products(encoder, products, batch_size=batch_size, store=store,
+                            out=slot[:len(products)], show_progress=False)
+            results.put((worker_id, shard, None))
+    except Exception as e:
+        results.put((worker_id, None, f"{type(e).__name__}: {e}"))
+    finally:
+        if store is not None:
+            store.close()
+        del slot  # Release the buffer before closing the mapping
+        if shm is not None:
+            shm.close()
+
+
+def encode_shards_parallel(shards: EmbeddingShards, num_workers: int, model_name: str,
+                           batch_size: int, products: Iterable[dict], store_path: Optional[str] = None,
+                           shard_indices: Optional[Container[int]] = None) -> int:
+    """
+    Encode a product stream with `num_workers` encoder processes.
+
+    Each worker runs torch with one thread per core in its core group and
+    writes finished shards into its own slot of a shared memory block, so
+    embeddings are never pickled. This process is the single assembler. It
+    reads the stream, hands each pending shard's products to an idle
+    worker, and copies finished slots into their shard files. At most one
+    shard per worker is held in memory.
+
+    Args:
+        shards: Shard set to fill
+        num_workers: Encoder processes to start
+        model_name: CLIP model each worker loads
+        batch_size: Products per forward pass
+        products: Product records, in index row order
+        store_path: Optional EmbeddingStore database shared by the workers
+        shard_indices: Shards to encode (default: all pending)
+
+    Returns:
+        Number of shards encoded
+    """
+    num_workers = max(1, num_workers)
+    groups = core_groups(num_workers)
+    slot_shape = (shards.shard_size, shards.embedding_dim)
+    slot_bytes = int(np.prod(slot_shape)) * 4
+    print(f"  Starting {num_workers} encoder process(es) on cores "
+          f"{', '.join(f'{group[0]}-{group[-1]}' for group in groups)}")
+
+    # Spawn (not fork): forking after torch has started its thread pools can deadlock
+    ctx = mp.get_context("spawn")
+    shm = shared_memory.SharedMemory(create=True, size=num_workers * slot_bytes)
+    slots = [np.ndarray(slot_shape, dtype='float32', buffer=shm.buf, offset=worker * slot_bytes)
+             for worker in range(num_workers)]
+    results = ctx.Queue()
+    tasks = [ctx.Queue() for _ in range(num_workers)]
+    workers = [
+        ctx.Process(target=_encode_worker, daemon=True,
+                    args=(worker, groups[worker], model_name, batch_size, store_path,
+                          shm.name, slot_shape, tasks[worker], results))
+        for worker in range(num_workers)
+    ]
+
+    idle = list(range(num_workers))
+    in_flight = {}  # Worker -> (shard, products)
+    encoded = skipped = 0
+
+    def collect(progress):
+        """Wait for one worker to finish and write its shard."""
+        nonlocal encoded
+        while True:
+            try:
+                worker, shard, error = results.get(timeout=1)
+                break
+            except queue.Empty:
+                crashed = [i for i, process in enumerate(workers) if process.exitcode not in (None, 0)]
+                if crashed:
+                    raise RuntimeError(f"Encoder worker(s) {crashed} exited unexpectedly")
+        if error:
+            raise RuntimeError(f"Encoder worker {worker} failed: {error}")
+
+        _, batch = in_flight.pop(worker)
+        shards.write(shard, batch, slots[worker][:len(batch)])
+        idle.append(worker)
+        encoded += 1
+        progress.update(1)
+
+    try:
+        for process in workers:
+            process.start()
+
+        with tqdm(desc="Encoding shards", unit="shard") as progress:
+            for shard, batch in shards.split(products):
+                if shard_indices is not None and shard not in shard_indices:
+                    continue
+                if shards.is_done(shard):
+                    skipped += 1
+                    continue
+                if not idle:
+                    collect(progress)
+                worker = idle.pop()
+                in_flight[worker] = (shard, batch)
+                tasks[worker].put((shard, batch))
+
+            while in_flight:
+                collect(progress)
+    finally:
+        for worker_tasks in tasks:
+            worker_tasks.put(None)
+        for process in workers:
+            if process.pid is None:
+                continue  # Never started
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        del slots
+        shm.close()
+        shm.unlink()
+
+    if skipped:
+        print(f"✓ Resumed: {skipped} shard(s) were already encoded")
+    shards.finalize()
+    return encoded
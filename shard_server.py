@@ -0,0 +1,225 @@
+"""
+Shard Server Module
+Serves one index shard over a small RPC protocol so queries can be
+scattered across local worker processes or other machines
+"""
+
+import ipaddress
+import json
+import os
+import secrets
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import AuthenticationError, Listener
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from catalog_store import ColumnarCatalog
+from faiss_index import FAISSIndex
+
+
+# Shared secret between the API and its shard servers. Requests are unpickled,
+# so anyone holding it can run code on a server: the built-in fallback key is
+# only accepted on the loopback interface
+AUTHKEY_ENV = "SEARCH_SHARD_AUTHKEY"
+LOCAL_AUTHKEY = b"multimodal-search"
+DEFAULT_AUTHKEY = os.environ[AUTHKEY_ENV].encode('utf-8') if os.environ.get(AUTHKEY_ENV) else LOCAL_AUTHKEY
+
+
+def is_loopback(host: str) -> bool:
+    """True if host only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class ShardServer:
+    """
+    One shard of a sharded index (see sharded_index.build_shards).
+
+    Each client connection is served on its own thread. FAISS releases the
+    GIL while searching, so concurrent queries overlap. Requests are
+    (method, args) tuples. Replies are ('ok', value) or ('error', message).
+    """
+
+    # Methods callable over RPC
+    METHODS = ('summary', 'search', 'search_batch', 'vector_of', 'contains', 'upsert', 'delete',
+               'needs_compaction', 'compact', 'save', 'get_stats')
+
+    def __init__(self, layout_path: str, shard: int):
+        """
+        Load a shard.
+
+        Args:
+            layout_path: layout.json written by build_index.py --index-shards
+            shard: Shard number to serve
+        """
+        with open(layout_path) as f:
+            self.layout = json.load(f)
+        self.shard = shard
+        self.index_path = str(Path(layout_path).parent / self.layout['shards'][shard]['path'])
+        self.index = FAISSIndex(embedding_dim=self.layout['embedding_dim'])
+        self.index.load(self.index_path)
+
+    # ------------------------------------------------------------------
+    # RPC methods
+    # ------------------------------------------------------------------
+
+    def summary(self) -> dict:
+        """Shard number, routing settings and catalog summary."""
+        prices = self.index.metadata.price
+        return {
+            'shard': self.shard,
+            'routing': {key: self.layout.get(key) for key in ('num_shards', 'shard_by', 'category_map')},
+            'num_items': self.index.get_stats()['live_items'],
+            'values': {field: self.index.metadata.values(field) for field in ColumnarCatalog.FILTER_KEYS.values()},
+            'missing': [field for field in ColumnarCatalog.FILTER_KEYS.values()
+                        if self.index.metadata.has_missing(field)],
+            'price_range': [float(prices.min()), float(prices.max())] if len(prices) else [0.0, 0.0]
+        }
+
+    def search(self, query_embedding: np.ndarray, k: int, filters=None, min_score=None, effort=None):
+        return self.index.search(query_embedding, k, filters, min_score, effort).to_dicts()
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int, min_score=None, effort=None):
+        return [results.to_dicts()
+                for results in self.index.search_batch(query_embeddings, k, min_score, effort)]
+
+    def vector_of(self, product_id):
+        """Stored vector of a product, or None if it isn't in this shard."""
+        row = self.index.get_row(product_id)
+        return None if row is None else self.index.get_vector(row)
+
+    def contains(self, product_ids: List) -> List:
+        """The given product ids this shard holds."""
+        return [product_id for product_id in product_ids if self.index.get_row(product_id) is not None]
+
+    def upsert(self, products: List[dict], embeddings: np.ndarray) -> int:
+        return self.index.upsert(products, embeddings)
+
+    def delete(self, product_ids: List) -> int:
+        return self.index.delete(product_ids)
+
+    def needs_compaction(self) -> bool:
+        return self.index.needs_compaction()
+
+    def compact(self):
+        self.index.compact()
+
+    def save(self):
+        self.index.save(self.index_path)
+
+    def get_stats(self) -> dict:
+        return self.index.get_stats()
+
+    # ------------------------------------------------------------------
+    # Serving
+    # ------------------------------------------------------------------
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method not in self.METHODS:
+                        raise ValueError(f"Unknown method: {method}")
+                    reply = ('ok', getattr(self, method)(*args))
+                except Exception as e:
+                    reply = ('error', f"{type(e).__name__}: {e}")
+                conn.send(reply)
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0, authkey: bytes = DEFAULT_AUTHKEY):
+        """
+        Accept connections forever; prints 'READY host:port' once listening.
+
+        Raises:
+            ValueError: If a non-loopback host would be served with the built-in key
+        """
+        if authkey == LOCAL_AUTHKEY and not is_loopback(host):
+            raise ValueError(f"Set {AUTHKEY_ENV} to a secret before serving on {host}")
+        with Listener((host, port), authkey=authkey) as listener:
+            print(f"READY {host}:{listener.address[1]}", flush=True)
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+def launch_local_shards(layout_path: str) -> Tuple[List[str], List[subprocess.Popen], bytes]:
+    """
+    Start one shard server process per shard on this machine.
+
+    The servers get a fresh random key (through their environment, so it
+    never shows up in the process list).
+
+    Args:
+        layout_path: layout.json of the sharded index
+
+    Returns:
+        (addresses, processes, authkey): "host:port" of each server, its
+        process, and the key to connect with
+    """
+    with open(layout_path) as f:
+        num_shards = len(json.load(f)['shards'])
+
+    authkey = secrets.token_hex(32)
+    env = {**os.environ, AUTHKEY_ENV: authkey}
+    processes = [
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), '--layout', str(layout_path),
+                          '--shard', str(shard), '--port', '0'],
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+        for shard in range(num_shards)
+    ]
+
+    addresses = []
+    try:
+        for shard, process in enumerate(processes):
+            for line in process.stdout:
+                if line.startswith("READY "):
+                    addresses.append(line.split()[1])
+                    break
+            else:
+                raise RuntimeError(f"Shard server {shard} exited during startup (code {process.wait()})")
+    except Exception:
+        for process in processes:
+            process.kill()
+        raise
+
+    def forward(shard, stream):
+        for line in stream:
+            print(f"[shard {shard}] {line}", end="")
+
+    # Keep draining output so a chatty server never blocks on a full pipe
+    for shard, process in enumerate(processes):
+        threading.Thread(target=forward, args=(shard, process.stdout), daemon=True).start()
+    return addresses, processes, authkey.encode('utf-8')
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve one shard of a sharded product index")
+    parser.add_argument('--layout', default="data/index/shards/layout.json", help='Sharded index layout')
+    parser.add_argument('--shard', type=int, required=True, help='Shard number to serve')
+    parser.add_argument('--host', default="127.0.0.1",
+                        help=f'Interface to listen on (0.0.0.0 for remote API nodes, requires {AUTHKEY_ENV})')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (0 = any free port)')
+
+    args = parser.parse_args()
+    if DEFAULT_AUTHKEY == LOCAL_AUTHKEY and not is_loopback(args.host):
+        parser.error(f"set {AUTHKEY_ENV} to a shared secret to serve on {args.host}")
+    ShardServer(args.layout, args.shard).serve(args.host, args.port)
@@ -0,0 +1,483 @@
+"""
+Sharded Index Module
+Splits the catalog across several index shards and searches them
+scatter-gather: every shard is queried in parallel and the per-shard
+top-k lists are merged with a heap
+"""
+
+import heapq
+import json
+import os
+import queue
+import threading
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from multiprocessing.connection import Client
+from pathlib import Path
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+
+from catalog_store import ColumnarCatalog
+from faiss_index import FAISSIndex
+from shard_server import DEFAULT_AUTHKEY, launch_local_shards
+
+
+# Product fields an index can be sharded by
+SHARD_KEYS = ("id", "category")
+LAYOUT_NAME = "layout.json"
+
+# Seconds to wait for a shard server's reply; compaction and snapshots get longer
+SHARD_TIMEOUT = float(os.environ.get("SEARCH_SHARD_TIMEOUT", "10"))
+MAINTENANCE_TIMEOUT = float(os.environ.get("SEARCH_SHARD_MAINTENANCE_TIMEOUT", "600"))
+MAINTENANCE_METHODS = ('compact', 'save')
+
+
+class ShardRouter:
+    """
+    Maps products to shards.
+
+    By id, a product goes to crc32(id) % num_shards. By category, each
+    category has its own shard from the layout's category map, which
+    balances product counts at build time. A category added later falls
+    back to hashing. With category sharding, a category filter only has
+    to visit the shards that hold those categories.
+    """
+
+    def __init__(self, num_shards: int, shard_by: str = "id", category_map: Optional[dict] = None):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Can't shard by '{shard_by}' (choose from {', '.join(SHARD_KEYS)})")
+        self.num_shards = num_shards
+        self.shard_by = shard_by
+        self.category_map = category_map or {}
+
+    @classmethod
+    def plan(cls, keys: List, num_shards: int, shard_by: str) -> "ShardRouter":
+        """Router for a catalog whose shard keys are `keys`."""
+        if shard_by != "category":
+            return cls(num_shards, shard_by)
+
+        counts = {}
+        for key in keys:
+            counts[str(key)] = counts.get(str(key), 0) + 1
+        if len(counts) < num_shards:
+            raise ValueError(f"Only {len(counts)} categories for {num_shards} shards")
+        # Largest categories first, each onto the emptiest shard
+        load = [(0, shard) for shard in range(num_shards)]
+        category_map = {}
+        for category in sorted(counts, key=lambda name: (-counts[name], name)):
+            size, shard = heapq.heappop(load)
+            category_map[category] = shard
+            heapq.heappush(load, (size + counts[category], shard))
+        return cls(num_shards, shard_by, category_map)
+
+    def shard_of(self, key) -> int:
+        """Shard owning a shard-key value."""
+        key = str(key)
+        if key in self.category_map:
+            return self.category_map[key]
+        return zlib.crc32(key.encode('utf-8')) % self.num_shards
+
+    def shard_for(self, product: dict) -> int:
+        """Shard owning a product."""
+        return self.shard_of(product.get(self.shard_by))
+
+    def shards_for_filters(self, filters: Optional[dict]) -> List[int]:
+        """Shards that can hold products matching `filters`."""
+        if self.shard_by == "category" and filters and filters.get('categories'):
+            return sorted({self.shard_of(category) for category in filters['categories']})
+        return list(range(self.num_shards))
+
+    def to_dict(self) -> dict:
+        return {'num_shards': self.num_shards, 'shard_by': self.shard_by, 'category_map': self.category_map}
+
+
+def build_shards(embeddings: Union[np.ndarray, List[np.ndarray]], catalog: ColumnarCatalog,
+                 num_shards: int, shard_by: str, out_dir: Union[str, Path],
+                 category_indexes: bool = False, **build_kwargs) -> dict:
+    """
+    Build one FAISS index per shard.
+
+    Args:
+        embeddings: Embeddings in catalog row order (one array, or chunks)
+        catalog: Product catalog
+        num_shards: Number of shards
+        shard_by: 'id' (hash of the product id) or 'category'
+        out_dir: Directory for the shards and layout.json
+        category_indexes: Also build per-category sub-indexes in every shard
+        **build_kwargs: Passed to FAISSIndex.build_index() for every shard
+
+    Returns:
+        The layout (also written to out_dir/layout.json)
+    """
+    chunks = [embeddings] if isinstance(embeddings, np.ndarray) else list(embeddings)
+    offsets = np.cumsum([0] + [len(chunk) for chunk in chunks])
+    embedding_dim = chunks[0].shape[1]
+
+    keys = catalog.column(shard_by)
+    router = ShardRouter.plan(keys, num_shards, shard_by)
+    assignment = np.array([router.shard_of(key) for key in keys], dtype='int64')
+
+    out_dir = Path(out_dir)
+    layout = {'embedding_dim': embedding_dim, **router.to_dict(), 'shards': []}
+    for shard in range(num_shards):
+        rows = np.flatnonzero(assignment == shard)
+        if not len(rows):
+            raise ValueError(f"Shard {shard} would be empty; use fewer shards")
+        print(f"\n  Shard {shard + 1}/{num_shards}: {len(rows)} products")
+
+        # Gather this shard's vectors chunk by chunk
+        vectors = np.empty((len(rows), embedding_dim), dtype='float32')
+        filled = 0
+        for chunk, start, stop in zip(chunks, offsets[:-1], offsets[1:]):
+            in_chunk = rows[(rows >= start) & (rows < stop)]
+            vectors[filled:filled + len(in_chunk)] = chunk[in_chunk - start]
+            filled += len(in_chunk)
+
+        shard_index = FAISSIndex(embedding_dim=embedding_dim)
+        shard_index.build_index(vectors, [catalog[int(row)] for row in rows], **build_kwargs)
+        if category_indexes:
+            shard_index.build_category_indexes()
+        shard_path = Path(f"shard_{shard}") / "products"
+        (out_dir / shard_path).parent.mkdir(parents=True, exist_ok=True)
+        shard_index.save(str(out_dir / shard_path))
+        layout['shards'].append({'path': str(shard_path), 'num_items': int(len(rows))})
+
+    layout['built_at'] = datetime.now().isoformat()
+    with open(out_dir / LAYOUT_NAME, 'w') as f:
+        json.dump(layout, f, indent=2)
+    return layout
+
+
+class MergedResults(Sequence):
+    """
+    Ranked hits merged from several shards, as result dictionaries.
+
+    Supports the parts of the SearchResults interface the API uses:
+    indexing, slicing, ids, sort_by() and to_dicts(fields).
+    """
+
+    def __init__(self, results: List[dict]):
+        self.results = results
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return MergedResults(self.results[item])
+        return dict(self.results[item])
+
+    def __repr__(self) -> str:
+        return f"MergedResults({len(self)} hits)"
+
+    @property
+    def ids(self) -> list:
+        """Product ids of the hits."""
+        return [result.get('id') for result in self.results]
+
+    def sort_by(self, field: str, reverse: bool = False) -> "MergedResults":
+        """Reorder by a numeric field (missing values sort as 0); ties keep rank order."""
+        return MergedResults(sorted(self.results, key=lambda result: result.get(field) or 0, reverse=reverse))
+
+    def to_dicts(self, fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """Result dictionaries, optionally projected ('id' and 'similarity_score' are kept)."""
+        if fields is None:
+            return [dict(result) for result in self.results]
+        keep = {'id', 'similarity_score', *fields}
+        return [{name: value for name, value in result.items() if name in keep} for result in self.results]
+
+
+def merge_results(shard_results: List[List[dict]], k: int) -> MergedResults:
+    """Top k of several score-sorted result lists."""
+    merged = heapq.merge(*shard_results, key=lambda result: result['similarity_score'], reverse=True)
+    return MergedResults(list(islice(merged, k)))
+
+
+class CatalogSummary:
+    """
+    Catalog facts gathered from the shard servers, standing in for
+    FAISSIndex.metadata in the filter endpoints.
+    """
+
+    def __init__(self, summaries: List[dict]):
+        self.num_items = sum(summary['num_items'] for summary in summaries)
+        self._values = {}
+        self._missing = set()
+        for summary in summaries:
+            for field, values in summary['values'].items():
+                self._values.setdefault(field, set()).update(values)
+            self._missing.update(summary.get('missing', ()))
+        # Each shard's (min, max); enough for min() / max() over the catalog
+        self.price = np.array([bound for summary in summaries for bound in summary['price_range']],
+                              dtype='float64')
+
+    def __len__(self) -> int:
+        return self.num_items
+
+    def values(self, field: str, missing: Optional[str] = None) -> List[str]:
+        """Sorted distinct values of a categorical field across all shards (see ColumnarCatalog.values)."""
+        values = set(self._values.get(field, ()))
+        if missing is not None and field in self._missing:
+            values.add(missing)
+        return sorted(values)
+
+
+class ShardClient:
+    """Pool of RPC connections to one shard server."""
+
+    def __init__(self, address: str, authkey: bytes = DEFAULT_AUTHKEY, max_connections: int = 4,
+                 timeout: float = SHARD_TIMEOUT):
+        host, port = address.rsplit(':', 1)
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self._endpoint = (host, int(port))
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def call(self, method: str, *args):
+        """
+        Run a method on the shard server.
+
+        Raises:
+            ConnectionError: If the server can't be reached or doesn't reply in time
+            RuntimeError: If the method failed on the server
+        """
+        timeout = MAINTENANCE_TIMEOUT if method in MAINTENANCE_METHODS else self.timeout
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+            try:
+                if conn is None:
+                    conn = Client(self._endpoint, authkey=self.authkey)
+                conn.send((method, args))
+                if not conn.poll(timeout):
+                    # Closing drops the late reply instead of handing it to the next call
+                    raise TimeoutError(f"no reply to {method} within {timeout:g}s")
+                status, value = conn.recv()
+            except (EOFError, OSError) as e:
+                if conn is not None:
+                    conn.close()
+                raise ConnectionError(f"Shard server {self.address} unavailable: {e}") from e
+            self._idle.put(conn)
+
+        if status == 'error':
+            raise RuntimeError(f"Shard server {self.address}: {value}")
+        return value
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class ShardedIndex:
+    """
+    Scatter-gather search over shard servers (see shard_server.py).
+
+    Offers the FAISSIndex methods the API calls, so main.py can serve it
+    in place of a single index. A query is sent to every shard in parallel
+    (or only the shards a category filter can match), each shard returns
+    its own top k, and the lists are merged with a heap. Updates go to the
+    owning shard; compaction and saving run on every shard.
+    """
+
+    def __init__(self, clients: List[ShardClient], processes: Optional[list] = None,
+                 connections_per_shard: int = 4):
+        """
+        Connect to a full set of shard servers (in any order).
+
+        Args:
+            clients: One ShardClient per shard
+            processes: Locally launched shard server processes, stopped by close()
+            connections_per_shard: Parallel requests per shard
+        """
+        self.processes = processes or []
+        self._pool = ThreadPoolExecutor(max_workers=len(clients) * connections_per_shard,
+                                        thread_name_prefix="shard-scatter")
+        self._lock = threading.Lock()
+
+        summaries = list(self._pool.map(lambda client: client.call('summary'), clients))
+        order = sorted(range(len(clients)), key=lambda i: summaries[i]['shard'])
+        self.clients = [clients[i] for i in order]
+        self.router = ShardRouter(**summaries[order[0]]['routing'])
+        served = [summaries[i]['shard'] for i in order]
+        if served != list(range(self.router.num_shards)):
+            raise ValueError(f"Expected shards 0-{self.router.num_shards - 1}, servers have {served}")
+
+        # Mirrors FAISSIndex.index, so readiness checks work unchanged
+        self.index = self.clients
+        self.metadata = CatalogSummary(summaries)
+        self.generation = 1
+
+    @classmethod
+    def connect(cls, addresses: List[str], authkey: bytes = DEFAULT_AUTHKEY, **kwargs) -> "ShardedIndex":
+        """Connect to running shard servers ("host:port" each)."""
+        connections = kwargs.get('connections_per_shard', 4)
+        return cls([ShardClient(address, authkey, connections) for address in addresses], **kwargs)
+
+    @classmethod
+    def launch_local(cls, layout_path: Union[str, Path], **kwargs) -> "ShardedIndex":
+        """Start one shard server process per shard on this machine and connect to them."""
+        addresses, processes, authkey = launch_local_shards(str(layout_path))
+        try:
+            return cls.connect(addresses, authkey, processes=processes, **kwargs)
+        except Exception:
+            for process in processes:
+                process.kill()
+            raise
+
+    def _scatter(self, method: str, *args, shards: Optional[List[int]] = None) -> list:
+        """Call `method` on several shards in parallel; results in shard order."""
+        shards = range(len(self.clients)) if shards is None else shards
+        futures = [self._pool.submit(self.clients[shard].call, method, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+    def _changed(self):
+        """Refresh the catalog summary and invalidate cached results."""
+        summaries = self._scatter('summary')
+        with self._lock:
+            self.metadata = CatalogSummary(summaries)
+            self.generation += 1
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def search(self, query_embedding: np.ndarray, k: int = 10,
+               filters: Optional[dict] = None, min_score: Optional[float] = None,
+               effort: Union[str, dict, None] = None) -> MergedResults:
+        """Search every shard that can match `filters` (see FAISSIndex.search)."""
+        query_embedding = np.asarray(query_embedding, dtype='float32')
+        shard_results = self._scatter('search', query_embedding, k, filters, min_score, effort,
+                                      shards=self.router.shards_for_filters(filters))
+        return merge_results(shard_results, k)
+
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 10,
+                     min_score: Optional[float] = None,
+                     effort: Union[str, dict, None] = None) -> List[MergedResults]:
+        """Search several queries; each shard gets the whole batch in one request."""
+        query_embeddings = np.asarray(query_embeddings, dtype='float32')
+        shard_results = self._scatter('search_batch', query_embeddings, k, min_score, effort)
+        return [merge_results([results[query] for results in shard_results], k)
+                for query in range(len(query_embeddings))]
+
+    def search_similar(self, product_id, k: int = 5, min_score: Optional[float] = None,
+                       effort: Union[str, dict, None] = None) -> Optional[MergedResults]:
+        """
+        "More like this" across all shards.
+
+        Returns:
+            Merged results without the product itself, or None if it isn't indexed
+        """
+        shards = [self.router.shard_of(product_id)] if self.router.shard_by == "id" else None
+        vectors = [vector for vector in self._scatter('vector_of', product_id, shards=shards)
+                   if vector is not None]
+        if not vectors:
+            return None
+
+        # +1 to exclude self
+        results = self.search(vectors[0], k + 1, None, min_score, effort)
+        return MergedResults([result for result in results.results
+                              if str(result.get('id')) != str(product_id)][:k])
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def upsert(self, products: List[dict], embeddings: np.ndarray) -> int:
+        """Add or replace products, each on the shard that owns it."""
+        embeddings = np.asarray(embeddings, dtype='float32').reshape(len(products), -1)
+        by_shard = {}
+        for i, product in enumerate(products):
+            by_shard.setdefault(self.router.shard_for(product), []).append(i)
+
+        shards = sorted(by_shard)
+        if self.router.shard_by == "category":
+            # A product whose category changed still sits on its old shard
+            target = {products[i]['id']: shard for shard, rows in by_shard.items() for i in rows}
+            stale = {}
+            for shard, held in enumerate(self._scatter('contains', list(target))):
+                moved = [product_id for product_id in held if target[product_id] != shard]
+                if moved:
+                    stale[shard] = moved
+            futures = [self._pool.submit(self.clients[shard].call, 'delete', ids)
+                       for shard, ids in stale.items()]
+            for future in futures:
+                future.result()
+
+        futures = [self._pool.submit(self.clients[shard].call, 'upsert',
+                                     [products[i] for i in by_shard[shard]], embeddings[by_shard[shard]])
+                   for shard in shards]
+        upserted = sum(future.result() for future in futures)
+        self._changed()
+        return upserted
+
+    def delete(self, product_ids: List) -> int:
+        """Remove products from whichever shards hold them."""
+        if self.router.shard_by == "id":
+            by_shard = {}
+            for product_id in product_ids:
+                by_shard.setdefault(self.router.shard_of(product_id), []).append(product_id)
+            futures = [self._pool.submit(self.clients[shard].call, 'delete', ids)
+                       for shard, ids in by_shard.items()]
+            deleted = sum(future.result() for future in futures)
+        else:
+            deleted = sum(self._scatter('delete', list(product_ids)))
+        self._changed()
+        return deleted
+
+    @property
+    def num_live(self) -> int:
+        """Live products over all shards, as of the last catalog summary."""
+        return len(self.metadata)
+
+    def needs_compaction(self) -> bool:
+        return any(self._scatter('needs_compaction'))
+
+    def compact(self):
+        self._scatter('compact')
+        self._changed()
+
+    def save(self, filepath: Optional[str] = None):
+        """Snapshot every shard to its own path (`filepath` is ignored)."""
+        self._scatter('save')
+
+    # ------------------------------------------------------------------
+    # Stats / lifecycle
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> dict:
+        """Totals over all shards, plus each shard's own stats."""
+        shard_stats = self._scatter('get_stats')
+        return {
+            'total_items': sum(stats['total_items'] for stats in shard_stats),
+            'live_items': sum(stats['live_items'] for stats in shard_stats),
+            'deleted_items': sum(stats['deleted_items'] for stats in shard_stats),
+            'generation': self.generation,
+            'num_shards': len(self.clients),
+            'shard_by': self.router.shard_by,
+            'shards': [{'address': client.address, **stats}
+                       for client, stats in zip(self.clients, shard_stats)]
+        }
+
+    def close(self):
+        """Drop connections and stop locally launched shard servers."""
+        self._pool.shutdown(wait=False)
+        for client in self.clients:
+            client.close()
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except Exception:
+                process.kill()
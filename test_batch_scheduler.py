@@ -0,0 +1,71 @@
+"""
+MicroBatcher tests: one bad item fails only its own request
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from batch_scheduler import MicroBatcher
+
+
+def run_batch(batch_fn, items, max_batch_size=8):
+    """Submit items concurrently so they share a batch; returns results or exceptions."""
+    async def main():
+        batcher = MicroBatcher(batch_fn, max_batch_size=max_batch_size, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(item) for item in items),
+                                        return_exceptions=True), batcher
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_results_follow_items():
+    async def double(items):
+        return np.array([[item * 2] for item in items], dtype='float32')
+
+    results, batcher = run_batch(double, [1, 2, 3])
+    assert [float(row[0]) for row in results] == [2.0, 4.0, 6.0]
+    assert batcher.batches_run == 1
+
+
+def test_bad_item_fails_alone():
+    calls = []
+
+    async def encode(items):
+        calls.append(list(items))
+        if "bad" in items:
+            raise ValueError("cannot encode")
+        return np.array([[len(item)] for item in items], dtype='float32')
+
+    results, _ = run_batch(encode, ["a", "bad", "ccc"])
+    assert float(results[0][0]) == 1.0
+    assert isinstance(results[1], ValueError)
+    assert float(results[2][0]) == 3.0
+    assert calls[0] == ["a", "bad", "ccc"]  # Batched first, then retried one by one
+
+
+def test_missing_rows_fail_leftover_callers():
+    async def short(items):
+        return np.zeros((len(items) - 1, 1), dtype='float32')
+
+    async def main():
+        batcher = MicroBatcher(short, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), 5)
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(main())
+    assert sum(isinstance(result, RuntimeError) for result in results) == 1
+    assert isinstance(results[2], RuntimeError)
+
+
+def test_rejects_invalid_batch_size():
+    with pytest.raises(ValueError):
+        MicroBatcher(lambda items: None, max_batch_size=0)
@@ -0,0 +1,96 @@
+"""
+Round-trip tests for the columnar catalog: every value must read back unchanged
+"""
+
+from catalog_store import CatalogBuilder, ColumnarCatalog
+
+
+RECORDS = [
+    {'id': 1234567890123456789, 'name': 'Big id', 'in_stock': True, 'price': 10},
+    {'id': 2, 'name': 'Small id', 'in_stock': False, 'price': 12.5},
+    {'id': 3, 'name': 'No stock flag'},
+    # Values a fixed-width column can't hold fall back to JSON
+    {'id': 4, 'name': 'Mixed', 'in_stock': 'unknown', 'rank': 2 ** 70, 'tags': ['a', 1]},
+    {'id': 5, 'name': 7, 'rank': 2 ** 53 + 1, 'weight': 1.5},
+    {'id': 6, 'name': 'Widened', 'weight': 2},
+]
+
+
+def assert_round_trip(catalog):
+    for row, record in enumerate(RECORDS):
+        restored = catalog.get(row)
+        assert restored == record
+        for name, value in record.items():
+            # Ints in a column widened to float may read back as equal floats
+            widened = type(value) is int and type(restored[name]) is float
+            assert type(restored[name]) is type(value) or widened, name
+
+
+def test_round_trip_in_memory():
+    assert_round_trip(ColumnarCatalog.from_records(RECORDS))
+
+
+def test_round_trip_on_disk(tmp_path):
+    ColumnarCatalog.from_records(RECORDS).save(str(tmp_path / "catalog"))
+    catalog = ColumnarCatalog.open(str(tmp_path / "catalog"))
+    assert_round_trip(catalog)
+
+    columns = catalog.take(range(len(RECORDS)), ['id', 'in_stock'])
+    assert columns['id'] == [record['id'] for record in RECORDS]
+    assert columns['in_stock'] == [record.get('in_stock') for record in RECORDS]
+
+
+def test_large_ids_stay_int64():
+    catalog = ColumnarCatalog.from_records(RECORDS[:3])
+    assert catalog.fields[0] == {'name': 'id', 'kind': 'int'}
+    assert catalog.get(0)['id'] == 1234567890123456789
+    assert catalog.get(1)['in_stock'] is False
+
+
+def test_kind_from_first_present_value():
+    catalog = ColumnarCatalog.from_records([{'id': 1, 'price': None}, {'id': 2, 'price': 9.5}])
+    assert {'name': 'price', 'kind': 'float'} in catalog.fields
+    assert catalog.get(0) == {'id': 1}
+    assert catalog.mask({'min_price': 5}).tolist() == [False, True]
+
+
+PRICED = [{'id': 1, 'price': '19.99'}, {'id': 2, 'price': 'call us'}, {'id': 3, 'price': 5}]
+
+
+def test_prices_coerced_to_float():
+    catalog = ColumnarCatalog.from_records(PRICED)
+    assert {'name': 'price', 'kind': 'float'} in catalog.fields
+    assert catalog.get(0)['price'] == 19.99
+    assert 'price' not in catalog.get(1)
+    assert catalog.mask({'min_price': 10}).tolist() == [True, False, False]
+
+    catalog.append({'id': 4, 'price': '42'})
+    catalog.append({'id': 5, 'price': 'n/a'})
+    assert catalog.get(3)['price'] == 42.0
+    assert catalog.mask({'min_price': 10}).tolist() == [True, False, False, True, False]
+    assert catalog.mask_rows([3, 4], {'max_price': 50}).tolist() == [True, True]
+    assert catalog.price.max() == 42.0
+
+
+def test_text_prices_in_saved_catalog(tmp_path):
+    # Catalogs saved before prices were coerced hold them as text
+    builder = CatalogBuilder(numeric_fields=['weight'])
+    builder.extend(PRICED)
+    builder.build().save(str(tmp_path / "catalog"))
+    catalog = ColumnarCatalog.open(str(tmp_path / "catalog"))
+    assert {'name': 'price', 'kind': 'json'} in catalog.fields
+
+    assert catalog.price.tolist() == [19.99, 0.0, 5.0]
+    assert catalog.mask({'min_price': 10}).tolist() == [True, False, False]
+    assert catalog.mask_rows([0, 2], {'max_price': 10}).tolist() == [False, True]
+
+
+def test_missing_values_listed_under_label():
+    catalog = ColumnarCatalog.from_records([{'id': 1, 'category': 'Bags'}, {'id': 2}])
+    assert catalog.values('category') == ['Bags']
+    assert catalog.values('category', missing='Unknown') == ['Bags', 'Unknown']
+
+    catalog = ColumnarCatalog.from_records([{'id': 1, 'category': 'Bags'}])
+    assert catalog.values('category', missing='Unknown') == ['Bags']
+    catalog.append({'id': 2, 'category': None})
+    assert catalog.values('category', missing='Unknown') == ['Bags', 'Unknown']
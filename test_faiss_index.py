@@ -0,0 +1,140 @@
+"""
+FAISSIndex update tests: upserts and deletes must survive the write-ahead
+log, snapshots, interrupted saves and compaction
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from faiss_index import FAISSIndex
+
+
+DIM = 16
+FILTERS = {'categories': ['B'], 'max_price': 30}
+
+
+def vectors(num, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num, DIM)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def products(ids):
+    return [{'id': i, 'name': f'Product {i}', 'category': 'ABC'[i % 3], 'price': float(i % 50)}
+            for i in ids]
+
+
+@pytest.fixture(params=["Flat", "HNSW", "HNSWSQ8"])
+def saved_index(request, tmp_path):
+    """Built and saved index, plus its base path and query vectors."""
+    index = FAISSIndex(DIM)
+    index.build_index(vectors(300), products(range(300)), request.param, metric="ip")
+    path = str(tmp_path / "products")
+    index.save(path)
+    return index, path, vectors(5, seed=1)
+
+
+def update(index):
+    """Replace, add and delete some products."""
+    index.upsert(products([7, 1000, 1001]), vectors(3, seed=2))
+    index.delete([8, 1001])
+
+
+def snapshot(index, queries):
+    """Everything a client can observe: exact and filtered results per query."""
+    return [(index.search(query, 10, effort='exact').ids,
+             index.search(query, 5, FILTERS, effort='exact').ids) for query in queries]
+
+
+def reloaded(path):
+    index = FAISSIndex(DIM)
+    index.load(path)
+    return index
+
+
+def test_updates_replay_from_log(saved_index):
+    index, path, queries = saved_index
+    update(index)
+    expected = snapshot(index, queries)
+
+    restored = reloaded(path)
+    assert snapshot(restored, queries) == expected
+    assert restored.get_row(1000) is not None
+    assert restored.get_row(8) is None and restored.get_row(1001) is None
+    assert restored.search_similar(1000, 3) is not None
+
+
+def test_save_truncates_log(saved_index):
+    index, path, queries = saved_index
+    update(index)
+    index.save(path)
+    assert os.path.getsize(path + ".wal") == 0
+
+    restored = reloaded(path)
+    assert snapshot(restored, queries) == snapshot(index, queries)
+    assert restored.get_stats()['live_items'] == index.get_stats()['live_items'] == 300
+
+
+def test_interrupted_save_before_commit_keeps_old_snapshot(saved_index, monkeypatch):
+    index, path, queries = saved_index
+    update(index)
+    expected = snapshot(index, queries)
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr("faiss_index.json.dump", crash)
+    with pytest.raises(OSError):
+        index.save(path)
+    monkeypatch.undo()
+
+    # Old snapshot plus its (untruncated) log
+    assert snapshot(reloaded(path), queries) == expected
+
+
+def test_interrupted_save_after_commit_is_completed_on_load(saved_index, monkeypatch):
+    index, path, queries = saved_index
+    update(index)
+    index.compact()  # New row layout, so a mixed snapshot would be visible
+    expected = snapshot(index, queries)
+
+    def crash(base):
+        raise OSError("killed")
+    monkeypatch.setattr(FAISSIndex, "_finish_save", staticmethod(crash))
+    with pytest.raises(OSError):
+        index.save(path)
+    monkeypatch.undo()
+    assert os.path.exists(path + ".commit")
+
+    restored = reloaded(path)
+    assert not os.path.exists(path + ".commit")
+    assert os.path.getsize(path + ".wal") == 0
+    assert snapshot(restored, queries) == expected
+
+
+def test_compact_keeps_ids_and_filtered_results(saved_index):
+    index, path, queries = saved_index
+    update(index)
+    expected = snapshot(index, queries)
+
+    index.compact()
+    assert index.get_stats()['deleted_items'] == 0
+    assert snapshot(index, queries) == expected
+    assert sorted(index.metadata.column('id')) == sorted(set(range(300)) - {8} | {1000})
+
+    index.save(path)
+    assert snapshot(reloaded(path), queries) == expected
+
+
+def test_compact_keeps_category_partitions(tmp_path):
+    index = FAISSIndex(DIM)
+    index.build_index(vectors(300), products(range(300)), "HNSW", metric="ip")
+    index.build_category_indexes(min_size=1)
+    queries = vectors(5, seed=1)
+    update(index)
+    expected = snapshot(index, queries)
+
+    index.compact()
+    assert index.get_stats()['partitions'] == 3
+    assert snapshot(index, queries) == expected
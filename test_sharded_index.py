@@ -0,0 +1,204 @@
+"""
+Sharded index tests without shard server processes: shards are served
+in-process by a stub client, and ShardClient talks to a local listener
+"""
+
+import threading
+import time
+from multiprocessing.connection import Listener
+
+import numpy as np
+import pytest
+
+from catalog_store import ColumnarCatalog
+from faiss_index import FAISSIndex
+from shard_server import ShardServer
+from sharded_index import ShardClient, ShardRouter, ShardedIndex, build_shards, merge_results
+
+
+DIM = 16
+AUTHKEY = b'test-shards'
+CATEGORIES = ['A'] * 5 + ['B'] * 3 + ['C'] * 2 + ['D'] * 2
+
+
+def vectors(num, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((num, DIM)).astype('float32')
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def products(ids, categories=None):
+    return [{'id': i, 'name': f'Product {i}', 'price': float(i % 50),
+             'category': categories[n] if categories else 'ABCD'[i % 4]}
+            for n, i in enumerate(ids)]
+
+
+# ----------------------------------------------------------------------
+# Merging and routing
+# ----------------------------------------------------------------------
+
+def test_merge_results_keeps_global_top_k():
+    shard_results = [
+        [{'id': 1, 'similarity_score': 0.9}, {'id': 2, 'similarity_score': 0.5}],
+        [],
+        [{'id': 3, 'similarity_score': 0.8}, {'id': 4, 'similarity_score': 0.7},
+         {'id': 5, 'similarity_score': 0.1}],
+    ]
+    merged = merge_results(shard_results, 4)
+    assert merged.ids == [1, 3, 4, 2]
+    assert merged.sort_by('similarity_score').ids == [2, 4, 3, 1]
+    assert merge_results(shard_results, 10).ids == [1, 3, 4, 2, 5]
+    assert merge_results([[], []], 3).ids == []
+
+
+def test_plan_balances_categories():
+    router = ShardRouter.plan(CATEGORIES, 2, "category")
+    # Largest first onto the emptiest shard: A | B, C | D
+    assert router.category_map == {'A': 0, 'B': 1, 'C': 1, 'D': 0}
+    sizes = [sum(router.shard_of(key) == shard for key in CATEGORIES) for shard in range(2)]
+    assert sizes == [7, 5]
+
+    with pytest.raises(ValueError):
+        ShardRouter.plan(['A', 'A'], 2, "category")
+
+
+def test_shards_for_filters_prunes_by_category():
+    router = ShardRouter.plan(CATEGORIES, 2, "category")
+    assert router.shards_for_filters({'categories': ['B', 'C']}) == [1]
+    assert router.shards_for_filters({'categories': ['A', 'C']}) == [0, 1]
+    assert router.shards_for_filters({'max_price': 10}) == [0, 1]
+    assert router.shards_for_filters(None) == [0, 1]
+
+    # Hash sharding can't prune
+    router = ShardRouter(2, "id")
+    assert router.shards_for_filters({'categories': ['B']}) == [0, 1]
+
+
+# ----------------------------------------------------------------------
+# ShardedIndex over in-process shards
+# ----------------------------------------------------------------------
+
+class StubClient:
+    """Calls a ShardServer directly instead of over a connection, recording calls."""
+
+    def __init__(self, server: ShardServer):
+        self.server = server
+        self.address = f"stub:{server.shard}"
+        self.calls = []
+
+    def call(self, method: str, *args):
+        self.calls.append((method, args))
+        return getattr(self.server, method)(*args)
+
+    def close(self):
+        pass
+
+
+def sharded(tmp_path, shard_by, num_items=200):
+    catalog = ColumnarCatalog.from_records(products(range(num_items)))
+    build_shards(vectors(num_items), catalog, 2, shard_by, tmp_path, index_type="Flat", metric="ip")
+    clients = [StubClient(ShardServer(str(tmp_path / "layout.json"), shard)) for shard in (1, 0)]
+    return ShardedIndex(clients)
+
+
+def test_search_matches_single_index(tmp_path):
+    index = sharded(tmp_path, "id")
+    single = FAISSIndex(DIM)
+    single.build_index(vectors(200), products(range(200)), "Flat", metric="ip")
+
+    for query in vectors(5, seed=1):
+        assert index.search(query, 10).ids == single.search(query, 10).ids
+        assert (index.search(query, 5, {'categories': ['B']}).ids ==
+                single.search(query, 5, {'categories': ['B']}).ids)
+    assert index.search_similar(3, 5).ids == single.search_similar(3, 5).ids
+    assert index.num_live == 200
+    assert index.metadata.values('category', missing='Unknown') == ['A', 'B', 'C', 'D']
+
+
+def test_category_change_deletes_from_old_shard_only(tmp_path):
+    index = sharded(tmp_path, "category")
+    old_shard = index.router.shard_of('A')
+    new_shard = next(shard for shard in range(2) if shard != old_shard)
+    new_category = next(category for category, shard in index.router.category_map.items()
+                        if shard == new_shard)
+    for client in index.clients:
+        client.calls.clear()
+
+    # Product 0 moves from category A; product 1000 is new
+    index.upsert(products([0, 1000], [new_category, new_category]), vectors(2, seed=2))
+
+    deletes = [[(method, args) for method, args in client.calls if method == 'delete']
+               for client in index.clients]
+    assert deletes[old_shard] == [('delete', ([0],))]
+    assert deletes[new_shard] == []
+    assert index.clients[old_shard].server.contains([0, 1000]) == []
+    assert index.clients[new_shard].server.contains([0, 1000]) == [0, 1000]
+    assert index.num_live == 201
+
+    # The moved product is found under its new category only
+    hits = index.search(vectors(2, seed=2)[0], 3, {'categories': [new_category]})
+    assert hits.ids[0] == 0
+    assert 0 not in index.search(vectors(2, seed=2)[0], 50, {'categories': ['A']}).ids
+
+
+# ----------------------------------------------------------------------
+# ShardClient over a real connection
+# ----------------------------------------------------------------------
+
+def handle(conn):
+    """Echo server; 'slow' replies late and 'hang_up' closes without replying."""
+    with conn:
+        while True:
+            try:
+                method, args = conn.recv()
+                if method == 'hang_up':
+                    return
+                if method == 'slow':
+                    time.sleep(0.5)
+                conn.send(('ok', args))
+            except (EOFError, OSError):
+                return
+
+
+@pytest.fixture
+def address():
+    listener = Listener(('127.0.0.1', 0), authkey=AUTHKEY)
+
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    host, port = listener.address
+    yield f"{host}:{port}"
+    listener.close()
+
+
+def test_client_times_out_then_recovers(address):
+    client = ShardClient(address, AUTHKEY, timeout=0.1)
+    with pytest.raises(ConnectionError):
+        client.call('slow')
+    # The late reply went away with the closed connection
+    assert client.call('echo', 1) == (1,)
+    client.close()
+
+
+def test_client_reconnects_after_dropped_connection(address):
+    client = ShardClient(address, AUTHKEY, max_connections=1)
+    assert client.call('echo', 1) == (1,)
+    with pytest.raises(ConnectionError):
+        client.call('hang_up')  # Reuses the idle connection, which the server drops
+    assert client.call('echo', 2) == (2,)
+    client.close()
+
+
+def test_client_reports_unreachable_server():
+    listener = Listener(('127.0.0.1', 0), authkey=AUTHKEY)
+    host, port = listener.address
+    listener.close()
+    with pytest.raises(ConnectionError):
+        ShardClient(f"{host}:{port}", AUTHKEY).call('echo')
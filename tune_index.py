@@ -0,0 +1,239 @@
+"""
+Index Tuning Tool
+Sweeps IVF/HNSW parameters against an exact baseline and picks the
+best recall/latency/memory trade-off for the catalog
+"""
+
+import contextlib
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import faiss
+import numpy as np
+
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from faiss_index import FAISSIndex
+from index_manager import active_generation
+
+
+# Sweep grids; values that don't fit the catalog size are skipped
+HNSW_M_VALUES = [16, 32, 64]
+EF_SEARCH_VALUES = [16, 32, 64, 128, 256]
+NLIST_FACTORS = [1, 4, 16]  # nlist = factor * sqrt(num_items)
+NPROBE_VALUES = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+def load_queries(queries_path: Optional[Path]) -> Optional[np.ndarray]:
+    """
+    Load held-out query embeddings.
+
+    Args:
+        queries_path: .npy file of embeddings, or a text file with one query
+                      per line (encoded with CLIP)
+
+    Returns:
+        Query embeddings, or None if no query file was given
+    """
+    if queries_path is None:
+        return None
+    if queries_path.suffix == ".npy":
+        return np.load(queries_path).astype('float32')
+
+    from clip_encoder import CLIPEncoder
+
+    queries = [line.strip() for line in queries_path.read_text().splitlines() if line.strip()]
+    print(f"🤖 Encoding {len(queries)} held-out queries...")
+    encoder = CLIPEncoder(model_name="ViT-B/32", cache_size=0)
+    return encoder.encode_texts_batch(queries, use_cache=False)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    """Ground-truth top-k rows from a brute-force Flat index."""
+    baseline = FAISSIndex(corpus.shape[1])
+    with contextlib.redirect_stdout(io.StringIO()):
+        baseline.build_index(corpus, [{}] * len(corpus), "Flat", metric=metric)
+    return baseline.search_ids(queries, k)[1]
+
+
+def measure(index: FAISSIndex, queries: np.ndarray, truth: np.ndarray, k: int,
+            repeats: int = 3) -> dict:
+    """Recall@k against the ground truth, plus throughput (best of repeats) and memory."""
+    index.search_ids(queries[:10], k)  # Warm up
+    elapsed = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        _, ids = index.search_ids(queries, k)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    hits = sum(len(np.intersect1d(found[found != -1], expected)) for found, expected in zip(ids, truth))
+    return {
+        'recall': hits / truth.size,
+        'qps': len(queries) / elapsed if elapsed > 0 else float('inf'),
+        'memory_mb': index.index_bytes() / 1024 / 1024
+    }
+
+
+def pareto_front(results: List[dict]) -> List[dict]:
+    """Configs not beaten on recall, QPS and memory by any other config."""
+    def dominates(a, b):
+        better_or_equal = (a['recall'] >= b['recall'] and a['qps'] >= b['qps']
+                           and a['memory_mb'] <= b['memory_mb'])
+        strictly_better = (a['recall'] > b['recall'] or a['qps'] > b['qps']
+                           or a['memory_mb'] < b['memory_mb'])
+        return better_or_equal and strictly_better
+
+    front = [r for r in results if not any(dominates(other, r) for other in results)]
+    return sorted(front, key=lambda r: (-r['recall'], -r['qps']))
+
+
+def choose_config(front: List[dict], target_recall: float) -> dict:
+    """Fastest Pareto config reaching the target recall (else the most accurate)."""
+    good = [r for r in front if r['recall'] >= target_recall]
+    if good:
+        return max(good, key=lambda r: (r['qps'], -r['memory_mb']))
+    return max(front, key=lambda r: (r['recall'], r['qps']))
+
+
+def sweep(corpus: np.ndarray, queries: np.ndarray, k: int, metric: str,
+          index_types: List[str]) -> List[dict]:
+    """Build every candidate index and measure each search setting."""
+    num_items = len(corpus)
+    truth = exact_neighbours(corpus, queries, k, metric)
+    results = []
+
+    builds = []
+    for index_type in index_types:
+        if index_type.startswith("HNSW"):
+            builds += [(index_type, {'M': M}) for M in HNSW_M_VALUES]
+        elif index_type in ("IVF", "IVFPQ", "OPQ"):
+            nlists = sorted({max(1, min(int(f * np.sqrt(num_items)), num_items // 39))
+                             for f in NLIST_FACTORS})
+            builds += [(index_type, {'nlist': nlist}) for nlist in nlists]
+        else:
+            builds.append((index_type, {}))
+
+    for index_type, build_params in builds:
+        candidate = FAISSIndex(corpus.shape[1])
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            candidate.build_index(corpus, [{}] * num_items, index_type, metric=metric, **build_params)
+        build_seconds = time.perf_counter() - start
+
+        if isinstance(candidate.index, faiss.IndexHNSW):
+            settings = [{'efSearch': ef} for ef in EF_SEARCH_VALUES if ef >= k]
+        elif 'nlist' in build_params:
+            nlist = candidate.get_search_params()['nlist']
+            settings = [{'nprobe': nprobe} for nprobe in NPROBE_VALUES if nprobe <= nlist]
+        else:
+            settings = [{}]
+
+        for search_params in settings:
+            candidate.set_search_params(**search_params)
+            result = {'index_type': index_type, **build_params, **search_params,
+                      'build_seconds': build_seconds}
+            result.update(measure(candidate, queries, truth, k))
+            results.append(result)
+            print(f"  {_describe(result):<40} recall@{k}={result['recall']:.3f}  "
+                  f"qps={result['qps']:,.0f}  mem={result['memory_mb']:.1f}MB")
+
+    return results
+
+
+def _describe(result: dict) -> str:
+    params = ", ".join(f"{key}={result[key]}" for key in ('M', 'nlist', 'efSearch', 'nprobe')
+                       if key in result)
+    return f"{result['index_type']}({params})"
+
+
+def tune_index(index_path: str = "data/index/products", queries_path: Optional[str] = None,
+               num_queries: int = 500, k: int = 10, target_recall: float = 0.95,
+               index_types: Optional[List[str]] = None) -> dict:
+    """
+    Run the sweep and write the chosen config next to the index.
+
+    Args:
+        index_path: Base path of the built index
+        queries_path: Held-out queries (.npy embeddings or .txt); if omitted,
+                      num_queries catalog vectors are held out of the sweep
+        num_queries: Held-out sample size when no query file is given
+        k: Results per query used for recall@k
+        target_recall: Recall the chosen config must reach
+        index_types: Index families to sweep (default: HNSW and IVF)
+
+    Returns:
+        The tuning report that was written
+    """
+    print("\n" + "="*70)
+    print("Tuning Search Index Parameters")
+    print("="*70)
+
+    index = FAISSIndex()
+    # Tuning is written next to the base path, so every new build picks it up
+    index.load(active_generation(index_path)[1] or index_path)
+    corpus = index.live_vectors()
+
+    queries = load_queries(Path(queries_path) if queries_path else None)
+    if queries is None:
+        # Hold a random sample out of the corpus
+        rng = np.random.default_rng(0)
+        num_queries = min(num_queries, len(corpus) // 5)
+        held_out = rng.choice(len(corpus), size=num_queries, replace=False)
+        queries = corpus[held_out]
+        corpus = np.delete(corpus, held_out, axis=0)
+    k = min(k, len(corpus))
+
+    print(f"\n🔄 Sweeping {len(corpus)} vectors with {len(queries)} queries (recall@{k}, metric={index.metric})...")
+    results = sweep(corpus, queries, k, index.metric, index_types or ["HNSW", "IVF"])
+
+    front = pareto_front(results)
+    chosen = choose_config(front, target_recall)
+    report = {
+        'chosen': chosen,
+        'pareto': front,
+        'target_recall': target_recall,
+        'k': k,
+        'num_items': len(corpus),
+        'num_queries': len(queries),
+        'metric': index.metric,
+        'tuned_at': datetime.now().isoformat()
+    }
+
+    tuning_path = Path(index_path + FAISSIndex.TUNING_SUFFIX)
+    with open(tuning_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📈 Pareto-optimal configs:")
+    for result in front:
+        print(f"   {_describe(result):<40} recall={result['recall']:.3f}  qps={result['qps']:,.0f}  "
+              f"mem={result['memory_mb']:.1f}MB")
+    print(f"\n✅ Chosen: {_describe(chosen)} (recall {chosen['recall']:.3f})")
+    print(f"✓ Saved tuning to {tuning_path}")
+    if chosen['index_type'] != index.index_type or any(
+            chosen.get(key) not in (None, index.build_params.get(key)) for key in ('M', 'nlist')):
+        print("  Rebuild with: python build_index.py --tuned")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tune index parameters for recall vs. latency")
+    parser.add_argument('--index', default="data/index/products", help='Base path of the index')
+    parser.add_argument('--queries', help='Held-out queries (.npy embeddings or .txt, one per line)')
+    parser.add_argument('--num-queries', type=int, default=500,
+                        help='Catalog vectors held out as queries when --queries is not given')
+    parser.add_argument('--k', type=int, default=10, help='Results per query for recall@k')
+    parser.add_argument('--target-recall', type=float, default=0.95,
+                        help='Recall the chosen config must reach')
+    parser.add_argument('--index-types', nargs='+', default=["HNSW", "IVF"],
+                        choices=FAISSIndex.INDEX_TYPES, help='Index families to sweep')
+
+    args = parser.parse_args()
+    tune_index(args.index, args.queries, args.num_queries, args.k, args.target_recall, args.index_types)